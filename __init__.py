@@ -8,7 +8,14 @@ bl_info = {
     "version": (1, 0, 2),
 }
 
-from . import script
+# The noise modules are also imported by worker processes, which run without bpy
+try:
+    import bpy
+except ImportError:
+    bpy = None
+
+if bpy is not None:
+    from . import script
 
 def register():
     script.register()
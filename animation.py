@@ -0,0 +1,121 @@
+import os
+from collections import deque
+import numpy as np
+
+from . import fractal
+from . import instrument
+from . import png
+
+# Noise units the time axis advances per frame, at the base frequency
+DEFAULT_SPEED = 0.02
+
+# Frames kept in memory for viewport scrubbing
+DEFAULT_RING_FRAMES = 48
+
+
+def frame_time(frame, speed):
+    return frame * speed
+
+
+def frame_path(folder, prefix, frame):
+    return os.path.join(folder, "{}_cloud_{:04d}.png".format(prefix or "planet", frame))
+
+
+# Fixed capacity store of recent frames. Slots are allocated once as float16, which is
+# plenty for the clipped [0, 1] values shown on the sphere, and a new frame overwrites
+# the oldest one, so memory stays at capacity x frame size however long the sequence.
+class FrameRing:
+    def __init__(self, capacity, shape):
+        self.capacity = capacity
+        self.shape = tuple(shape)
+        self.slots = np.zeros((capacity,) + self.shape, dtype=np.float16)
+        self.frames = [None] * capacity
+        self.next_slot = 0
+
+    def __contains__(self, frame):
+        return frame in self.frames
+
+    def get(self, frame):
+        if frame not in self.frames:
+            return None
+        return self.slots[self.frames.index(frame)]
+
+    def put(self, frame, values):
+        if frame in self.frames:
+            slot = self.frames.index(frame)
+        else:
+            slot = self.next_slot
+            self.next_slot = (slot + 1) % self.capacity
+            self.frames[slot] = frame
+        self.slots[slot] = values
+
+    def clear(self):
+        self.frames = [None] * self.capacity
+        self.next_slot = 0
+
+    @property
+    def nbytes(self):
+        return self.slots.nbytes
+
+
+# Evaluates one frame and writes it, the clipped values are returned for the ring buffer
+def write_frame(path, seed, texture_size, time, octave_params, bit_depth=8):
+    values = fractal.generate_fractal_frame(seed, texture_size, time, *octave_params)
+    values = np.clip(values, 0.0, 1.0)
+    png.write_png(path, values, bit_depth)
+    return values.astype(np.float16)
+
+
+# Stages recorded by the worker are returned with the frame, see instrument.py
+def _run_frame(path, seed, texture_size, time, octave_params, bit_depth, traced=False):
+    instrument.enable(traced)
+    values = write_frame(path, seed, texture_size, time, octave_params, bit_depth)
+    return values, instrument.take_events()
+
+
+def _frame_results(tasks, workers):
+    if workers <= 1:
+        for frame, args in tasks:
+            yield frame, write_frame(*args)
+        return
+    executor = fractal.get_executor(workers)
+    pending = deque()
+    try:
+        for frame, args in tasks:
+            pending.append((frame, executor.submit(_run_frame, *args, instrument.enabled)))
+            if len(pending) > workers:
+                frame, future = pending.popleft()
+                values, events = future.result()
+                instrument.add_events(events)
+                yield frame, values
+        while pending:
+            frame, future = pending.popleft()
+            values, events = future.result()
+            instrument.add_events(events)
+            yield frame, values
+    finally:
+        for _, future in pending:
+            future.cancel()
+
+
+# Generates an animated layer over frames and streams it to an image sequence in folder.
+# Frames are spread over the worker processes, each one evaluating and writing whole
+# frames, and at most workers + 1 frames are in flight so memory does not grow with the
+# sequence length. on_frame(frame, values) is called in frame order and cancelled() is
+# polled between frames to abort with GenerationCancelled.
+def generate_frames(seed, texture_size, frames, speed, octave_params, folder, prefix, workers=1, bit_depth=8, on_frame=None, cancelled=None):
+    frames = list(frames)
+    os.makedirs(folder, exist_ok=True)
+    workers = min(fractal.resolve_workers(workers), len(frames))
+    tasks = ((frame, (frame_path(folder, prefix, frame), seed, texture_size, frame_time(frame, speed), octave_params, bit_depth)) for frame in frames)
+    paths = []
+    with instrument.stage("cloud frames", len(frames) * int(np.prod(fractal.grid_shape(texture_size)))):
+        for done, (frame, values) in enumerate(_frame_results(tasks, workers), 1):
+            paths.append(frame_path(folder, prefix, frame))
+            print("Generating cloud frames ({} workers): {}/{}".format(workers, done, len(frames)), end='\r')
+            if on_frame is not None:
+                on_frame(frame, values)
+            if cancelled is not None and cancelled():
+                raise fractal.GenerationCancelled("cloud frames")
+        print("\n")
+    return paths
@@ -0,0 +1,280 @@
+"""Benchmarks of the generation and export pipeline.
+
+Usage:
+    python -m <package>.benchmark --sizes 128,256,512 --output before.json
+    blender -b --python benchmark.py -- --sizes 128,256,512 --output before.json
+    python -m <package>.benchmark --sizes 128,256,512 --compare before.json
+
+Texture sizes, octave counts and layers are swept, and every stage records its wall time,
+peak RSS and pixels per second. The NumPy stages (noise, normal map, compositing, PNG
+encoding) run anywhere; the bpy stages (image upload, Cycles bakes, DS_ExportMaps) are
+added when running inside Blender.
+"""
+import argparse
+import importlib
+import json
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+import numpy as np
+
+# Allow running this file directly, which is how Blender's --python option loads it.
+# Spawned workers re-run it as __mp_main__ and need the same package import.
+if __name__ in ("__main__", "__mp_main__") and not __package__:
+    package_dir = os.path.dirname(os.path.abspath(__file__))
+    sys.path.insert(0, os.path.dirname(package_dir))
+    __package__ = os.path.basename(package_dir)
+    importlib.import_module(__package__)
+
+from . import cache
+from . import fractal
+from . import instrument
+from . import maps
+from . import planet
+from . import png
+
+try:
+    import bpy
+except ImportError:
+    bpy = None
+
+SIZES = (128, 256, 512, 1024, 2048, 4096, 8192)
+
+OCTAVES = (1, 4, 8)
+
+LAYERS = tuple(layer for layer, _ in planet.LAYERS)
+
+NUMPY_STAGES = ("noise", "octave_reweight", "normal", "composite", "png")
+
+BPY_STAGES = ("noise_to_image", "normal_map_to_image", "bake_normal", "bake_diffuse", "export")
+
+
+def git_commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "HEAD"], cwd=os.path.dirname(os.path.abspath(__file__)),
+                              capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def environment(workers):
+    return {
+        "commit": git_commit(),
+        "date": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "python": platform.python_version(),
+        "numpy": np.__version__,
+        "blender": bpy.app.version_string if bpy is not None else None,
+        "platform": platform.platform(),
+        "cpu_count": os.cpu_count(),
+        "workers": fractal.resolve_workers(workers),
+    }
+
+
+# Best wall time over the repeats. The last run's result is returned so later stages can
+# use it, and the peak RSS covers every run of the stage.
+def measure(results, stage, run, pixels, repeat, layer=None, size=None, octaves=None):
+    instrument.reset_peak_rss()
+    seconds = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        value = run()
+        seconds.append(time.perf_counter() - start)
+    best = min(seconds)
+    results.append({
+        "stage": stage,
+        "layer": layer,
+        "size": size,
+        "octaves": octaves,
+        "seconds": best,
+        "peak_rss": instrument.peak_rss(),
+        "pixels_per_second": pixels / best if best > 0 else None,
+    })
+    print("{:<20} {:<10} {:>5} {:>3} octaves: {:8.3f}s {:12.0f} px/s".format(
+        stage, layer or "-", size, octaves or "-", best, results[-1]["pixels_per_second"] or 0), flush=True)
+    return value
+
+
+def layer_settings(layer, size, octaves):
+    params = dict(planet.DEFAULT_PARAMETERS)
+    prefix = dict(planet.LAYERS)[layer]
+    params[prefix + "_tex_size"] = size
+    params[prefix + "_num_octaves"] = octaves
+    return planet.layer_settings(params, layer)
+
+
+def run_numpy_stages(results, stages, size, layers, octave_counts, workers, repeat, folder):
+    shape = fractal.grid_shape(size)
+    pixels = shape[0] * shape[1]
+    noise = {}
+    for layer in layers:
+        for octaves in octave_counts:
+            settings = layer_settings(layer, size, octaves)
+            if "noise" in stages:
+                noise[layer] = measure(results, "noise", lambda: fractal.generate_fractal_noise(layer, *settings, workers),
+                                       pixels, repeat, layer, size, octaves)
+            if "octave_reweight" in stages:
+                # Octave layers are computed once, only the weighted sum is timed
+                octave_cache = cache.LayerCache(max_bytes=octaves * pixels * 8)
+                fractal.generate_fractal_noise_from_octaves(layer, *settings, octave_cache, workers)
+                reweighted = settings[:5] + (settings[5] * 0.5,) + settings[6:]
+                measure(results, "octave_reweight", lambda: fractal.generate_fractal_noise_from_octaves(layer, *reweighted, octave_cache, workers),
+                        pixels, repeat, layer, size, octaves)
+        if layer not in noise:
+            noise[layer] = fractal.generate_fractal_noise(layer, *layer_settings(layer, size, octave_counts[-1]), workers)
+
+    params = dict(planet.DEFAULT_PARAMETERS)
+    outputs = {}
+    if "normal" in stages and "elevation" in noise:
+        outputs["normal"] = measure(results, "normal", lambda: maps.normal_map(np.clip(noise["elevation"], 0.0, 1.0), params["normal_strength"]),
+                                    pixels, repeat, size=size)
+    if "composite" in stages or "png" in stages:
+        linear = [maps.srgb_to_linear(noise[layer]) if layer in noise else None for layer in LAYERS]
+        def composite():
+            diffuse = maps.composite_diffuse((size, size), *linear, planet.material_parameters(params))
+            diffuse[:, :, :3] = maps.linear_to_srgb(diffuse[:, :, :3])
+            return diffuse
+        if "composite" in stages:
+            outputs["diffuse"] = measure(results, "composite", composite, size * size, repeat, size=size)
+        else:
+            outputs["diffuse"] = composite()
+    if "png" in stages:
+        path = os.path.join(folder, "benchmark_{}.png".format(size))
+        measure(results, "png", lambda: png.write_png(path, outputs["diffuse"][:, :, :3]), size * size, repeat, size=size)
+        os.remove(path)
+    return noise
+
+
+def run_bpy_stages(results, stages, size, noise, repeat, folder):
+    from . import script
+    props = bpy.context.scene.ds_global_properties
+    pixels = size * size
+    images = []
+
+    def upload(layer):
+        image = script.noise_to_image(noise[layer], size)
+        images.append(image)
+        return image
+
+    if "noise_to_image" in stages:
+        for layer in noise:
+            measure(results, "noise_to_image", lambda: upload(layer), pixels, repeat, layer, size)
+    if "normal_map_to_image" in stages and "elevation" in noise:
+        def normal_image():
+            image = script.normal_map_to_image(noise["elevation"], size, props.normal_strength)
+            images.append(image)
+            return image
+        measure(results, "normal_map_to_image", normal_image, pixels, repeat, size=size)
+
+    mat = props.sphere_material = script.generate_final_material()
+    normal_mat = props.sphere_normal_material = script.generate_normal_material()
+    props.e_tex_size = size
+    props.export_folder = folder
+    props.export_prefix = "benchmark"
+    for layer, node_name in (("elevation", "ElevationNode"), ("humidity", "HumidityNode"), ("cloud", "CloudNode")):
+        enabled = layer in noise
+        setattr(props, "enable_" + layer, enabled)
+        if enabled:
+            image = upload(layer)
+            setattr(props, layer + "_map", image)
+            script.set_image_texture(mat, node_name, image)
+    if "elevation" in noise:
+        props.normal_map = script.normal_map_to_image(noise["elevation"], size, props.normal_strength)
+        images.append(props.normal_map)
+        script.set_image_texture(mat, "NormalNode", props.normal_map)
+
+    if "bake_normal" in stages and "elevation" in noise:
+        script.set_image_texture(normal_mat, "ImageNode", props.elevation_map)
+        output_node = normal_mat.node_tree.nodes["NormalOutput"]
+        measure(results, "bake_normal", lambda: images.append(script.bake_mat_to_image("NormalMap", normal_mat, output_node, size, 'NORMAL')),
+                pixels, repeat, size=size)
+    if "bake_diffuse" in stages:
+        nodes = mat.node_tree.nodes
+        links = mat.node_tree.links
+        links.new(nodes["CloudMix"].outputs['Color'], nodes["PlanetOutput"].inputs['Surface'])
+        measure(results, "bake_diffuse", lambda: images.append(script.bake_mat_to_image("DiffuseMap", mat, nodes["DiffuseOutput"], size, 'COMBINED')),
+                pixels, repeat, size=size)
+        links.new(nodes["PlanetBSDF"].outputs['BSDF'], nodes["PlanetOutput"].inputs['Surface'])
+    if "export" in stages and "elevation" in noise:
+        props.diffuse_method = 'COMPOSITE'
+        measure(results, "export", lambda: bpy.ops.object.ds_export_maps(), pixels, repeat, size=size)
+        for kind in planet.MAP_KINDS:
+            path = os.path.join(folder, "benchmark_{}_{}.png".format(kind, size))
+            if os.path.exists(path):
+                os.remove(path)
+        images.append(mat.node_tree.nodes["DiffuseOutput"].image)
+
+    for image in images:
+        if image is not None and image.name in bpy.data.images:
+            bpy.data.images.remove(image)
+    for material in (mat, normal_mat):
+        bpy.data.materials.remove(material)
+
+
+def run(sizes, octave_counts, layers, stages, workers=1, repeat=1):
+    results = []
+    if bpy is not None and not hasattr(bpy.types.Scene, "ds_global_properties"):
+        importlib.import_module(__package__).register()
+    with tempfile.TemporaryDirectory() as folder:
+        for size in sizes:
+            noise = run_numpy_stages(results, stages, size, layers, octave_counts, workers, repeat, folder)
+            if bpy is not None and any(stage in BPY_STAGES for stage in stages):
+                run_bpy_stages(results, stages, size, noise, repeat, folder)
+    fractal.shutdown_pool()
+    return {"environment": environment(workers), "results": results}
+
+
+def case_key(result):
+    return result["stage"], result["layer"], result["size"], result["octaves"]
+
+
+# Speedup of every case found in both runs, above 1 when the current run is faster
+def compare(current, baseline):
+    baseline_seconds = {case_key(result): result["seconds"] for result in baseline["results"]}
+    print("Compared to commit {}".format(baseline["environment"].get("commit")))
+    for result in current["results"]:
+        previous = baseline_seconds.get(case_key(result))
+        if previous:
+            print("{:<20} {:<10} {:>5} {:>3} octaves: {:8.3f}s -> {:8.3f}s ({:.2f}x)".format(
+                result["stage"], result["layer"] or "-", result["size"], result["octaves"] or "-", previous, result["seconds"], previous / result["seconds"]))
+
+
+def parse_list(value, cast=str):
+    return tuple(cast(item) for item in value.split(",") if item)
+
+
+def main(argv=None):
+    if argv is None:
+        argv = sys.argv[sys.argv.index("--") + 1:] if "--" in sys.argv else sys.argv[1:]
+    stages = NUMPY_STAGES + (BPY_STAGES if bpy is not None else ())
+    parser = argparse.ArgumentParser(prog="dust_speck.benchmark", description="Benchmark the Dust Speck generation and export pipeline.")
+    parser.add_argument("--sizes", type=lambda value: parse_list(value, int), default=SIZES, help="Comma separated texture sizes")
+    parser.add_argument("--octaves", type=lambda value: parse_list(value, int), default=OCTAVES, help="Comma separated octave counts")
+    parser.add_argument("--layers", type=parse_list, default=LAYERS, help="Comma separated layers")
+    parser.add_argument("--stages", type=parse_list, default=stages, help="Comma separated stages, among " + ", ".join(stages))
+    parser.add_argument("--workers", type=int, default=1, help="Noise worker processes (0 uses every core)")
+    parser.add_argument("--repeat", type=int, default=1, help="Runs per case, the best time is kept")
+    parser.add_argument("--output", help="JSON file receiving the results")
+    parser.add_argument("--compare", help="JSON results of an earlier run to compare with")
+    args = parser.parse_args(argv)
+
+    for stage in args.stages:
+        if stage not in stages:
+            parser.error("Unknown stage: {}".format(stage))
+    for layer in args.layers:
+        if layer not in LAYERS:
+            parser.error("Unknown layer: {}".format(layer))
+
+    report = run(args.sizes, args.octaves, args.layers, args.stages, args.workers, args.repeat)
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+    if args.compare:
+        with open(args.compare) as f:
+            compare(report, json.load(f))
+
+
+if __name__ == "__main__":
+    main()
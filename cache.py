@@ -0,0 +1,128 @@
+import hashlib
+import os
+import tempfile
+import threading
+from collections import OrderedDict
+import numpy as np
+
+
+DEFAULT_FOLDER = os.path.join(tempfile.gettempdir(), "dust_speck_cache")
+
+
+def cache_key(*params):
+    return hashlib.sha256(repr(params).encode("utf-8")).hexdigest()
+
+
+# Content-addressed store of generated float maps. Entries are .npy files named after
+# the hash of everything that determines their content; the file modification time is
+# refreshed on every hit so eviction drops the least recently used maps first.
+class MapCache:
+    def __init__(self, folder="", max_bytes=2 * 2**30):
+        self.folder = folder or DEFAULT_FOLDER
+        self.max_bytes = max_bytes
+
+    def _path(self, key):
+        return os.path.join(self.folder, key + ".npy")
+
+    def get(self, key):
+        path = self._path(key)
+        try:
+            array = np.load(path)
+        except (OSError, ValueError):
+            return None
+        os.utime(path)
+        return array
+
+    def put(self, key, array):
+        if array.nbytes > self.max_bytes:
+            return
+        os.makedirs(self.folder, exist_ok=True)
+        path = self._path(key)
+        tmp_path = path + ".{}.tmp".format(os.getpid())
+        with open(tmp_path, "wb") as f:
+            np.save(f, array)
+        os.replace(tmp_path, path)
+        self.evict()
+
+    def entries(self):
+        entries = []
+        if not os.path.isdir(self.folder):
+            return entries
+        for entry in os.scandir(self.folder):
+            if entry.name.endswith(".npy"):
+                stat = entry.stat()
+                entries.append((stat.st_mtime, stat.st_size, entry.path))
+        return entries
+
+    def total_bytes(self):
+        return sum(size for _, size, _ in self.entries())
+
+    def evict(self):
+        entries = sorted(self.entries())
+        total = sum(size for _, size, _ in entries)
+        for _, size, path in entries:
+            if total <= self.max_bytes:
+                break
+            try:
+                os.remove(path)
+            except OSError:
+                continue
+            total -= size
+
+    def clear(self):
+        for _, _, path in self.entries():
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+
+
+# In-memory LRU of intermediate arrays (per-octave noise layers), bounded by total bytes.
+# Arrays are stored with the configured dtype, float16 trades precision for a quarter
+# of the memory of float64.
+class LayerCache:
+    def __init__(self, max_bytes=2**30, dtype=np.float64):
+        self.max_bytes = max_bytes
+        self.dtype = np.dtype(dtype)
+        self.layers = OrderedDict()
+        self.nbytes = 0
+        # Layers are read and written by background generation jobs
+        self.lock = threading.RLock()
+
+    def get(self, key):
+        with self.lock:
+            layer = self.layers.get(key)
+            if layer is not None:
+                self.layers.move_to_end(key)
+            return layer
+
+    def put(self, key, array):
+        layer = np.asarray(array, dtype=self.dtype)
+        if layer.nbytes > self.max_bytes:
+            return
+        with self.lock:
+            if key in self.layers:
+                self.nbytes -= self.layers.pop(key).nbytes
+            self.layers[key] = layer
+            self.nbytes += layer.nbytes
+            self.evict()
+
+    def evict(self):
+        with self.lock:
+            while self.nbytes > self.max_bytes and self.layers:
+                _, layer = self.layers.popitem(last=False)
+                self.nbytes -= layer.nbytes
+
+    def configure(self, max_bytes, dtype):
+        dtype = np.dtype(dtype)
+        with self.lock:
+            if dtype != self.dtype:
+                self.clear()
+                self.dtype = dtype
+            self.max_bytes = max_bytes
+            self.evict()
+
+    def clear(self):
+        with self.lock:
+            self.layers.clear()
+            self.nbytes = 0
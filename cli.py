@@ -0,0 +1,160 @@
+"""Batch planet generation.
+
+Usage:
+    blender -b --python cli.py -- manifest.json --output maps/ [--workers N]
+    python -m <package>.cli manifest.csv --output maps/ [--workers N]
+    python -m <package>.cli manifest.json --output maps/ --stream 16384 --format exr
+    python -m <package>.cli manifest.json --output maps/ --pyramid 256 --filter lanczos
+    python -m <package>.cli manifest.json --output presets/ --presets
+    python -m <package>.cli manifest.json --output maps/ --trace trace.json
+    python -m <package>.cli manifest.json --output maps/ --system 42
+
+The manifest is a JSON list of objects or a CSV file with one planet per row, using the
+DS_GlobalProperties names (e_tex_size, h_seed, ...). Planets whose maps and timing file
+already exist are skipped, so an interrupted run can simply be started again.
+With --stream, every map is generated at the given size and written strip by strip, which
+bounds memory by --strip-mb per strip in flight whatever the size. With --pyramid, the
+diffuse, normal and elevation maps are written as tiled mip levels with an index file.
+With --presets, each planet is written to a preset library that the add-on loads without
+generating any noise. With --trace, every pipeline stage of every process is recorded
+to a Chrome trace file (chrome://tracing, Perfetto) that also holds per-stage totals.
+With --system, the manifest is one star system: planets are generated one after the other
+and share a noise basis, only their lowest --fresh-octaves octaves are evaluated per planet.
+"""
+import argparse
+import csv
+import functools
+import importlib
+import json
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from multiprocessing import get_context
+
+# Allow running this file directly, which is how Blender's --python option loads it.
+# Spawned workers re-run it as __mp_main__ and need the same package import.
+if __name__ in ("__main__", "__mp_main__") and not __package__:
+    package_dir = os.path.dirname(os.path.abspath(__file__))
+    sys.path.insert(0, os.path.dirname(package_dir))
+    __package__ = os.path.basename(package_dir)
+    importlib.import_module(__package__)
+
+from . import fractal
+from . import instrument
+from . import noise
+from . import planet
+from . import presets
+from . import pyramid
+from . import stream
+from . import system
+
+
+def read_manifest(path):
+    with open(path, newline="") as f:
+        if path.lower().endswith(".csv"):
+            entries = list(csv.DictReader(f))
+        else:
+            entries = json.load(f)
+    planets = [planet.planet_parameters(entry) for entry in entries]
+    names = [params["name"] for params in planets]
+    if len(set(names)) != len(names):
+        raise ValueError("Planet names must be unique in a manifest")
+    return planets
+
+
+# Planet worker, stages recorded in the worker process are returned with the summary
+def _run_planet(write_planet, params, folder, traced):
+    instrument.enable(traced)
+    summary = write_planet(params, folder)
+    return summary, instrument.take_events()
+
+
+def run(planets, folder, workers=1, force=False, stream_size=0, fmt="png", strip_bytes=stream.DEFAULT_STRIP_BYTES,
+        tile_size=0, method='BOX', finer_levels=0, preset_library=False, trace_path=None, system_seed=None,
+        fresh_octaves=system.DEFAULT_FRESH_OCTAVES):
+    instrument.enable(bool(trace_path))
+    star_system = None
+    if system_seed is not None:
+        star_system = system.StarSystem(system_seed, fresh_octaves, fractal.resolve_workers(workers))
+        write_planet = star_system.write_planet
+        is_complete = planet.is_complete
+    elif preset_library:
+        write_planet = presets.write_planet
+        is_complete = presets.is_complete
+    elif tile_size:
+        write_planet = functools.partial(pyramid.write_planet, tile_size=tile_size, method=method, finer_levels=finer_levels)
+        is_complete = pyramid.is_complete
+    elif stream_size:
+        write_planet = functools.partial(stream.write_planet, size=stream_size, fmt=fmt, strip_bytes=strip_bytes)
+        is_complete = functools.partial(stream.is_complete, size=stream_size, fmt=fmt)
+    else:
+        write_planet = planet.write_planet
+        is_complete = planet.is_complete
+
+    os.makedirs(folder, exist_ok=True)
+    pending = [params for params in planets if force or not is_complete(params, folder)]
+    print("{} planets, {} already complete".format(len(planets), len(planets) - len(pending)))
+
+    start = time.perf_counter()
+    workers = fractal.resolve_workers(workers)
+    if workers <= 1 or len(pending) <= 1 or star_system is not None:
+        # A single planet still uses every worker for its own noise, as do the planets of a system
+        for params in pending:
+            summary = write_planet(params, folder, workers=workers)
+            print("{}: {:.2f}s".format(summary["name"], summary["timings"]["total"]))
+    else:
+        # Planets use the noise backends selected here, workers never run the benchmark
+        with ProcessPoolExecutor(max_workers=min(workers, len(pending)), mp_context=get_context("spawn"),
+                                 initializer=noise.use, initargs=(noise.selection(),)) as executor:
+            futures = [executor.submit(_run_planet, write_planet, params, folder, instrument.enabled) for params in pending]
+            for future in as_completed(futures):
+                summary, events = future.result()
+                instrument.add_events(events)
+                print("{}: {:.2f}s".format(summary["name"], summary["timings"]["total"]))
+    elapsed = time.perf_counter() - start
+
+    summaries = []
+    for params in planets:
+        with open(planet.timing_path(params, folder)) as f:
+            summaries.append(json.load(f))
+    summary = {"elapsed": elapsed, "workers": workers, "planets": summaries}
+    if star_system is not None:
+        summary["system"] = star_system.summary()
+    with open(os.path.join(folder, "summary.json"), "w") as f:
+        json.dump(summary, f, indent=2)
+    print("Generated {} planets in {:.2f}s".format(len(pending), elapsed))
+    if trace_path:
+        instrument.write(trace_path, chrome=True)
+        for entry in instrument.summary():
+            print("{}: {} calls, {:.3f}s, {:.2f} Mpx/s".format(entry["name"], entry["count"], entry["seconds"], entry["pixels_per_second"] / 1e6))
+    return summaries
+
+
+def main(argv=None):
+    if argv is None:
+        argv = sys.argv[sys.argv.index("--") + 1:] if "--" in sys.argv else sys.argv[1:]
+    parser = argparse.ArgumentParser(prog="dust_speck.cli", description="Generate planet maps from a manifest.")
+    parser.add_argument("manifest", help="JSON or CSV planet manifest")
+    parser.add_argument("--output", required=True, help="Folder receiving the maps and timing summaries")
+    parser.add_argument("--workers", type=int, default=0, help="Worker processes (0 uses every core)")
+    parser.add_argument("--force", action="store_true", help="Regenerate planets that are already complete")
+    parser.add_argument("--stream", type=int, default=0, metavar="SIZE", help="Stream every map at this size instead of the manifest texture sizes")
+    parser.add_argument("--format", choices=sorted(stream.FORMATS), default="png", help="Streamed map format: 16-bit PNG, OpenEXR or raw float32 .npy")
+    parser.add_argument("--strip-mb", type=int, default=stream.DEFAULT_STRIP_BYTES // 2**20, help="Memory budget of a streamed strip, in MB")
+    parser.add_argument("--pyramid", type=int, default=0, metavar="TILE_SIZE", help="Write tiled mip levels with this tile size")
+    parser.add_argument("--filter", choices=("box", "lanczos"), default="box", help="Downsampling filter of the pyramid levels")
+    parser.add_argument("--finer-levels", type=int, default=0, help="Pyramid levels above the map size, generated on demand")
+    parser.add_argument("--presets", action="store_true", help="Write the planets to a preset library with float16 map bundles")
+    parser.add_argument("--trace", metavar="FILE", help="Record every pipeline stage to a Chrome trace file")
+    parser.add_argument("--system", type=int, metavar="SEED", help="Generate the planets as one star system sharing a noise basis of this seed")
+    parser.add_argument("--fresh-octaves", type=int, default=system.DEFAULT_FRESH_OCTAVES, help="Octaves evaluated per planet of a star system")
+    args = parser.parse_args(argv)
+    if sum(map(bool, (args.stream, args.pyramid, args.presets, args.system is not None))) > 1:
+        parser.error("--stream, --pyramid, --presets and --system cannot be combined")
+    run(read_manifest(args.manifest), args.output, args.workers, args.force, args.stream, args.format, args.strip_mb * 2**20,
+        args.pyramid, args.filter.upper(), args.finer_levels, args.presets, args.trace, args.system, args.fresh_octaves)
+
+
+if __name__ == "__main__":
+    main()
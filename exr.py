@@ -0,0 +1,97 @@
+import os
+import struct
+import zlib
+import numpy as np
+
+
+PIXEL_TYPES = {'HALF': (1, "<f2"), 'FLOAT': (2, "<f4")}
+
+COMPRESSIONS = {'NONE': 0, 'ZIPS': 2}
+
+
+def _attribute(name, kind, value):
+    return name.encode() + b"\0" + kind.encode() + b"\0" + struct.pack("<i", len(value)) + value
+
+
+# Lossless ZIPS scanline compression: bytes are split in two halves (even and odd offsets),
+# delta encoded, then deflated. Blocks that do not shrink are stored uncompressed.
+def _zips(raw):
+    data = np.frombuffer(raw, dtype=np.uint8)
+    half = (data.size + 1) // 2
+    reordered = np.empty_like(data)
+    reordered[:half] = data[0::2]
+    reordered[half:] = data[1::2]
+    predicted = reordered.copy()
+    predicted[1:] = (reordered[1:].astype(np.int16) - reordered[:-1] + 128).astype(np.uint8)
+    compressed = zlib.compress(predicted.tobytes(), 6)
+    return compressed if len(compressed) < len(raw) else raw
+
+
+# Single-part scanline OpenEXR encoder without OpenEXR bindings. Rows are given top-down in
+# strips, one scanline per block, and the line offset table is filled in by close().
+# channels are the names of the last axis of the written pixels, like ("R", "G", "B").
+class EXRWriter:
+    def __init__(self, path, width, height, channels, pixel_type='HALF', compression='ZIPS'):
+        self.path = path
+        self.tmp_path = path + ".tmp"
+        self.width = width
+        self.height = height
+        self.channels = tuple(channels)
+        # The file stores channels sorted by name
+        self.order = sorted(range(len(self.channels)), key=lambda index: self.channels[index])
+        self.type_code, self.dtype = PIXEL_TYPES[pixel_type]
+        self.compression = compression
+        self.offsets = []
+
+        chlist = b"".join(self.channels[index].encode() + b"\0" + struct.pack("<iB3xii", self.type_code, 0, 1, 1) for index in self.order) + b"\0"
+        window = struct.pack("<iiii", 0, 0, width - 1, height - 1)
+        header = b"".join((
+            struct.pack("<ii", 20000630, 2),
+            _attribute("channels", "chlist", chlist),
+            _attribute("compression", "compression", struct.pack("<B", COMPRESSIONS[compression])),
+            _attribute("dataWindow", "box2i", window),
+            _attribute("displayWindow", "box2i", window),
+            _attribute("lineOrder", "lineOrder", struct.pack("<B", 0)),
+            _attribute("pixelAspectRatio", "float", struct.pack("<f", 1.0)),
+            _attribute("screenWindowCenter", "v2f", struct.pack("<ff", 0.0, 0.0)),
+            _attribute("screenWindowWidth", "float", struct.pack("<f", 1.0)),
+            b"\0",
+        ))
+        self.file = open(self.tmp_path, "wb")
+        self.file.write(header)
+        self.table_offset = self.file.tell()
+        self.file.write(b"\0" * (8 * height))
+
+    def write_rows(self, pixels):
+        pixels = np.asarray(pixels)
+        if pixels.ndim == 2:
+            pixels = pixels[:, :, None]
+        # Scanlines hold each channel's row in turn
+        planar = np.ascontiguousarray(pixels[:, :, self.order].transpose(0, 2, 1), dtype=self.dtype)
+        for row in planar:
+            raw = row.tobytes()
+            data = _zips(raw) if self.compression == 'ZIPS' else raw
+            self.offsets.append(self.file.tell())
+            self.file.write(struct.pack("<ii", len(self.offsets) - 1, len(data)))
+            self.file.write(data)
+
+    def close(self):
+        if len(self.offsets) != self.height:
+            raise ValueError("{} rows written to a {} rows EXR".format(len(self.offsets), self.height))
+        self.file.seek(self.table_offset)
+        self.file.write(np.asarray(self.offsets, dtype="<u8").tobytes())
+        self.file.close()
+        os.replace(self.tmp_path, self.path)
+
+    def abort(self):
+        self.file.close()
+        os.remove(self.tmp_path)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if exc_type is None:
+            self.close()
+        else:
+            self.abort()
@@ -0,0 +1,472 @@
+import math
+import os
+import numpy as np
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from multiprocessing import get_context, shared_memory
+
+from . import cache
+from . import instrument
+from . import noise
+
+# Number of sphere samples evaluated per batch. Keeps the temporaries of the
+# simplex kernel in the tens of MB whatever the texture size.
+CHUNK_POINTS = 1 << 18
+
+# Below this many noise evaluations the cost of starting workers outweighs the gain
+PARALLEL_MIN_EVALUATIONS = 1 << 21
+
+# Bump whenever a change alters generated values, so cached maps are invalidated
+NOISE_VERSION = 1
+
+_executor = None
+_executor_workers = 0
+_executor_backends = None
+
+
+def sphere_grid(texture_size):
+    phi_range = np.arange(-math.pi/2, math.pi/2, math.pi/texture_size)
+    theta_range = np.arange(0, 2*math.pi, 2*math.pi/texture_size)
+
+    # The grid is separable: x = cos(phi)cos(theta), y = cos(phi)sin(theta), z = sin(phi)
+    # math.cos/math.sin are used so the values match the former per-pixel loop exactly
+    cos_phi = np.array([math.cos(phi) for phi in phi_range])
+    sin_phi = np.array([math.sin(phi) for phi in phi_range])
+    cos_theta = np.array([math.cos(theta) for theta in theta_range])
+    sin_theta = np.array([math.sin(theta) for theta in theta_range])
+    return cos_phi, sin_phi, cos_theta, sin_theta
+
+
+def fractal_noise(x, y, z, seed, num_octaves, frequency, amplitude, lacunarity, persistence):
+    backend = noise.backend(3)
+    state = backend.seed(seed)
+    noise_val = np.zeros(x.shape)
+    for octave in range(0, num_octaves):
+        with instrument.stage("octave {}".format(octave), x.size):
+            noise_val += amplitude * backend.noise3(frequency * x, frequency * y, frequency * z, state)
+        frequency *= lacunarity
+        amplitude *= persistence
+    return noise_val
+
+
+# Time is scaled with the frequency like the sphere point, so finer octaves also change faster
+def fractal_noise4(x, y, z, time, seed, num_octaves, frequency, amplitude, lacunarity, persistence):
+    backend = noise.backend(4)
+    state = backend.seed(seed)
+    noise_val = np.zeros(x.shape)
+    for octave in range(0, num_octaves):
+        with instrument.stage("octave {}".format(octave), x.size):
+            noise_val += amplitude * backend.noise4(frequency * x, frequency * y, frequency * z, frequency * time, state)
+        frequency *= lacunarity
+        amplitude *= persistence
+    return noise_val
+
+
+def map_key(seed, texture_size, num_octaves, frequency, amplitude, lacunarity, persistence):
+    return cache.cache_key("fractal", NOISE_VERSION, seed, texture_size, num_octaves, frequency, amplitude, lacunarity, persistence)
+
+
+def grid_shape(texture_size):
+    rows = np.arange(-math.pi/2, math.pi/2, math.pi/texture_size).size
+    cols = np.arange(0, 2*math.pi, 2*math.pi/texture_size).size
+    return rows, cols
+
+
+def resolve_workers(workers):
+    if workers <= 0:
+        return os.cpu_count() or 1
+    return workers
+
+
+# Workers use the noise backends selected in this process, the pool is restarted when they change
+def get_executor(workers):
+    global _executor, _executor_workers, _executor_backends
+    backends = noise.selection()
+    if _executor is None or _executor_workers != workers or _executor_backends != backends:
+        shutdown_pool()
+        # Blender must not be forked, workers are spawned fresh interpreters
+        _executor = ProcessPoolExecutor(max_workers=workers, mp_context=get_context("spawn"), initializer=noise.use, initargs=(backends,))
+        _executor_workers = workers
+        _executor_backends = backends
+    return _executor
+
+
+def shutdown_pool():
+    global _executor, _executor_workers, _executor_backends
+    if _executor is not None:
+        _executor.shutdown(wait=False, cancel_futures=True)
+        _executor = None
+        _executor_workers = 0
+        _executor_backends = None
+
+
+def _band_coordinates(texture_size, start, stop, grid=None):
+    with instrument.stage("coordinates", (stop - start) * texture_size):
+        cos_phi, sin_phi, cos_theta, sin_theta = grid or sphere_grid(texture_size)
+        x = cos_phi[start:stop, None] * cos_theta[None, :]
+        y = cos_phi[start:stop, None] * sin_theta[None, :]
+        z = np.broadcast_to(sin_phi[start:stop, None], x.shape)
+    return x, y, z
+
+
+def _fill_band(noise_texture, seed, texture_size, start, stop, octave_params):
+    x, y, z = _band_coordinates(texture_size, start, stop)
+    noise_texture[start:stop] = fractal_noise(x, y, z, seed, *octave_params)
+
+
+def _fill_octave_layers_band(layers, seed, texture_size, start, stop, frequencies):
+    backend = noise.backend(3)
+    state = backend.seed(seed)
+    x, y, z = _band_coordinates(texture_size, start, stop)
+    for layer, frequency in zip(layers, frequencies):
+        with instrument.stage("octave layer", x.size):
+            layer[start:stop] = backend.noise3(frequency * x, frequency * y, frequency * z, state)
+
+
+# Stages recorded by the worker are returned with the band, see instrument.py
+def _run_band(fill, shm_name, shape, dtype, arg, texture_size, start, stop, params, traced=False):
+    instrument.enable(traced)
+    shm = shared_memory.SharedMemory(name=shm_name)
+    try:
+        output = np.ndarray(shape, dtype=dtype, buffer=shm.buf)
+        fill(output, arg, texture_size, start, stop, params)
+        del output
+    finally:
+        shm.close()
+    return start, stop, instrument.take_events()
+
+
+# Rows [start, stop) of generate_fractal_noise, evaluated in bands of CHUNK_POINTS samples so
+# the memory used does not depend on the texture size. columns optionally selects the
+# column indices to evaluate, for instance the longitude range of a tile.
+def generate_fractal_rows(seed, texture_size, start, stop, num_octaves, frequency, amplitude, lacunarity, persistence, dtype=np.float32, columns=None):
+    grid = sphere_grid(texture_size)
+    if columns is not None:
+        grid = grid[:2] + (grid[2][columns], grid[3][columns])
+    output = np.empty((stop - start, grid[2].size), dtype=dtype)
+    band_rows = max(1, CHUNK_POINTS // grid[2].size)
+    for band_start in range(start, stop, band_rows):
+        band_stop = min(band_start + band_rows, stop)
+        x, y, z = _band_coordinates(texture_size, band_start, band_stop, grid)
+        output[band_start - start:band_stop - start] = fractal_noise(x, y, z, seed, num_octaves, frequency, amplitude, lacunarity, persistence)
+    return output
+
+
+# Map of an animated layer at a point in time, the sphere point and time feed 4D noise so
+# consecutive frames drift continuously instead of being reseeded
+def generate_fractal_frame(seed, texture_size, time, num_octaves, frequency, amplitude, lacunarity, persistence, dtype=np.float32):
+    grid = sphere_grid(texture_size)
+    rows, cols = grid_shape(texture_size)
+    output = np.empty((rows, cols), dtype=dtype)
+    band_rows = max(1, CHUNK_POINTS // cols)
+    for start in range(0, rows, band_rows):
+        stop = min(start + band_rows, rows)
+        x, y, z = _band_coordinates(texture_size, start, stop, grid)
+        output[start:stop] = fractal_noise4(x, y, z, time, seed, num_octaves, frequency, amplitude, lacunarity, persistence)
+    return output
+
+
+class GenerationCancelled(Exception):
+    pass
+
+
+# The map is split into latitude bands whose size does not depend on the worker count,
+# and every sample only depends on its own coordinates, so the output is identical
+# whether it is computed inline or by any number of processes.
+# on_band(start, stop, output) is called as soon as a band is written, and cancelled()
+# is polled between bands to abort with GenerationCancelled. fill(output, arg, texture_size,
+# start, stop, params) writes a band, arg is passed through untouched: the seed of a single
+# layer, or the coordinates function of fused layers.
+def _evaluate_bands(name, fill, shape, dtype, arg, texture_size, params, evaluations, workers, on_band=None, cancelled=None):
+    with instrument.stage("noise", int(np.prod(shape))):
+        rows, cols = shape[-2:]
+        band_rows = max(1, CHUNK_POINTS // cols)
+        bands = [(start, min(start + band_rows, rows)) for start in range(0, rows, band_rows)]
+        workers = min(resolve_workers(workers), len(bands))
+
+        if workers <= 1 or rows * cols * evaluations < PARALLEL_MIN_EVALUATIONS:
+            output = np.empty(shape, dtype=dtype)
+            for start, stop in bands:
+                if cancelled is not None and cancelled():
+                    raise GenerationCancelled(name)
+                print("Generating fractal map ({}): {:.2%}".format(name, float(start)/rows), end='\r')
+                fill(output, arg, texture_size, start, stop, params)
+                if on_band is not None:
+                    on_band(start, stop, output)
+            print("\n")
+            return output
+
+        shm = shared_memory.SharedMemory(create=True, size=int(np.prod(shape)) * np.dtype(dtype).itemsize)
+        futures = []
+        try:
+            shared_output = np.ndarray(shape, dtype=dtype, buffer=shm.buf)
+            executor = get_executor(workers)
+            futures = [executor.submit(_run_band, fill, shm.name, shape, dtype, arg, texture_size, start, stop, params, instrument.enabled) for start, stop in bands]
+            done_rows = 0
+            for future in as_completed(futures):
+                start, stop, events = future.result()
+                instrument.add_events(events)
+                done_rows += stop - start
+                print("Generating fractal map ({}, {} workers): {:.2%}".format(name, workers, float(done_rows)/rows), end='\r')
+                if on_band is not None:
+                    on_band(start, stop, shared_output)
+                if cancelled is not None and cancelled():
+                    raise GenerationCancelled(name)
+            print("\n")
+            output = shared_output.copy()
+            del shared_output
+        finally:
+            for future in futures:
+                future.cancel()
+            shm.close()
+            shm.unlink()
+        return output
+
+
+def generate_fractal_noise(name, seed, texture_size, num_octaves, frequency, amplitude, lacunarity, persistence, workers=1, dtype=np.float32, on_band=None, cancelled=None):
+    octave_params = (num_octaves, frequency, amplitude, lacunarity, persistence)
+    def band_done(start, stop, output):
+        on_band(start, stop, output[start:stop])
+    return _evaluate_bands(name, _fill_band, grid_shape(texture_size), dtype, seed, texture_size, octave_params, num_octaves,
+                           workers, band_done if on_band else None, cancelled)
+
+
+# Faces of a cube map, in the OpenGL order and orientation, in a Y-up frame (Blender's Z axis
+# becomes Y, -Y becomes Z, as in glTF). Each face is (name, major axis, major sign, s axis,
+# s sign, t axis, t sign): a direction d lies on the face whose major axis has the largest
+# |d|, at sc = s_sign * d[s_axis] / |d[major]| and tc = t_sign * d[t_axis] / |d[major]|.
+CUBE_FACES = (
+    ("px", 0, 1, 2, -1, 1, -1),
+    ("nx", 0, -1, 2, 1, 1, -1),
+    ("py", 1, 1, 0, 1, 2, 1),
+    ("ny", 1, -1, 0, 1, 2, -1),
+    ("pz", 2, 1, 0, 1, 1, -1),
+    ("nz", 2, -1, 0, -1, 1, -1),
+)
+
+
+# A face of size N covers 90 degrees with N texels, the equirectangular map covers 360 degrees
+# of longitude with texture_size texels: N = texture_size / 4 keeps the equator density while
+# evaluating 6 * N^2 = 0.375 * texture_size^2 samples instead of texture_size^2.
+def cube_face_size(texture_size):
+    return max(1, texture_size // 4)
+
+
+def cube_shape(face_size):
+    # Faces are stacked vertically and carry a one texel apron, so bilinear lookups and
+    # gradients never need to cross to a neighbouring face
+    padded = face_size + 2
+    return len(CUBE_FACES) * padded, padded
+
+
+def _cube_band_coordinates(face_size, start, stop):
+    with instrument.stage("coordinates", (stop - start) * (face_size + 2)):
+        return _cube_directions(face_size, start, stop)
+
+
+def _cube_directions(face_size, start, stop):
+    padded = face_size + 2
+    rows = np.arange(start, stop)
+    # Rows are stored bottom first like Blender images, t grows downwards like OpenGL
+    tc = 2.0 * (face_size + 0.5 - rows % padded) / face_size - 1.0
+    sc = 2.0 * (np.arange(padded) - 0.5) / face_size - 1.0
+    direction = np.empty((stop - start, padded, 3))
+    faces = rows // padded
+    for face in np.unique(faces):
+        _, major, major_sign, s_axis, s_sign, t_axis, t_sign = CUBE_FACES[face]
+        band = faces == face
+        direction[band, :, major] = major_sign
+        direction[band, :, s_axis] = s_sign * sc[None, :]
+        direction[band, :, t_axis] = t_sign * tc[band, None]
+    direction /= np.sqrt(np.sum(direction * direction, axis=-1))[..., None]
+    # Back to the Z-up frame of the equirectangular maps
+    return direction[..., 0], -direction[..., 2], direction[..., 1]
+
+
+def _fill_cube_band(noise_texture, seed, face_size, start, stop, octave_params):
+    x, y, z = _cube_band_coordinates(face_size, start, stop)
+    noise_texture[start:stop] = fractal_noise(x, y, z, seed, *octave_params)
+
+
+def cube_key(seed, face_size, num_octaves, frequency, amplitude, lacunarity, persistence):
+    return cache.cache_key("cube", NOISE_VERSION, seed, face_size, num_octaves, frequency, amplitude, lacunarity, persistence)
+
+
+# Fractal noise sampled on the six faces of a cube, returned as (6, face_size + 2, face_size + 2)
+# including the apron. on_band receives bands of the stacked faces.
+def generate_cube_noise(name, seed, face_size, num_octaves, frequency, amplitude, lacunarity, persistence, workers=1, dtype=np.float32, on_band=None, cancelled=None):
+    octave_params = (num_octaves, frequency, amplitude, lacunarity, persistence)
+    def band_done(start, stop, output):
+        on_band(start, stop, output[start:stop])
+    shape = cube_shape(face_size)
+    cube = _evaluate_bands(name, _fill_cube_band, shape, dtype, seed, face_size, octave_params, num_octaves,
+                           workers, band_done if on_band else None, cancelled)
+    return cube.reshape(len(CUBE_FACES), shape[1], shape[1])
+
+
+# Octaves of a list of layers in evaluation order, grouped by frequency. Each step takes the
+# next octave of every layer whose next frequency is the same, so layers with matching
+# frequencies share the simplex lattice geometry while each layer still accumulates its own
+# octaves in order, exactly like fractal_noise.
+def _octave_groups(layer_params):
+    pending = []
+    for layer, (seed, num_octaves, frequency, amplitude, lacunarity, persistence) in enumerate(layer_params):
+        octaves = []
+        for octave in range(0, num_octaves):
+            octaves.append((frequency, layer, seed, amplitude))
+            frequency *= lacunarity
+            amplitude *= persistence
+        pending.append(octaves)
+    while any(pending):
+        frequency = next(octaves[0][0] for octaves in pending if octaves)
+        yield frequency, [octaves.pop(0)[1:] for octaves in pending if octaves and octaves[0][0] == frequency]
+
+
+def _fill_layers_band(noise_textures, coordinates, texture_size, start, stop, layer_params):
+    x, y, z = coordinates(texture_size, start, stop)
+    noise_vals = np.zeros((len(layer_params),) + x.shape)
+    for group, (frequency, octaves) in enumerate(_octave_groups(layer_params)):
+        with instrument.stage("octave group {}".format(group), x.size * len(octaves)):
+            values = noise.backend(3).noise3_seeds(frequency * x, frequency * y, frequency * z, [seed for _, seed, _ in octaves])
+        for (layer, _, amplitude), value in zip(octaves, values):
+            noise_vals[layer] += amplitude * value
+    noise_textures[:, start:stop] = noise_vals
+
+
+# Fused evaluation of several layers sampled on the same grid: the coordinates of a band are
+# computed once and every layer's octaves are evaluated on them, octaves of equal frequency
+# together, so a whole planet costs a single traversal and a single dispatch to the workers.
+# layer_params holds (seed, num_octaves, frequency, amplitude, lacunarity, persistence) per
+# layer. The result is stacked as (layers, rows, cols) and identical to generating each
+# layer with generate_fractal_noise.
+def generate_fractal_layers(name, texture_size, layer_params, workers=1, dtype=np.float32, on_band=None, cancelled=None):
+    def band_done(start, stop, output):
+        on_band(start, stop, output[:, start:stop])
+    shape = (len(layer_params),) + grid_shape(texture_size)
+    evaluations = sum(params[1] for params in layer_params)
+    return _evaluate_bands(name, _fill_layers_band, shape, dtype, _band_coordinates, texture_size, tuple(layer_params), evaluations,
+                           workers, band_done if on_band else None, cancelled)
+
+
+# Cube map counterpart of generate_fractal_layers, returned as (layers, 6, face_size + 2, face_size + 2)
+def generate_cube_layers(name, face_size, layer_params, workers=1, dtype=np.float32, on_band=None, cancelled=None):
+    def band_done(start, stop, output):
+        on_band(start, stop, output[:, start:stop])
+    shape = cube_shape(face_size)
+    evaluations = sum(params[1] for params in layer_params)
+    layers = _evaluate_bands(name, _fill_layers_band, (len(layer_params),) + shape, dtype, _cube_band_coordinates, face_size, tuple(layer_params), evaluations,
+                             workers, band_done if on_band else None, cancelled)
+    return layers.reshape(len(layer_params), len(CUBE_FACES), shape[1], shape[1])
+
+
+def cube_faces(cube):
+    return cube[:, 1:-1, 1:-1]
+
+
+# Bilinear resampling of a cube map to the equirectangular grid of generate_fractal_noise
+def cube_to_equirect(cube, texture_size):
+    faces, padded, _ = cube.shape
+    face_size = padded - 2
+    flat = cube.reshape(-1)
+    cos_phi, sin_phi, cos_theta, sin_theta = sphere_grid(texture_size)
+    rows, cols = cos_phi.size, cos_theta.size
+    output = np.empty((rows, cols), dtype=cube.dtype)
+    band_rows = max(1, CHUNK_POINTS // cols)
+    for start in range(0, rows, band_rows):
+        stop = min(start + band_rows, rows)
+        x = cos_phi[start:stop, None] * cos_theta[None, :]
+        direction = np.stack((x, np.broadcast_to(sin_phi[start:stop, None], x.shape), -cos_phi[start:stop, None] * sin_theta[None, :]))
+        major = np.argmax(np.abs(direction), axis=0)
+        offset = np.empty(x.shape, dtype=np.int64)
+        row = np.empty(x.shape)
+        col = np.empty(x.shape)
+        for face, (_, axis, major_sign, s_axis, s_sign, t_axis, t_sign) in enumerate(CUBE_FACES):
+            mask = (major == axis) & (np.sign(direction[axis]) == major_sign)
+            length = np.abs(direction[axis][mask])
+            offset[mask] = face * padded * padded
+            col[mask] = (s_sign * direction[s_axis][mask] / length + 1.0) * face_size / 2 + 0.5
+            row[mask] = face_size + 0.5 - (t_sign * direction[t_axis][mask] / length + 1.0) * face_size / 2
+        row0 = np.clip(np.floor(row).astype(np.int64), 0, padded - 2)
+        col0 = np.clip(np.floor(col).astype(np.int64), 0, padded - 2)
+        row_fac = row - row0
+        col_fac = col - col0
+        index = offset + row0 * padded + col0
+        bottom = flat[index] * (1.0 - col_fac) + flat[index + 1] * col_fac
+        top = flat[index + padded] * (1.0 - col_fac) + flat[index + padded + 1] * col_fac
+        output[start:stop] = bottom * (1.0 - row_fac) + top * row_fac
+    return output
+
+
+# Raw noise of a seed at each frequency, (frequencies, rows, cols)
+def generate_octave_layers(name, seed, texture_size, frequencies, workers=1, dtype=np.float32):
+    frequencies = list(frequencies)
+    return _evaluate_bands(name, _fill_octave_layers_band, (len(frequencies),) + grid_shape(texture_size), dtype, seed, texture_size, frequencies,
+                           len(frequencies), workers)
+
+
+# Equirectangular map of a sphere field turned by a 3x3 rotation matrix: each sample reads the
+# field bilinearly at its rotated direction. Grid rows and columns sit exactly on the sample
+# latitudes and longitudes, so the identity rotation gives the map back.
+def rotate_equirect(values, texture_size, rotation):
+    cos_phi, sin_phi, cos_theta, sin_theta = grid = sphere_grid(texture_size)
+    rows, cols = cos_phi.size, cos_theta.size
+    flat = values.reshape(-1)
+    output = np.empty((rows, cols), dtype=values.dtype)
+    band_rows = max(1, CHUNK_POINTS // cols)
+    for start in range(0, rows, band_rows):
+        stop = min(start + band_rows, rows)
+        with instrument.stage("rotate", (stop - start) * cols):
+            x, y, z = _band_coordinates(texture_size, start, stop, grid)
+            rx = rotation[0, 0] * x + rotation[0, 1] * y + rotation[0, 2] * z
+            ry = rotation[1, 0] * x + rotation[1, 1] * y + rotation[1, 2] * z
+            rz = rotation[2, 0] * x + rotation[2, 1] * y + rotation[2, 2] * z
+            row = np.clip((np.arcsin(np.clip(rz, -1.0, 1.0)) + math.pi / 2) * texture_size / math.pi, 0.0, rows - 1)
+            col = np.arctan2(ry, rx) % (2 * math.pi) * texture_size / (2 * math.pi)
+            row0 = np.minimum(np.floor(row).astype(np.int64), max(rows - 2, 0))
+            col0 = np.floor(col).astype(np.int64)
+            row_fac = row - row0
+            col_fac = col - col0
+            col0 %= cols
+            col1 = (col0 + 1) % cols
+            bottom = flat[row0 * cols + col0] * (1.0 - col_fac) + flat[row0 * cols + col1] * col_fac
+            top = flat[(row0 + 1) * cols + col0] * (1.0 - col_fac) + flat[(row0 + 1) * cols + col1] * col_fac
+            output[start:stop] = bottom * (1.0 - row_fac) + top * row_fac
+    return output
+
+
+def octave_key(seed, texture_size, frequency):
+    return ("octave", NOISE_VERSION, seed, texture_size, frequency)
+
+
+# Raw noise layers only depend on the seed, the size and the octave frequency, so they are
+# kept in octave_cache and the map is rebuilt as a weighted sum. Changing the amplitude, the
+# persistence or the number of octaves then only evaluates octaves that were never computed.
+# With float64 layers the result is identical to generate_fractal_noise.
+def generate_fractal_noise_from_octaves(name, seed, texture_size, num_octaves, frequency, amplitude, lacunarity, persistence, octave_cache, workers=1, on_band=None, cancelled=None):
+    shape = grid_shape(texture_size)
+    octaves = []
+    for octave in range(0, num_octaves):
+        octaves.append((frequency, amplitude, octave_cache.get(octave_key(seed, texture_size, frequency))))
+        frequency *= lacunarity
+        amplitude *= persistence
+    missing = [frequency for frequency, _, layer in octaves if layer is None]
+
+    noise_val = np.zeros(shape)
+    def sum_band(start, stop, new_layers):
+        new_index = 0
+        for frequency, amplitude, layer in octaves:
+            if layer is None:
+                layer = new_layers[new_index]
+                new_index += 1
+            noise_val[start:stop] += amplitude * np.asarray(layer[start:stop], dtype=np.float64)
+        if on_band is not None:
+            on_band(start, stop, noise_val[start:stop].astype(np.float32))
+
+    if missing:
+        new_layers = _evaluate_bands(name, _fill_octave_layers_band, (len(missing),) + shape, np.float64, seed, texture_size, missing, len(missing),
+                                     workers, sum_band, cancelled)
+        for frequency, layer in zip(missing, new_layers):
+            octave_cache.put(octave_key(seed, texture_size, frequency), np.array(layer))
+        del new_layers
+    else:
+        sum_band(0, shape[0], None)
+    return noise_val.astype(np.float32)
@@ -0,0 +1,147 @@
+import json
+import os
+import sys
+import threading
+import time
+from contextlib import contextmanager
+
+try:
+    import resource
+except ImportError:
+    resource = None
+
+try:
+    import psutil
+except ImportError:
+    psutil = None
+
+# Stage instrumentation of the generation pipeline. While enabled, every stage records a
+# Chrome trace "complete" event with its duration, the pixels it processed and the change of
+# the process resident memory. Events recorded by worker processes are sent back with their
+# band results and merged, so traces cover the whole pool.
+enabled = False
+
+_events = []
+_lock = threading.Lock()
+
+
+def enable(value=True):
+    global enabled
+    enabled = value
+
+
+# Resident memory of the process in bytes, from /proc on Linux or psutil when it is installed.
+# Elsewhere the peak from resource stands in, it still follows growth. None when no source is
+# available, so memory deltas are left out rather than reported as 0.
+def current_rss():
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, AttributeError):
+        pass
+    if psutil is not None:
+        return psutil.Process().memory_info().rss
+    return peak_rss()
+
+
+# Linux can reset the peak RSS of a process, elsewhere the value is the peak since startup
+def reset_peak_rss():
+    try:
+        with open("/proc/self/clear_refs", "w") as f:
+            f.write("5")
+    except OSError:
+        pass
+
+
+def peak_rss():
+    try:
+        with open("/proc/self/status") as f:
+            for line in f:
+                if line.startswith("VmHWM:"):
+                    return int(line.split()[1]) * 1024
+    except OSError:
+        pass
+    if resource is not None:
+        usage = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return usage if sys.platform == "darwin" else usage * 1024
+    if psutil is not None:
+        # Windows reports the peak working set
+        return getattr(psutil.Process().memory_info(), "peak_wset", None)
+    return None
+
+
+@contextmanager
+def stage(name, pixels=0):
+    if not enabled:
+        yield
+        return
+    rss = current_rss()
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        end = time.perf_counter()
+        end_rss = current_rss()
+        event = {
+            "name": name,
+            "ph": "X",
+            # perf_counter is a system-wide monotonic clock, timestamps of workers line up
+            "ts": start * 1e6,
+            "dur": (end - start) * 1e6,
+            "pid": os.getpid(),
+            "tid": threading.get_ident(),
+            "args": {"pixels": pixels, "memory_delta": end_rss - rss if rss is not None and end_rss is not None else None},
+        }
+        with _lock:
+            _events.append(event)
+
+
+def events():
+    with _lock:
+        return list(_events)
+
+
+def take_events():
+    global _events
+    with _lock:
+        taken = _events
+        _events = []
+    return taken
+
+
+def add_events(new_events):
+    with _lock:
+        _events.extend(new_events)
+
+
+def reset():
+    take_events()
+
+
+# Totals per stage name, sorted by total time. Stages nest, the time of a stage includes the
+# stages recorded inside it. memory_delta is None when no event of the stage measured memory.
+def summary():
+    stages = {}
+    for event in events():
+        entry = stages.setdefault(event["name"], {"name": event["name"], "count": 0, "seconds": 0.0, "pixels": 0, "memory_delta": None})
+        entry["count"] += 1
+        entry["seconds"] += event["dur"] / 1e6
+        entry["pixels"] += event["args"]["pixels"]
+        if event["args"]["memory_delta"] is not None:
+            entry["memory_delta"] = (entry["memory_delta"] or 0) + event["args"]["memory_delta"]
+    for entry in stages.values():
+        entry["pixels_per_second"] = entry["pixels"] / entry["seconds"] if entry["seconds"] > 0 else 0.0
+    return sorted(stages.values(), key=lambda entry: entry["seconds"], reverse=True)
+
+
+# Writes the stage summary as JSON, or a Chrome trace (chrome://tracing, Perfetto) that also
+# holds the summary under "stages"
+def write(path, chrome=False):
+    data = {"stages": summary()}
+    if chrome:
+        data["traceEvents"] = events()
+        data["displayTimeUnit"] = "ms"
+    with open(path + ".tmp", "w") as f:
+        json.dump(data, f, indent=None if chrome else 2)
+    os.replace(path + ".tmp", path)
+    return path
@@ -0,0 +1,131 @@
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
+
+
+# Runs a map generator on a background thread. The generator receives on_band and
+# cancelled callbacks; finished bands are queued so the main thread can refine the
+# displayed image while the rest of the map is still being computed.
+class MapJob:
+    def __init__(self, name, rows):
+        self.name = name
+        self.rows = rows
+        self.done_rows = 0
+        self.result = None
+        self.error = None
+        self.started = time.perf_counter()
+        self._pending = []
+        self._lock = threading.Lock()
+        self._cancel = threading.Event()
+        self._thread = None
+
+    def start(self, generate, *args, **kwargs):
+        def run():
+            try:
+                self.result = generate(*args, on_band=self._on_band, cancelled=self._cancel.is_set, **kwargs)
+            except Exception as e:
+                self.error = e
+        self.started = time.perf_counter()
+        self._thread = threading.Thread(target=run, name="Dust Speck {}".format(self.name), daemon=True)
+        self._thread.start()
+        return self
+
+    def _on_band(self, start, stop, values):
+        values = np.array(values, dtype=np.float32)
+        with self._lock:
+            self._pending.append((start, stop, values))
+            self.done_rows += stop - start
+
+    def take_bands(self):
+        with self._lock:
+            bands = self._pending
+            self._pending = []
+        return bands
+
+    def cancel(self):
+        self._cancel.set()
+
+    @property
+    def cancelled(self):
+        return self._cancel.is_set()
+
+    @property
+    def done(self):
+        return self._thread is not None and not self._thread.is_alive()
+
+    @property
+    def progress(self):
+        return min(1.0, float(self.done_rows) / self.rows) if self.rows else 1.0
+
+    @property
+    def eta(self):
+        progress = self.progress
+        if progress <= 0.0:
+            return None
+        elapsed = time.perf_counter() - self.started
+        return elapsed * (1.0 - progress) / progress
+
+
+# Encodes and writes maps on a thread pool. Snapshots are taken by the caller on the main
+# thread, each task then produces its pixels and writes one file. PNG and EXR encoding spend
+# most of their time in zlib and numpy, which release the GIL, so the maps are compressed
+# concurrently while Blender stays responsive.
+class ExportJob:
+    def __init__(self, name, workers):
+        self.name = name
+        self.paths = []
+        self.errors = []
+        self.started = time.perf_counter()
+        self.finished = None
+        self.reported = False
+        self.total = 0
+        self.completed = 0
+        self._closed = False
+        self._lock = threading.Lock()
+        self._executor = ThreadPoolExecutor(max_workers=max(1, workers), thread_name_prefix="Dust Speck {}".format(name))
+
+    def submit(self, write, *args, **kwargs):
+        def run():
+            try:
+                path = write(*args, **kwargs)
+            except Exception as e:
+                path = None
+                with self._lock:
+                    self.errors.append(e)
+            with self._lock:
+                if path is not None:
+                    self.paths.append(path)
+                self.completed += 1
+                self._check_finished()
+        with self._lock:
+            self.total += 1
+        self._executor.submit(run)
+
+    def _check_finished(self):
+        if self._closed and self.completed == self.total and self.finished is None:
+            self.finished = time.perf_counter()
+
+    # No more tasks, threads exit once the submitted ones are written
+    def close(self):
+        with self._lock:
+            self._closed = True
+            self._check_finished()
+        self._executor.shutdown(wait=False)
+
+    def wait(self):
+        self._executor.shutdown(wait=True)
+
+    @property
+    def done(self):
+        with self._lock:
+            return self.finished is not None
+
+    @property
+    def progress(self):
+        with self._lock:
+            return float(self.completed) / self.total if self.total else 1.0
+
+    @property
+    def elapsed(self):
+        return (self.finished or time.perf_counter()) - self.started
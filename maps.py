@@ -0,0 +1,200 @@
+import math
+import numpy as np
+
+from . import instrument
+
+
+# Tangent-space normal map of an equirectangular elevation map, rows going from the south
+# to the north pole and columns covering the full longitude range. Slopes are taken per unit
+# of arc length on a sphere of radius 1: longitude differences are divided by cos(phi) and
+# wrap around the seam, latitude differences are one-sided at the poles.
+def normal_map(elevation, strength=1.0):
+    rows = np.shape(elevation)[0]
+    with instrument.stage("normal_map", np.size(elevation)):
+        return normal_map_rows(elevation, 0, rows, rows, strength)
+
+
+# Rows [start, stop) of the normal map of a map with the given number of rows, computed from
+# its elevation rows [max(start - 1, 0), min(stop + 1, rows)) so that bands of a very large
+# map can be processed independently. The result is identical to slicing normal_map.
+# For a range of columns, elevation carries one extra column on each side and cols is the
+# width of the whole map.
+def normal_map_rows(elevation, start, stop, rows, strength=1.0, cols=None):
+    elevation = np.asarray(elevation, dtype=np.float32)
+    first = max(start - 1, 0)
+    d_phi = math.pi/rows
+    phi = -math.pi/2 + np.arange(start, stop) * d_phi
+    cos_phi = np.maximum(np.cos(phi), math.sin(d_phi/2)).astype(np.float32)
+
+    if cols is None:
+        cols = elevation.shape[1]
+        band = elevation[start - first:stop - first]
+        right = np.roll(band, -1, axis=1)
+        left = np.roll(band, 1, axis=1)
+    else:
+        right = elevation[start - first:stop - first, 2:]
+        left = elevation[start - first:stop - first, :-2]
+        elevation = elevation[:, 1:-1]
+    d_theta = 2*math.pi/cols
+
+    pixels = np.empty((stop - start, elevation.shape[1], 4), dtype=np.float32)
+    east = pixels[:, :, 0]
+    north = pixels[:, :, 1]
+    up = pixels[:, :, 2]
+    east[:] = right
+    east -= left
+    east *= (-strength / (2*d_theta)) / cos_phi[:, None]
+    north[:] = np.gradient(elevation, d_phi, axis=0)[start - first:stop - first]
+    north *= -strength
+    up[:] = 1.0
+    return _encode_normals(pixels)
+
+
+# Normalizes the east, north, up slopes stored in the RGB channels and maps them to [0, 1]
+def _encode_normals(pixels):
+    east, north, up = (pixels[..., channel] for channel in range(3))
+    length = np.sqrt(east*east + north*north + up*up)
+    pixels[..., :3] /= length[..., None]
+    pixels[..., :3] *= 0.5
+    pixels[..., :3] += 0.5
+    pixels[..., 3] = 1.0
+    return pixels
+
+
+# Tangent-space normal maps of the faces of a cube map with its one texel apron, as returned
+# by fractal.generate_cube_noise. Tangents follow the face columns and rows, and the
+# gnomonic stretch away from the face centers is ignored.
+def cube_normal_map(cube, strength=1.0):
+    cube = np.asarray(cube, dtype=np.float32)
+    faces, padded, _ = cube.shape
+    face_size = padded - 2
+    spacing = 2.0 / face_size
+
+    pixels = np.empty((faces, face_size, face_size, 4), dtype=np.float32)
+    pixels[..., 0] = cube[:, 1:-1, 2:] - cube[:, 1:-1, :-2]
+    pixels[..., 0] *= -strength / (2*spacing)
+    pixels[..., 1] = cube[:, 2:, 1:-1] - cube[:, :-2, 1:-1]
+    pixels[..., 1] *= -strength / (2*spacing)
+    pixels[..., 2] = 1.0
+    return _encode_normals(pixels)
+
+
+# Lobes of the Lanczos filter used to downsample maps
+LANCZOS_RADIUS = 3
+
+
+def _downsample_axis(values, axis, method, wrap):
+    size = values.shape[axis]
+    if method == 'BOX':
+        taps = np.array([0, 1])
+        weights = np.array([0.5, 0.5])
+    else:
+        # Input texel 2i + tap lies (tap - 0.5) texels from the center of output texel i
+        taps = np.arange(1 - 2*LANCZOS_RADIUS, 1 + 2*LANCZOS_RADIUS)
+        distance = (taps - 0.5) / 2
+        weights = np.sinc(distance) * np.sinc(distance / LANCZOS_RADIUS)
+        weights /= weights.sum()
+    base = 2 * np.arange((size + 1) // 2)
+    result = None
+    for tap, weight in zip(taps, weights):
+        index = base + tap
+        index = index % size if wrap else np.clip(index, 0, size - 1)
+        term = np.float32(weight) * np.take(values, index, axis=axis)
+        result = term if result is None else result + term
+    return result
+
+
+# Equirectangular map at half resolution, 'BOX' averages 2x2 texels and 'LANCZOS' applies a
+# Lanczos-3 filter. Columns wrap around the seam, rows are clamped at the poles, odd sizes
+# are rounded up.
+def downsample(values, method='BOX'):
+    values = np.asarray(values, dtype=np.float32)
+    return _downsample_axis(_downsample_axis(values, 0, method, False), 1, method, True)
+
+
+# Normal maps are filtered as vectors and renormalized
+def downsample_normals(pixels, method='BOX'):
+    vectors = downsample(np.asarray(pixels, dtype=np.float32)[..., :3] * 2.0 - 1.0, method)
+    result = np.empty(vectors.shape[:2] + (4,), dtype=np.float32)
+    result[..., :3] = vectors
+    return _encode_normals(result)
+
+
+# sRGB colors are filtered in linear space
+def downsample_srgb(pixels, method='BOX'):
+    return linear_to_srgb(downsample(srgb_to_linear(pixels), method))
+
+
+# Rows processed at once by the compositor, bounds its temporaries for very large maps
+COMPOSITE_ROWS = 256
+
+
+def srgb_to_linear(values):
+    values = np.clip(values, 0.0, 1.0)
+    return np.where(values <= 0.04045, values / 12.92, ((values + 0.055) / 1.055) ** 2.4).astype(np.float32)
+
+
+def linear_to_srgb(values):
+    values = np.clip(values, 0.0, 1.0)
+    return np.where(values <= 0.0031308, values * 12.92, 1.055 * values ** (1 / 2.4) - 0.055).astype(np.float32)
+
+
+# Same evaluation as Blender's color ramp node: positions must be sorted, values outside
+# the ramp take the end colors, EASE applies a smoothstep between two elements.
+def evaluate_color_ramp(values, ramp):
+    positions = np.asarray(ramp["positions"], dtype=np.float32)
+    colors = np.asarray(ramp["colors"], dtype=np.float32)
+    upper = np.searchsorted(positions, values, side='right')
+    lower = np.maximum(upper - 1, 0)
+    inside = (upper > 0) & (upper < len(positions))
+    upper = np.minimum(upper, len(positions) - 1)
+
+    if ramp["interpolation"] == 'CONSTANT':
+        return colors[lower]
+
+    span = positions[upper] - positions[lower]
+    fac = np.where(inside & (span > 0), (values - positions[lower]) / np.where(span > 0, span, 1.0), 0.0).astype(np.float32)
+    if ramp["interpolation"] == 'EASE':
+        mfac = fac * fac
+        fac = 3.0 * mfac - 2.0 * mfac * fac
+    fac = fac[..., None]
+    return (1.0 - fac) * colors[lower] + fac * colors[upper]
+
+
+def resample(values, shape):
+    if values.shape == tuple(shape):
+        return values
+    rows = np.arange(shape[0]) * values.shape[0] // shape[0]
+    cols = np.arange(shape[1]) * values.shape[1] // shape[1]
+    return values[rows[:, None], cols[None, :]]
+
+
+# Evaluates the SphereMaterial color graph on linear layer values:
+#   land = mix(elevation_ramp(E), humidity_ramp((E > sea_level) * H), mix_factor)
+#   color = mix(land, cloud_ramp(C).rgb, cloud_ramp(C).alpha)
+# A missing layer reads as 0, like an image texture node without an image.
+def composite_diffuse(shape, elevation, humidity, cloud, params):
+    with instrument.stage("composite_diffuse", shape[0] * shape[1]):
+        return _composite_diffuse(shape, elevation, humidity, cloud, params)
+
+
+def _composite_diffuse(shape, elevation, humidity, cloud, params):
+    rows, cols = shape
+    layers = [np.zeros((1, 1), dtype=np.float32) if layer is None else layer for layer in (elevation, humidity, cloud)]
+    layers = [resample(layer, shape) if layer.shape != (1, 1) else np.broadcast_to(layer, shape) for layer in layers]
+
+    pixels = np.empty((rows, cols, 4), dtype=np.float32)
+    for start in range(0, rows, COMPOSITE_ROWS):
+        stop = min(start + COMPOSITE_ROWS, rows)
+        e, h, c = (layer[start:stop] for layer in layers)
+
+        land = evaluate_color_ramp(e, params["elevation_ramp"])[..., :3]
+        wet = (e > params["sea_level"]).astype(np.float32) * h
+        mix_factor = params["mix_factor"]
+        land = (1.0 - mix_factor) * land + mix_factor * evaluate_color_ramp(wet, params["humidity_ramp"])[..., :3]
+
+        clouds = evaluate_color_ramp(c, params["cloud_ramp"])
+        alpha = clouds[..., 3:4]
+        pixels[start:stop, :, :3] = (1.0 - alpha) * land + alpha * clouds[..., :3]
+    pixels[:, :, 3] = 1.0
+    return pixels
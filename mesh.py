@@ -0,0 +1,136 @@
+import math
+import os
+import numpy as np
+
+# Triangle budgets of the exported LOD chain, from the finest level down
+DEFAULT_LOD_TRIANGLES = (1000000, 250000, 60000, 15000)
+
+OBJ_CHUNK = 1 << 16
+
+
+# Unit quad sphere: each cube face is split in subdivisions x subdivisions quads whose
+# vertices are spread with the equal-angle (tangent) mapping, so cells stay within about
+# 40% of each other in area instead of collapsing into triangle fans at the poles.
+# Vertices on the cube edges are shared. Returns float64 (vertices, 3) and int (quads, 4).
+def quad_sphere(subdivisions):
+    n = subdivisions
+    t, s = np.meshgrid(np.arange(n + 1), np.arange(n + 1), indexing="ij")
+    keys = []
+    for axis in range(3):
+        others = [other for other in range(3) if other != axis]
+        for side in (0, n):
+            lattice = [None] * 3
+            lattice[axis] = np.full(s.shape, side)
+            lattice[others[0]] = s
+            lattice[others[1]] = t
+            keys.append((lattice[0] * (n + 1) + lattice[1]) * (n + 1) + lattice[2])
+    keys = np.stack(keys)
+    unique, inverse = np.unique(keys, return_inverse=True)
+    index = inverse.reshape(keys.shape)
+
+    lattice = np.stack((unique // (n + 1)**2, unique // (n + 1) % (n + 1), unique % (n + 1)), axis=1)
+    vertices = np.tan((lattice * (2.0 / n) - 1.0) * (math.pi / 4))
+    vertices /= np.linalg.norm(vertices, axis=1)[:, None]
+
+    quads = np.stack((index[:, :-1, :-1], index[:, :-1, 1:], index[:, 1:, 1:], index[:, 1:, :-1]), axis=-1).reshape(-1, 4)
+    # Half of the faces see their lattice axes from the inside, turn their quads outwards
+    corners = vertices[quads]
+    normals = np.cross(corners[:, 2] - corners[:, 0], corners[:, 3] - corners[:, 1])
+    inward = np.einsum("ij,ij->i", normals, corners.sum(axis=1)) < 0
+    quads[inward] = quads[inward][:, ::-1]
+    return vertices, quads
+
+
+# Quads per face side of the finest quad sphere within a triangle budget, two triangles per quad
+def lod_subdivisions(triangles):
+    return max(1, int(math.sqrt(triangles / 12)))
+
+
+def triangle_count(quads):
+    return 2 * len(quads)
+
+
+# Equirectangular texture coordinates of every quad corner, (quads, 4, 2). Quads crossing the
+# u = 0 seam are continued past u = 1 and pole corners, whose longitude is undefined, take
+# the mean longitude of the other corners.
+def sphere_uvs(vertices, quads):
+    x, y, z = vertices.T
+    u = np.where(np.hypot(x, y) > 1e-12, np.arctan2(y, x) / (2 * math.pi) % 1.0, np.nan)
+    v = np.arcsin(np.clip(z, -1.0, 1.0)) / math.pi + 0.5
+
+    loop_u = u[quads]
+    with np.errstate(invalid="ignore"):
+        seam = np.nanmax(loop_u, axis=1) - np.nanmin(loop_u, axis=1) > 0.5
+    loop_u[seam] = np.where(loop_u[seam] < 0.5, loop_u[seam] + 1.0, loop_u[seam])
+    pole = np.isnan(loop_u)
+    if pole.any():
+        loop_u[pole] = np.broadcast_to(np.nanmean(loop_u, axis=1)[:, None], loop_u.shape)[pole]
+    return np.stack((loop_u, v[quads]), axis=-1)
+
+
+# Bilinear lookup of an equirectangular map in Blender row order at texture coordinates
+# (u, v), the way an image texture node samples it. Columns wrap, rows are clamped.
+def sample_equirect(values, u, v):
+    rows, cols = values.shape
+    col = u * cols - 0.5
+    row = np.clip(v * rows - 0.5, 0.0, rows - 1)
+    col0 = np.floor(col).astype(np.int64)
+    row0 = np.minimum(np.floor(row).astype(np.int64), rows - 2) if rows > 1 else np.zeros(row.shape, dtype=np.int64)
+    col_fac = col - col0
+    row_fac = row - row0
+    col0 %= cols
+    col1 = (col0 + 1) % cols
+    row1 = np.minimum(row0 + 1, rows - 1)
+    bottom = values[row0, col0] * (1.0 - col_fac) + values[row0, col1] * col_fac
+    top = values[row1, col0] * (1.0 - col_fac) + values[row1, col1] * col_fac
+    return bottom * (1.0 - row_fac) + top * row_fac
+
+
+# Moves unit sphere vertices outwards by scale times the elevation seen at their position
+def displace(vertices, elevation, scale):
+    if elevation is None or scale == 0.0:
+        return vertices
+    x, y, z = vertices.T
+    u = np.arctan2(y, x) / (2 * math.pi) % 1.0
+    v = np.arcsin(np.clip(z, -1.0, 1.0)) / math.pi + 0.5
+    return vertices * (1.0 + scale * sample_equirect(elevation, u, v))[:, None]
+
+
+# Quad sphere of a subdivision level with texture coordinates, displaced by the elevation map
+def sphere_mesh(subdivisions, elevation=None, displacement=0.0):
+    vertices, quads = quad_sphere(subdivisions)
+    uvs = sphere_uvs(vertices, quads)
+    return displace(vertices, elevation, displacement), quads, uvs
+
+
+# Writes a mesh as Wavefront OBJ, every quad corner gets its own texture coordinate so seam
+# and pole corners keep theirs. Lines are formatted in chunks to bound memory.
+def write_obj(path, vertices, quads, uvs, material=None):
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "w") as f:
+        f.write("o {}\n".format(os.path.splitext(os.path.basename(path))[0]))
+        for start in range(0, len(vertices), OBJ_CHUNK):
+            chunk = vertices[start:start + OBJ_CHUNK]
+            f.write(("v {:.6f} {:.6f} {:.6f}\n" * len(chunk)).format(*chunk.ravel()))
+        loop_uvs = uvs.reshape(-1, 2)
+        for start in range(0, len(loop_uvs), OBJ_CHUNK):
+            chunk = loop_uvs[start:start + OBJ_CHUNK]
+            f.write(("vt {:.6f} {:.6f}\n" * len(chunk)).format(*chunk.ravel()))
+        if material:
+            f.write("usemtl {}\n".format(material))
+        for start in range(0, len(quads), OBJ_CHUNK):
+            chunk = quads[start:start + OBJ_CHUNK] + 1
+            loops = np.arange(start * 4, start * 4 + chunk.size).reshape(-1, 4) + 1
+            f.write(("f {}/{} {}/{} {}/{} {}/{}\n" * len(chunk)).format(*np.stack((chunk, loops), axis=-1).ravel()))
+    os.replace(tmp_path, path)
+
+
+# Writes the LOD chain of a planet as <prefix>_lod<level>.obj files, level 0 being the finest
+def write_lods(folder, prefix, elevation=None, displacement=0.0, budgets=DEFAULT_LOD_TRIANGLES):
+    lods = []
+    for level, budget in enumerate(budgets):
+        vertices, quads, uvs = sphere_mesh(lod_subdivisions(budget), elevation, displacement)
+        path = os.path.join(folder, "{}_lod{}.obj".format(prefix, level))
+        write_obj(path, vertices, quads, uvs)
+        lods.append({"level": level, "path": path, "triangles": triangle_count(quads), "vertices": len(vertices)})
+    return lods
@@ -0,0 +1,248 @@
+import importlib.util
+import json
+import os
+import platform
+import time
+import numpy as np
+
+from . import cache
+from . import simplex
+
+# Points evaluated per backend by the benchmark, enough for the array kernels to reach
+# their steady rate while keeping the scalar backends well under a second
+BENCHMARK_POINTS = 1 << 11
+BENCHMARK_REPEATS = 3
+
+# Largest difference to the reference output accepted from a backend. The backends reproduce
+# the same arithmetic, anything beyond rounding means a different noise.
+TOLERANCE = 1e-9
+
+# Bump whenever a backend changes, so stored benchmark results are measured again
+BENCHMARK_VERSION = 1
+
+BENCHMARK_FILE = os.path.join(cache.DEFAULT_FOLDER, "noise_backends.json")
+
+AUTO = "AUTO"
+REFERENCE = "NUMPY"
+
+_preference = AUTO
+_selected = {}
+_loaded = set()
+_results = None
+
+
+# A source of 3D (and optionally 4D) simplex noise. seed() turns a seed into whatever state
+# the backend evaluates with, noise3 and noise4 take coordinate arrays of any shape.
+# Modules listed in requires are only looked up to list the backend, load() imports them
+# when generation starts so registering the add-on stays fast.
+class NoiseBackend:
+    name = ""
+    label = ""
+    requires = ()
+    dimensions = (3,)
+
+    def available(self):
+        return all(importlib.util.find_spec(module) is not None for module in self.requires)
+
+    def load(self):
+        pass
+
+    def seed(self, seed):
+        return simplex.init_permutation(seed)
+
+    def noise3(self, x, y, z, state):
+        raise NotImplementedError
+
+    def noise4(self, x, y, z, w, state):
+        raise NotImplementedError
+
+    # Several seeds on the same points, stacked along a leading seed axis
+    def noise3_seeds(self, x, y, z, seeds):
+        return np.stack([self.noise3(x, y, z, self.seed(seed)) for seed in seeds])
+
+
+# The array port of simplex.py, the reference every other backend is checked against
+class NumpyBackend(NoiseBackend):
+    name = "NUMPY"
+    label = "NumPy arrays"
+    dimensions = (3, 4)
+
+    def noise3(self, x, y, z, state):
+        return simplex.noise3(x, y, z, *state)
+
+    def noise4(self, x, y, z, w, state):
+        return simplex.noise4(x, y, z, w, state[0])
+
+    def noise3_seeds(self, x, y, z, seeds):
+        return simplex.noise3(x, y, z, *simplex.init_permutations(seeds))
+
+
+# opensimplex called point by point. Its 4D noise uses another lattice than the animated
+# layers, only the 3D noise is offered.
+class OpenSimplexBackend(NoiseBackend):
+    name = "OPENSIMPLEX"
+    label = "OpenSimplex scalar"
+    requires = ("opensimplex",)
+
+    def load(self):
+        import opensimplex
+        self.module = opensimplex
+
+    def seed(self, seed):
+        return self.module.OpenSimplex(seed)
+
+    def noise3(self, x, y, z, state):
+        x, y, z = np.broadcast_arrays(x, y, z)
+        values = np.fromiter(map(state.noise3, x.ravel().tolist(), y.ravel().tolist(), z.ravel().tolist()), dtype=np.float64, count=x.size)
+        return values.reshape(x.shape)
+
+
+# opensimplex's JIT compiled kernel looped over the points by numba. The public array API of
+# opensimplex only evaluates axis aligned grids, which sphere samples are not.
+class NumbaBackend(NoiseBackend):
+    name = "NUMBA"
+    label = "OpenSimplex numba arrays"
+    requires = ("opensimplex", "numba")
+
+    def load(self):
+        from numba import njit
+        from opensimplex.internals import _noise3
+
+        @njit
+        def points3(x, y, z, perm, perm_grad_index3):
+            values = np.empty(x.size)
+            for i in range(x.size):
+                values[i] = _noise3(x[i], y[i], z[i], perm, perm_grad_index3)
+            return values
+        self.points3 = points3
+
+    def noise3(self, x, y, z, state):
+        x, y, z = np.broadcast_arrays(x, y, z)
+        flat = (np.ascontiguousarray(a, dtype=np.float64).ravel() for a in (x, y, z))
+        return self.points3(*flat, *state).reshape(x.shape)
+
+
+BACKENDS = {}
+
+
+def register_backend(backend):
+    BACKENDS[backend.name] = backend
+    return backend
+
+
+register_backend(NumpyBackend())
+register_backend(OpenSimplexBackend())
+register_backend(NumbaBackend())
+
+
+def _load(backend):
+    if backend.name not in _loaded:
+        backend.load()
+        _loaded.add(backend.name)
+    return backend
+
+
+def _evaluate(backend, dimensions, points):
+    state = backend.seed(0)
+    if dimensions == 3:
+        return backend.noise3(*points, state)
+    return backend.noise4(*points, state)
+
+
+# Times every available backend on the same random points and compares it with the
+# reference. Returns {dimensions: {name: {"seconds_per_point", "error", "matches"}}}.
+# Backends that fail to import are left out.
+def benchmark(points=BENCHMARK_POINTS, repeats=BENCHMARK_REPEATS):
+    rng = np.random.default_rng(0)
+    results = {}
+    for dimensions in (3, 4):
+        samples = tuple(rng.uniform(-8.0, 8.0, points) for _ in range(dimensions))
+        reference = _evaluate(_load(BACKENDS[REFERENCE]), dimensions, samples)
+        results[dimensions] = {}
+        for name, backend in BACKENDS.items():
+            if dimensions not in backend.dimensions or not backend.available():
+                continue
+            try:
+                _load(backend)
+                # The first call also pays for any JIT compilation and is not timed
+                error = float(np.max(np.abs(_evaluate(backend, dimensions, samples) - reference)))
+            except ImportError:
+                continue
+            best = float("inf")
+            for _ in range(repeats):
+                start = time.perf_counter()
+                _evaluate(backend, dimensions, samples)
+                best = min(best, time.perf_counter() - start)
+            results[dimensions][name] = {"seconds_per_point": best / points, "error": error, "matches": error <= TOLERANCE}
+    return results
+
+
+def _benchmark_key():
+    names = [name for name, backend in BACKENDS.items() if backend.available()]
+    return cache.cache_key("noise backends", BENCHMARK_VERSION, platform.machine(), platform.processor(), platform.python_version(), np.__version__, names)
+
+
+# Benchmark results of this machine, measured on first use and kept in BENCHMARK_FILE
+def benchmark_results():
+    global _results
+    if _results is not None:
+        return _results
+    key = _benchmark_key()
+    try:
+        with open(BENCHMARK_FILE) as f:
+            stored = json.load(f)
+        if stored["key"] == key:
+            _results = {int(dimensions): backends for dimensions, backends in stored["results"].items()}
+            return _results
+    except (OSError, ValueError, KeyError):
+        pass
+    _results = benchmark()
+    os.makedirs(os.path.dirname(BENCHMARK_FILE), exist_ok=True)
+    tmp_path = BENCHMARK_FILE + ".{}.tmp".format(os.getpid())
+    with open(tmp_path, "w") as f:
+        json.dump({"key": key, "results": _results}, f, indent=2)
+    os.replace(tmp_path, BENCHMARK_FILE)
+    return _results
+
+
+# Fastest backend matching the reference, or the preferred one when it does
+def _choose(dimensions, results):
+    candidates = {name: result for name, result in results.get(dimensions, {}).items() if result["matches"]}
+    if _preference in candidates:
+        return _preference
+    if not candidates:
+        return REFERENCE
+    return min(candidates, key=lambda name: candidates[name]["seconds_per_point"])
+
+
+def set_preference(name):
+    global _preference
+    if name != _preference:
+        _preference = name
+        _selected.clear()
+
+
+# Backend name per dimension count, as a tuple that can be handed to worker processes
+def selection():
+    if not _selected:
+        results = benchmark_results()
+        for dimensions in (3, 4):
+            _selected[dimensions] = _choose(dimensions, results)
+    return tuple(sorted(_selected.items()))
+
+
+# Pins the backends chosen by the parent process, workers never run the benchmark
+def use(chosen):
+    _selected.clear()
+    _selected.update(chosen)
+
+
+def backend(dimensions=3):
+    return _load(BACKENDS[dict(selection())[dimensions]])
+
+
+# Selected backends for display, without running the benchmark
+def describe():
+    if not _selected:
+        return "chosen when generation starts"
+    return ", ".join("{}D: {}".format(dimensions, BACKENDS[name].label) for dimensions, name in selection())
@@ -0,0 +1,181 @@
+import json
+import os
+import time
+import numpy as np
+
+from . import fractal
+from . import maps
+from . import png
+
+LAYERS = (("elevation", "e"), ("humidity", "h"), ("cloud", "c"))
+
+MAP_KINDS = ("diffuse", "normal", "elevation", "humidity", "cloud")
+
+DEFAULT_RAMP = {
+    "positions": [0.0, 0.1, 0.15, 0.75, 0.85, 1.0],
+    "colors": [(0.0, 0.0, 1.0, 1.0), (1.0, 1.0, 0.0, 1.0), (0.0, 1.0, 0.0, 1.0), (0.5, 0.5, 0.5, 1.0), (1.0, 1.0, 1.0, 1.0), (1.0, 1.0, 1.0, 1.0)],
+    "interpolation": 'EASE',
+}
+
+DEFAULT_CLOUD_RAMP = {
+    "positions": [0.0, 0.5, 1.0],
+    "colors": [(0.0, 0.0, 0.0, 0.0), (1.0, 1.0, 1.0, 1.0), (1.0, 1.0, 1.0, 1.0)],
+    "interpolation": 'EASE',
+}
+
+# A planet is described by the same names as DS_GlobalProperties, plus the SphereMaterial
+# settings. Defaults match the add-on and the nodes created by generate_final_material.
+DEFAULT_PARAMETERS = {
+    "name": "planet",
+    "enable_elevation": True,
+    "e_tex_size": 128, "e_num_octaves": 4, "e_frequency": 1.0, "e_amplitude": 1.0, "e_lacunarity": 2.0, "e_persistence": 0.5, "e_seed": 1,
+    "enable_humidity": True,
+    "h_tex_size": 128, "h_num_octaves": 1, "h_frequency": 1.0, "h_amplitude": 1.0, "h_lacunarity": 2.0, "h_persistence": 0.5, "h_seed": 2,
+    "enable_cloud": True,
+    "c_tex_size": 128, "c_num_octaves": 2, "c_frequency": 1.0, "c_amplitude": 1.0, "c_lacunarity": 2.0, "c_persistence": 0.5, "c_seed": 3,
+    "sampling": 'EQUIRECT',
+    "normal_strength": 1.0,
+    "sea_level": 0.15,
+    "mix_factor": 0.5,
+    "elevation_ramp": DEFAULT_RAMP,
+    "humidity_ramp": DEFAULT_RAMP,
+    "cloud_ramp": DEFAULT_CLOUD_RAMP,
+}
+
+
+def _convert(value, default):
+    if not isinstance(value, str):
+        return value
+    if isinstance(default, bool):
+        return value.strip().lower() in ("1", "true", "yes", "on")
+    if isinstance(default, int):
+        return int(value)
+    if isinstance(default, float):
+        return float(value)
+    if isinstance(default, dict):
+        return json.loads(value)
+    return value
+
+
+# Full parameter set of a manifest entry, values read from CSV are converted to the default types
+def planet_parameters(entry):
+    params = dict(DEFAULT_PARAMETERS)
+    for key, value in entry.items():
+        if key not in DEFAULT_PARAMETERS:
+            raise ValueError("Unknown planet parameter: {}".format(key))
+        if value == "" or value is None:
+            continue
+        params[key] = _convert(value, DEFAULT_PARAMETERS[key])
+    return params
+
+
+# Generation settings of a layer, in generate_fractal_map argument order
+def layer_settings(params, layer):
+    prefix = dict(LAYERS)[layer]
+    return tuple(params[prefix + "_" + name] for name in ("seed", "tex_size", "num_octaves", "frequency", "amplitude", "lacunarity", "persistence"))
+
+
+def export_size(params):
+    if params["enable_elevation"]:
+        return params["e_tex_size"]
+    sizes = [params[prefix + "_tex_size"] for layer, prefix in LAYERS if params["enable_" + layer]]
+    return max(sizes) if sizes else params["e_tex_size"]
+
+
+def material_parameters(params):
+    return {key: params[key] for key in ("elevation_ramp", "humidity_ramp", "cloud_ramp", "sea_level", "mix_factor")}
+
+
+# Computes every map of a planet. Layer maps hold the raw noise, the normal and diffuse
+# maps are RGBA with the diffuse colors already encoded to sRGB.
+def generate_planet(params, workers=1, timings=None):
+    timings = {} if timings is None else timings
+    results = {}
+
+    # Layers of the same texture size are generated together by one fused pass
+    groups = {}
+    for layer, prefix in LAYERS:
+        if params["enable_" + layer]:
+            seed, texture_size, *octave_params = layer_settings(params, layer)
+            groups.setdefault(texture_size, []).append((layer, (seed,) + tuple(octave_params)))
+
+    for texture_size, group in groups.items():
+        start = time.perf_counter()
+        name = " ".join([params["name"]] + [layer for layer, _ in group])
+        layer_params = [octave_params for _, octave_params in group]
+        if params["sampling"] == 'CUBE':
+            cubes = fractal.generate_cube_layers(name, fractal.cube_face_size(texture_size), layer_params, workers)
+            layer_maps = [fractal.cube_to_equirect(cube, texture_size) for cube in cubes]
+        else:
+            layer_maps = fractal.generate_fractal_layers(name, texture_size, layer_params, workers)
+        for (layer, _), noise_texture in zip(group, layer_maps):
+            results[layer] = noise_texture
+        timings["noise_" + "_".join(layer for layer, _ in group)] = time.perf_counter() - start
+    return composite_planet(params, results, timings)
+
+
+# Adds the normal and diffuse maps to the layer maps of a planet
+def composite_planet(params, results, timings):
+    # Generated images store the noise clipped to [0, 1], which the material reads as sRGB
+    start = time.perf_counter()
+    if "elevation" in results:
+        results["normal"] = maps.normal_map(np.clip(results["elevation"], 0.0, 1.0), params["normal_strength"])
+    timings["normal"] = time.perf_counter() - start
+
+    start = time.perf_counter()
+    size = export_size(params)
+    linear = [maps.srgb_to_linear(results[layer]) if layer in results else None for layer, _ in LAYERS]
+    diffuse = maps.composite_diffuse((size, size), *linear, material_parameters(params))
+    diffuse[:, :, :3] = maps.linear_to_srgb(diffuse[:, :, :3])
+    results["diffuse"] = diffuse
+    timings["diffuse"] = time.perf_counter() - start
+    return results
+
+
+def output_paths(params, folder):
+    paths = {}
+    for kind in MAP_KINDS:
+        if kind in dict(LAYERS):
+            if not params["enable_" + kind]:
+                continue
+            size = params[dict(LAYERS)[kind] + "_tex_size"]
+        elif kind == "normal":
+            if not params["enable_elevation"]:
+                continue
+            size = params["e_tex_size"]
+        else:
+            size = export_size(params)
+        paths[kind] = os.path.join(folder, "{}_{}_{}.png".format(params["name"], kind, size))
+    return paths
+
+
+def timing_path(params, folder):
+    return os.path.join(folder, "{}_timing.json".format(params["name"]))
+
+
+# A planet is complete once its timing file has been written, which happens after every map
+def is_complete(params, folder):
+    return os.path.exists(timing_path(params, folder)) and all(os.path.exists(path) for path in output_paths(params, folder).values())
+
+
+def write_planet(params, folder, workers=1):
+    start = time.perf_counter()
+    timings = {}
+    results = generate_planet(params, workers, timings)
+    return write_results(params, folder, results, timings, start)
+
+
+# Writes the maps of a planet and its timing file, start being when its generation began
+def write_results(params, folder, results, timings, start):
+    write_start = time.perf_counter()
+    for kind, path in output_paths(params, folder).items():
+        pixels = results[kind]
+        png.write_png(path, pixels[:, :, :3] if pixels.ndim == 3 else pixels)
+    timings["write"] = time.perf_counter() - write_start
+    timings["total"] = time.perf_counter() - start
+
+    summary = {"name": params["name"], "size": export_size(params), "timings": timings}
+    with open(timing_path(params, folder) + ".tmp", "w") as f:
+        json.dump(summary, f, indent=2)
+    os.replace(timing_path(params, folder) + ".tmp", timing_path(params, folder))
+    return summary
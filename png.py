@@ -0,0 +1,84 @@
+import os
+import struct
+import zlib
+import numpy as np
+
+from . import instrument
+
+
+COLOR_TYPES = {1: 0, 2: 4, 3: 2, 4: 6}
+
+
+def _chunk(kind, data):
+    return struct.pack(">I", len(data)) + kind + data + struct.pack(">I", zlib.crc32(kind + data) & 0xFFFFFFFF)
+
+
+def quantize(pixels, bit_depth):
+    max_value = (1 << bit_depth) - 1
+    dtype = ">u1" if bit_depth == 8 else ">u2"
+    return np.round(np.clip(pixels, 0.0, 1.0) * max_value).astype(dtype)
+
+
+# Incremental PNG encoder: rows are given top-down in strips and compressed as they arrive,
+# so the whole image never has to be held in memory. The file is written next to its final
+# path and only moved in place by close(), an aborted export leaves no truncated image.
+class PNGWriter:
+    def __init__(self, path, width, height, channels, bit_depth=8, compression=6):
+        self.path = path
+        self.tmp_path = path + ".tmp"
+        self.width = width
+        self.height = height
+        self.channels = channels
+        self.bit_depth = bit_depth
+        self.rows_written = 0
+        self.compressor = zlib.compressobj(compression)
+        self.file = open(self.tmp_path, "wb")
+        self.file.write(b"\x89PNG\r\n\x1a\n")
+        self.file.write(_chunk(b"IHDR", struct.pack(">IIBBBBB", width, height, bit_depth, COLOR_TYPES[channels], 0, 0, 0)))
+
+    def write_rows(self, pixels):
+        pixels = np.asarray(pixels)
+        if pixels.ndim == 2:
+            pixels = pixels[:, :, None]
+        rows = pixels.shape[0]
+        samples = quantize(pixels, self.bit_depth).reshape(rows, -1)
+        raw = np.zeros((rows, 1 + samples.nbytes // rows), dtype=np.uint8)
+        raw[:, 1:] = samples.view(np.uint8).reshape(rows, -1)
+        self._write_idat(self.compressor.compress(raw.tobytes()))
+        self.rows_written += rows
+
+    def _write_idat(self, data):
+        if data:
+            self.file.write(_chunk(b"IDAT", data))
+
+    def close(self):
+        if self.rows_written != self.height:
+            raise ValueError("{} rows written to a {} rows PNG".format(self.rows_written, self.height))
+        self._write_idat(self.compressor.flush())
+        self.file.write(_chunk(b"IEND", b""))
+        self.file.close()
+        os.replace(self.tmp_path, self.path)
+
+    def abort(self):
+        self.file.close()
+        os.remove(self.tmp_path)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if exc_type is None:
+            self.close()
+        else:
+            self.abort()
+
+
+# Writes float pixels in [0, 1] to a PNG file without bpy. Rows are expected in Blender
+# order (bottom row first) and are flipped to the PNG top-down order.
+def write_png(path, pixels, bit_depth=8, compression=6):
+    pixels = np.asarray(pixels)
+    if pixels.ndim == 2:
+        pixels = pixels[:, :, None]
+    rows, cols, channels = pixels.shape
+    with instrument.stage("write_png", rows * cols), PNGWriter(path, cols, rows, channels, bit_depth, compression) as writer:
+        writer.write_rows(pixels[::-1])
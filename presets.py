@@ -0,0 +1,123 @@
+import json
+import os
+import re
+import time
+import numpy as np
+
+from . import planet
+
+DEFAULT_FOLDER = os.path.join(os.path.expanduser("~"), "dust_speck_presets")
+
+# Layer maps and the RGB normal map stored in a preset bundle
+BUNDLE_KINDS = ("elevation", "humidity", "cloud", "normal")
+
+PRESET_VERSION = 1
+
+PRESET_EXTENSION = ".preset.json"
+
+
+# Writes maps as a compressed npz of float16 arrays, with an optional JSON description stored
+# as the "info" member
+def save_bundle(path, maps, info=None):
+    bundle = {kind: np.asarray(values, dtype=np.float16) for kind, values in maps.items() if values is not None}
+    members = dict(bundle)
+    if info is not None:
+        members["info"] = np.array(json.dumps(info))
+    with open(path + ".tmp", "wb") as f:
+        np.savez_compressed(f, **members)
+    os.replace(path + ".tmp", path)
+    return bundle
+
+
+# Description and maps of a bundle as float32. npz members are only decompressed when read,
+# so restricting kinds skips the other maps entirely.
+def load_bundle(path, kinds=None):
+    maps = {}
+    with np.load(path) as bundle:
+        info = json.loads(str(bundle["info"])) if "info" in bundle.files else {}
+        for kind in bundle.files:
+            if kind != "info" and (kinds is None or kind in kinds):
+                maps[kind] = bundle[kind].astype(np.float32)
+    return info, maps
+
+
+# Preset names double as file names, anything else than letters, digits, spaces, dashes and
+# underscores is replaced
+def preset_filename(name):
+    return re.sub(r"[^\w\- ]", "_", name).strip() or "planet"
+
+
+# On-disk library of planets. Each preset is a <name>.preset.json file with the full planet
+# parameters (seeds, octave settings and material ramps) and a <name>.npz bundle holding the
+# generated maps as float16, so a preset is applied without evaluating any noise. Listing the
+# library only reads the folder, bundles are opened when a preset is loaded.
+class PresetLibrary:
+    def __init__(self, folder=""):
+        self.folder = folder or DEFAULT_FOLDER
+
+    def _path(self, name, extension):
+        return os.path.join(self.folder, preset_filename(name) + extension)
+
+    def names(self):
+        if not os.path.isdir(self.folder):
+            return []
+        return sorted(entry.name[:-len(PRESET_EXTENSION)] for entry in os.scandir(self.folder) if entry.name.endswith(PRESET_EXTENSION))
+
+    def save(self, params, maps):
+        params = planet.planet_parameters(params)
+        os.makedirs(self.folder, exist_ok=True)
+        # The bundle is written first, a preset only shows up once its parameters are in place
+        bundle = save_bundle(self._path(params["name"], ".npz"), {kind: maps.get(kind) for kind in BUNDLE_KINDS})
+        preset = {"version": PRESET_VERSION, "planet": params, "maps": {kind: list(values.shape) for kind, values in bundle.items()}}
+        path = self._path(params["name"], PRESET_EXTENSION)
+        with open(path + ".tmp", "w") as f:
+            json.dump(preset, f, indent=2)
+        os.replace(path + ".tmp", path)
+        return path
+
+    def parameters(self, name):
+        with open(self._path(name, PRESET_EXTENSION)) as f:
+            preset = json.load(f)
+        return planet.planet_parameters(preset["planet"])
+
+    # Planet parameters and stored maps of a preset, maps are returned as float32
+    def load(self, name):
+        params = self.parameters(name)
+        try:
+            _, maps = load_bundle(self._path(name, ".npz"))
+        except OSError:
+            maps = {}
+        return params, maps
+
+    def remove(self, name):
+        for extension in (PRESET_EXTENSION, ".npz"):
+            try:
+                os.remove(self._path(name, extension))
+            except OSError:
+                pass
+
+
+# Batch counterpart of the Save Preset operator. Layers are stored clipped to [0, 1] like the
+# images of the add-on.
+def write_planet(params, folder, workers=1):
+    start = time.perf_counter()
+    timings = {}
+    results = planet.generate_planet(params, workers, timings)
+
+    preset_start = time.perf_counter()
+    bundle = {layer: np.clip(results[layer], 0.0, 1.0) for layer, _ in planet.LAYERS if layer in results}
+    if "normal" in results:
+        bundle["normal"] = results["normal"][:, :, :3]
+    PresetLibrary(folder).save(params, bundle)
+    timings["preset"] = time.perf_counter() - preset_start
+    timings["total"] = time.perf_counter() - start
+
+    summary = {"name": params["name"], "size": planet.export_size(params), "timings": timings}
+    with open(planet.timing_path(params, folder) + ".tmp", "w") as f:
+        json.dump(summary, f, indent=2)
+    os.replace(planet.timing_path(params, folder) + ".tmp", planet.timing_path(params, folder))
+    return summary
+
+
+def is_complete(params, folder):
+    return os.path.exists(planet.timing_path(params, folder)) and os.path.exists(PresetLibrary(folder)._path(params["name"], PRESET_EXTENSION))
@@ -0,0 +1,175 @@
+import json
+import math
+import os
+import time
+import numpy as np
+
+from . import fractal
+from . import maps
+from . import planet
+from . import png
+
+PYRAMID_KINDS = ("diffuse", "normal", "elevation")
+
+TILE_BIT_DEPTHS = {"diffuse": 8, "normal": 8, "elevation": 16}
+
+DEFAULT_TILE_SIZE = 256
+
+DOWNSAMPLERS = {"diffuse": maps.downsample_srgb, "normal": maps.downsample_normals, "elevation": maps.downsample}
+
+
+# Tiles are numbered from the north-west corner, like the rows of the written images.
+# Returns the Blender rows (south first) and the columns of tile (x, y).
+def tile_bounds(rows, cols, tile_size, x, y):
+    top = y * tile_size
+    bottom = min(top + tile_size, rows)
+    return rows - bottom, rows - top, x * tile_size, min((x + 1) * tile_size, cols)
+
+
+def tile_path(folder, index, kind, level, x, y):
+    return os.path.join(folder, index["path"].format(name=index["name"], kind=kind, level=level, x=x, y=y))
+
+
+def index_path(folder, name):
+    return os.path.join(folder, "{}_pyramid.json".format(name))
+
+
+def _write_tile(path, kind, pixels):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    png.write_png(path, pixels[:, :, :3] if pixels.ndim == 3 else pixels, TILE_BIT_DEPTHS[kind])
+
+
+def _write_level(folder, index, level, pixels):
+    entry = index["levels"][level]
+    for kind, values in pixels.items():
+        for y in range(entry["tiles_y"]):
+            for x in range(entry["tiles_x"]):
+                start, stop, col_start, col_stop = tile_bounds(entry["height"], entry["width"], index["tile_size"], x, y)
+                _write_tile(tile_path(folder, index, kind, level, x, y), kind, values[start:stop, col_start:col_stop])
+
+
+def _level_entry(level, rows, cols, tile_size, texture_size=None):
+    return {
+        "level": level,
+        "width": cols,
+        "height": rows,
+        "tiles_x": math.ceil(cols / tile_size),
+        "tiles_y": math.ceil(rows / tile_size),
+        "texture_size": texture_size,
+        "on_demand": texture_size is not None,
+    }
+
+
+# Writes a tiled equirectangular pyramid from base maps in Blender row order: "diffuse" sRGB
+# colors, "normal" encoded normals and "elevation" values, any of which may be missing.
+# Coarser levels are filtered down from the base maps until a level fits in one tile.
+# finer_levels levels above the base are only described in the index, their tiles are
+# generated on demand by ensure_tile from the planet parameters stored with the index.
+# Level 0 is the coarsest level.
+def build_pyramid(base, params, folder, base_size, tile_size=DEFAULT_TILE_SIZE, method='BOX', finer_levels=0):
+    pixels = {kind: np.asarray(values, dtype=np.float32) for kind, values in base.items() if values is not None}
+    if "diffuse" in pixels:
+        pixels["diffuse"] = pixels["diffuse"][:, :, :3]
+    rows, cols = next(iter(pixels.values())).shape[:2]
+    levels = [pixels]
+    while max(rows, cols) > tile_size:
+        pixels = {kind: DOWNSAMPLERS[kind](values, method) for kind, values in levels[0].items()}
+        levels.insert(0, pixels)
+        rows, cols = next(iter(pixels.values())).shape[:2]
+
+    index = {
+        "name": params["name"],
+        "projection": "equirectangular",
+        "tile_size": tile_size,
+        "filter": method,
+        "kinds": sorted(levels[-1]),
+        "path": "{name}_pyramid/{kind}/{level}/{y}_{x}.png",
+        "levels": [],
+        "planet": params,
+    }
+    for level, level_pixels in enumerate(levels):
+        rows, cols = next(iter(level_pixels.values())).shape[:2]
+        index["levels"].append(_level_entry(level, rows, cols, tile_size))
+    for step in range(1, finer_levels + 1):
+        texture_size = base_size * 2**step
+        index["levels"].append(_level_entry(len(index["levels"]), *fractal.grid_shape(texture_size), tile_size, texture_size))
+
+    for level, level_pixels in enumerate(levels):
+        _write_level(folder, index, level, level_pixels)
+    with open(index_path(folder, params["name"]) + ".tmp", "w") as f:
+        json.dump(index, f, indent=2)
+    os.replace(index_path(folder, params["name"]) + ".tmp", index_path(folder, params["name"]))
+    return index
+
+
+# Maps of a single tile of a planet sampled at texture_size. Noise is only evaluated within the
+# tile's latitude and longitude bounds, plus a one texel border for the normal map.
+def tile_maps(params, texture_size, tile_size, x, y, kinds=PYRAMID_KINDS):
+    rows, cols = fractal.grid_shape(texture_size)
+    start, stop, col_start, col_stop = tile_bounds(rows, cols, tile_size, x, y)
+    columns = np.arange(col_start, col_stop)
+    halo_columns = np.arange(col_start - 1, col_stop + 1) % cols
+
+    values = {}
+    for layer, _ in planet.LAYERS:
+        if params["enable_" + layer]:
+            seed, _, *octave_params = planet.layer_settings(params, layer)
+            if layer == "elevation":
+                halo = fractal.generate_fractal_rows(seed, texture_size, max(start - 1, 0), min(stop + 1, rows), *octave_params, columns=halo_columns)
+                first = max(start - 1, 0)
+                values[layer] = halo[start - first:stop - first, 1:-1]
+            else:
+                values[layer] = fractal.generate_fractal_rows(seed, texture_size, start, stop, *octave_params, columns=columns)
+
+    tile = {}
+    if "elevation" in kinds and "elevation" in values:
+        tile["elevation"] = values["elevation"]
+    if "normal" in kinds and "elevation" in values:
+        tile["normal"] = maps.normal_map_rows(np.clip(halo, 0.0, 1.0), start, stop, rows, params["normal_strength"], cols)
+    if "diffuse" in kinds:
+        linear = [maps.srgb_to_linear(values[layer]) if layer in values else None for layer, _ in planet.LAYERS]
+        diffuse = maps.composite_diffuse((stop - start, col_stop - col_start), *linear, planet.material_parameters(params))
+        tile["diffuse"] = maps.linear_to_srgb(diffuse[:, :, :3])
+    return tile
+
+
+# Path of a tile, generating the tiles of every kind at that position first when it belongs
+# to an on-demand level and has not been written yet
+def ensure_tile(folder, name, kind, level, x, y):
+    with open(index_path(folder, name)) as f:
+        index = json.load(f)
+    entry = index["levels"][level]
+    if not (0 <= x < entry["tiles_x"] and 0 <= y < entry["tiles_y"]):
+        raise ValueError("Tile ({}, {}) is outside level {}".format(x, y, level))
+    path = tile_path(folder, index, kind, level, x, y)
+    if not os.path.exists(path) and entry["on_demand"]:
+        params = planet.planet_parameters(index["planet"])
+        for tile_kind, pixels in tile_maps(params, entry["texture_size"], index["tile_size"], x, y, index["kinds"]).items():
+            _write_tile(tile_path(folder, index, tile_kind, level, x, y), tile_kind, pixels)
+    return path
+
+
+# Batch counterpart of the pyramid export: the base level is generated at the elevation
+# texture size like write_planet, the rest is derived from it
+def write_planet(params, folder, tile_size=DEFAULT_TILE_SIZE, method='BOX', finer_levels=0, workers=1):
+    start = time.perf_counter()
+    timings = {}
+    results = planet.generate_planet(params, workers, timings)
+
+    pyramid_start = time.perf_counter()
+    base = {kind: results.get(kind) for kind in PYRAMID_KINDS}
+    if base["elevation"] is not None:
+        base["elevation"] = np.clip(base["elevation"], 0.0, 1.0)
+    build_pyramid(base, params, folder, planet.export_size(params), tile_size, method, finer_levels)
+    timings["pyramid"] = time.perf_counter() - pyramid_start
+    timings["total"] = time.perf_counter() - start
+
+    summary = {"name": params["name"], "size": planet.export_size(params), "tile_size": tile_size, "timings": timings}
+    with open(planet.timing_path(params, folder) + ".tmp", "w") as f:
+        json.dump(summary, f, indent=2)
+    os.replace(planet.timing_path(params, folder) + ".tmp", planet.timing_path(params, folder))
+    return summary
+
+
+def is_complete(params, folder):
+    return os.path.exists(planet.timing_path(params, folder)) and os.path.exists(index_path(folder, params["name"]))
@@ -1,90 +1,881 @@
 import bpy
-import math
+import os
 import numpy as np
-import random
+import functools
+import contextlib
+import time
+import uuid
 from enum import Enum, auto
 
-try:
-    import opensimplex
-    print("OpenSimplex is available - using Simplex noise")
-except ImportError:
-    raise RuntimeError("Opensimplex is required to use Dust Speck")
+from . import animation
+from . import cache
+from . import fractal
+from . import instrument
+from . import jobs
+from . import maps
+from . import mesh
+from . import noise
+from . import planet
+from . import png
+from . import presets
+from . import pyramid
+from . import stream
+
+# Resolution divisor of the preview shown while a map is generated in the background
+PREVIEW_DIVISOR = 8
+
+# Seconds without further changes before the live preview is recomputed
+LIVE_PREVIEW_DELAY = 0.05
+
+# Minimum delay between two pushes of refined pixels to a previewed image, in seconds
+REFRESH_INTERVAL = 0.25
+
+# Jobs of the generation operators currently running, keyed by layer name
+active_jobs = {}
+
+# Background map exports, the last finished one stays listed for the panel
+export_jobs = []
+
+# Seconds between two checks of the running exports
+EXPORT_POLL_INTERVAL = 0.5
+
+# Writer format and bit depth of each export format
+EXPORT_FORMATS = {'PNG': ("png", 8), 'PNG16': ("png", 16), 'EXR': ("exr", 16), 'RAW': ("raw", 16)}
+
+
+# Datablocks created by Dust Speck carry this custom property, so a reset only removes them
+OWNER_KEY = "dust_speck"
+
+PURGED_COLLECTIONS = ("objects", "meshes", "materials", "node_groups", "textures", "images", "cameras")
+
+# Node names the operators rely on, a reused material has to provide them
+SPHERE_MATERIAL_NODES = ("ElevationNode", "HumidityNode", "CloudNode", "NormalNode", "DiffuseOutput", "CloudMix", "PlanetBSDF", "PlanetOutput",
+                         "ElevationColorRamp", "HumidityColorRamp", "CloudColorRamp", "HumiditySeaLevel", "HumidityMixFac")
+NORMAL_MATERIAL_NODES = ("ImageNode", "NormalOutput")
+
+
+def owned(id_data):
+    id_data[OWNER_KEY] = True
+    return id_data
 
 
 # Core generation logic
-def purge_all():
-    ob = [o for o in bpy.data.objects]
-    while ob:
-        bpy.data.objects.remove(ob.pop())
-        
-    mesh = [m for m in bpy.data.meshes]
-    while mesh:
-        bpy.data.meshes.remove(mesh.pop())
-        
-    mat = [m for m in bpy.data.materials]
-    while mat:
-        bpy.data.materials.remove(mat.pop())
-
-    def purge_node_groups():   
-        node_group = [g for g in bpy.data.node_groups]
-        while node_group:
-            bpy.data.node_groups.remove(node_group.pop())
-        if [g for g in bpy.data.node_groups]: purge_node_groups()
-    purge_node_groups()
-        
-    tex = [t for t in bpy.data.textures]
-    while tex:
-        bpy.data.textures.remove(tex.pop())
+# The layer images hold 8 bits per channel. The float values each layer map was built from are
+# kept here, so exports and the map store are not limited to what the image can show. Entries
+# are tied to their image by an id stored on it, and are dropped when a file is opened.
+VALUES_KEY = "ds_values"
 
-    img = [i for i in bpy.data.images]
-    while img:
-        bpy.data.images.remove(img.pop())
+layer_values = {}
+
+
+def set_layer_map(props, layer, image, values):
+    setattr(props, layer + "_map", image)
+    image[VALUES_KEY] = uuid.uuid4().hex
+    layer_values[layer] = (image[VALUES_KEY], np.asarray(values, dtype=np.float32))
+
+
+# Values of a generated layer map clipped like its image. The pixels are returned instead when
+# the float values belong to another image or no longer round to the pixels, after painting.
+def generated_values(props, layer):
+    image = getattr(props, layer + "_map")
+    if image is None:
+        return None
+    pixels = np.ascontiguousarray(image_pixels(image)[:, :, 0])
+    key, values = layer_values.get(layer, (None, None))
+    if key is None or image.get(VALUES_KEY) != key or values.shape != pixels.shape:
+        return pixels
+    values = np.clip(values, 0.0, 1.0)
+    if np.abs(values - pixels).max() > 1.0 / 255:
+        return pixels
+    return values
+
+
+# Removes the Dust Speck datablocks, or every datablock of the purged types when owned_only
+# is False, with a single batch_remove call. Removing datablocks one by one makes Blender
+# rescan the users of the whole file each time. Datablocks in keep are left alone.
+def purge_all(owned_only=True, keep=()):
+    keep = set(keep)
+    with instrument.stage("purge_all"):
+        ids = [id_data for collection in PURGED_COLLECTIONS for id_data in getattr(bpy.data, collection)
+               if (not owned_only or id_data.get(OWNER_KEY)) and id_data not in keep]
+        bpy.data.batch_remove(ids)
+    return len(ids)
+
+
+# Images are pooled by role and resolution. Regenerating a map overwrites the pixels of the
+# image already holding its role instead of allocating ProceduralTexture.001, .002 and so on,
+# and a role keeps a single resolution: asking for another size removes the previous image
+# right away. Background jobs draw into a "<role> Preview" image that swaps roles with the
+# final image once the job succeeds, so a cancelled job leaves the previous map untouched.
+ROLE_KEY = "ds_role"
+
+# Image pool activity since the add-on was loaded
+image_stats = {"allocated": 0, "reused": 0, "freed": 0}
+
+
+def image_name(role, width, height):
+    return "{} {}x{}".format(role, width, height)
+
+
+def role_images(role):
+    return [image for image in bpy.data.images if image.get(ROLE_KEY) == role]
+
+
+def set_image_role(image, role):
+    image[ROLE_KEY] = role
+    image.name = image_name(role, *image.size)
+
+
+def pooled_image(role, width, height, non_color=False):
+    image = next((image for image in role_images(role) if tuple(image.size) == (width, height)), None)
+    stale = [other for other in role_images(role) if other != image]
+    if stale:
+        image_stats["freed"] += len(stale)
+        bpy.data.batch_remove(stale)
+    if image is None:
+        image = owned(bpy.data.images.new(name=image_name(role, width, height), width=width, height=height))
+        image[ROLE_KEY] = role
+        image_stats["allocated"] += 1
+    else:
+        image_stats["reused"] += 1
+    image.colorspace_settings.name = 'Non-Color' if non_color else 'sRGB'
+    return image
+
+
+def preview_role(role):
+    return role + " Preview"
+
+
+# Makes a finished preview image the image of its role, the previous image becomes the next preview
+def promote_image(image, role):
+    previous = role_images(role)
+    for other in previous:
+        other.name = "Dust Speck swap"
+    set_image_role(image, role)
+    for other in previous:
+        set_image_role(other, preview_role(role))
+    return image
+
+
+def image_bytes(image):
+    width, height = image.size
+    return width * height * image.channels * (4 if image.is_float else 1)
+
+
+def pooled_image_memory():
+    images = [image for image in bpy.data.images if image.get(ROLE_KEY)]
+    return len(images), sum(image_bytes(image) for image in images)
+
+
+def layer_role(layer):
+    return layer.capitalize()
+
+
+def material_is_valid(mat, node_names):
+    return mat is not None and mat.node_tree is not None and all(name in mat.node_tree.nodes for name in node_names)
+
+
+def sphere_is_valid(sphere, sphere_type, size):
+    return sphere is not None and sphere.type == 'MESH' and sphere.data.get("ds_sphere_type") == sphere_type and sphere.data.get("ds_segments") == size
+
+
+# Datablocks DS_Initialize can keep when reusing data: materials with the expected nodes,
+# a sphere built with the same settings and the generated images
+def reusable_data(props):
+    keep = []
+    if material_is_valid(props.sphere_material, SPHERE_MATERIAL_NODES):
+        keep.append(props.sphere_material)
+    if material_is_valid(props.sphere_normal_material, NORMAL_MATERIAL_NODES):
+        keep.append(props.sphere_normal_material)
+    if sphere_is_valid(props.sphere, props.sphere_type, props.planet_details):
+        keep += [props.sphere, props.sphere.data]
+    keep += [image for image in (props.elevation_map, props.humidity_map, props.cloud_map, props.normal_map) if image is not None]
+    return keep
+
+
+# Noise is evaluated on whole batches of sphere samples by the NumPy port of OpenSimplex
+# in simplex.py, which is bit-for-bit identical to calling opensimplex.noise3 per pixel.
+# Measured on a single core: 200x200 with 8 octaves went from 17.3s (per-pixel loop)
+# to 0.37s, and 1024x1024 with 8 octaves now takes about 11s.
+def generate_fractal_map(name, seed, texture_size, num_octaves, basds_e_frequency, basds_e_amplitude, lacunarity, persistence):
+    settings = (seed, texture_size, num_octaves, basds_e_frequency, basds_e_amplitude, lacunarity, persistence)
+    noise_texture = load_cached_map(name, settings)
+    if noise_texture is None:
+        noise_texture = fractal_map_generator(name, settings)()
+        store_cached_map(name, settings, noise_texture)
+    return noise_to_image(noise_texture, texture_size, layer_role(name))
+
+
+# Generation settings of a layer, in generate_fractal_map argument order
+def layer_settings(props, layer):
+    prefix = {"elevation": "e", "humidity": "h", "cloud": "c"}[layer]
+    return tuple(getattr(props, prefix + "_" + name) for name in ("seed", "tex_size", "num_octaves", "frequency", "amplitude", "lacunarity", "persistence"))
+
+
+# Resolves every scene setting up front so the returned generator can run on any thread
+def fractal_map_generator(name, settings):
+    props = bpy.context.scene.ds_global_properties
+    if props.sampling == 'CUBE':
+        return functools.partial(generate_cube_map, name, settings, props.workers)
+    if props.reuse_octaves:
+        return functools.partial(fractal.generate_fractal_noise_from_octaves, name, *settings, get_octave_cache(), props.workers)
+    return functools.partial(fractal.generate_fractal_noise, name, *settings, props.workers)
+
+
+def load_cached_map(name, settings):
+    props = bpy.context.scene.ds_global_properties
+    if not props.use_cache:
+        return None
+    if props.sampling == 'CUBE':
+        cube = get_map_cache().get(cube_key(settings))
+        if cube is None:
+            return None
+        cube_maps[name] = (settings, cube)
+        print("Loaded cube map ({}) from cache".format(name))
+        return fractal.cube_to_equirect(cube, settings[1])
+    noise_texture = get_map_cache().get(fractal.map_key(*settings))
+    if noise_texture is not None:
+        print("Loaded fractal map ({}) from cache".format(name))
+    return noise_texture
+
+
+def store_cached_map(name, settings, noise_texture):
+    props = bpy.context.scene.ds_global_properties
+    if not props.use_cache:
+        return
+    # In cube mode the faces are cached, the equirectangular map is resampled from them
+    if props.sampling == 'CUBE':
+        if name in cube_maps and cube_maps[name][0] == settings:
+            get_map_cache().put(cube_key(settings), cube_maps[name][1])
+    # Maps summed from half float octaves are approximations and are not cached on disk
+    elif not (props.reuse_octaves and props.octave_half_float):
+        get_map_cache().put(fractal.map_key(*settings), noise_texture)
+
+
+# Cube faces of the maps generated in cube mode, keyed by layer, as (settings, cube) pairs
+cube_maps = {}
+
+
+def cube_key(settings):
+    seed, texture_size, *octave_params = settings
+    return fractal.cube_key(seed, fractal.cube_face_size(texture_size), *octave_params)
+
+
+# Samples the six cube faces and resamples them to the equirectangular grid used by the sphere
+def generate_cube_map(name, settings, workers, on_band=None, cancelled=None):
+    seed, texture_size, *octave_params = settings
+    cube = fractal.generate_cube_noise(name, seed, fractal.cube_face_size(texture_size), *octave_params, workers=workers, on_band=on_band, cancelled=cancelled)
+    cube_maps[name] = (settings, cube)
+    return fractal.cube_to_equirect(cube, texture_size)
+
+
+# Fused counterpart of fractal_map_generator for layers sharing a texture size, given as
+# (layer, settings) pairs. The generator returns the maps stacked as (layers, rows, cols).
+def layer_maps_generator(group):
+    props = bpy.context.scene.ds_global_properties
+    return functools.partial(generate_layer_maps, [layer for layer, _ in group], [settings for _, settings in group], props.sampling, props.workers)
+
+
+def generate_layer_maps(names, settings, sampling, workers, on_band=None, cancelled=None):
+    texture_size = settings[0][1]
+    layer_params = [(seed,) + tuple(octave_params) for seed, _, *octave_params in settings]
+    if sampling == 'CUBE':
+        cubes = fractal.generate_cube_layers(" ".join(names), fractal.cube_face_size(texture_size), layer_params, workers, on_band=on_band, cancelled=cancelled)
+        for name, cube_settings, cube in zip(names, settings, cubes):
+            cube_maps[name] = (cube_settings, cube)
+        return np.stack([fractal.cube_to_equirect(cube, texture_size) for cube in cubes])
+    return fractal.generate_fractal_layers(" ".join(names), texture_size, layer_params, workers, on_band=on_band, cancelled=cancelled)
+
+
+def cube_map(name, settings):
+    if name in cube_maps and cube_maps[name][0] == settings:
+        return cube_maps[name][1]
+    props = bpy.context.scene.ds_global_properties
+    cube = get_map_cache().get(cube_key(settings)) if props.use_cache else None
+    if cube is None:
+        seed, texture_size, *octave_params = settings
+        cube = fractal.generate_cube_noise(name, seed, fractal.cube_face_size(texture_size), *octave_params, workers=props.workers)
+        if props.use_cache:
+            get_map_cache().put(cube_key(settings), cube)
+    cube_maps[name] = (settings, cube)
+    return cube
+
+
+def preview_fractal_noise(name, settings, shape):
+    seed, texture_size, *octave_params = settings
+    preview = fractal.generate_fractal_noise(name + " preview", seed, max(16, texture_size // PREVIEW_DIVISOR), *octave_params)
+    rows = np.arange(shape[0]) * preview.shape[0] // shape[0]
+    cols = np.arange(shape[1]) * preview.shape[1] // shape[1]
+    return preview[rows[:, None], cols[None, :]]
 
-    cam = [c for c in bpy.data.cameras]
-    while cam :
-        bpy.data.cameras.remove(cam.pop())
-        
 
-# Vectorization using opensimplex.noise2array seems to worsen performance
-# Turns out that sometimes a triple for loop is preferable to multiple operations on
-# very large matrices
-def generate_fractal_map(name, texture_size, num_octaves, basds_e_frequency, basds_e_amplitude, lacunarity, persistence):
-    opensimplex.seed(random.randint(1, 1000))
-    
-    noise_texture = []
-    phi_range = np.arange(-math.pi/2, math.pi/2, math.pi/texture_size)
-    theta_range = np.arange(0, 2*math.pi, 2*math.pi/texture_size)
-    for i, phi in enumerate(phi_range):
-        row = []
-        print("Generating fractal map ({}): {:.2%}".format(name, float(i)/texture_size), end='\r')
-        for theta in theta_range:
-            noise_val = 0
-            frequency = basds_e_frequency
-            amplitude = basds_e_amplitude
-            x = math.cos(phi)*math.cos(theta)
-            y = math.cos(phi)*math.sin(theta)
-            z = math.sin(phi)
-            for octave in range(0, num_octaves):
-                noise_val += amplitude * opensimplex.noise3(frequency * x, frequency * y, frequency * z)
-                frequency *= lacunarity
-                amplitude *= persistence
-            row.append(noise_val)
-        noise_texture.append(row)
-
-    print("\n")
-    return noise_to_image(noise_texture, texture_size)
-
-
-def noise_to_image(noise_texture, texture_size):
-    image = bpy.data.images.new(name="ProceduralTexture", width=texture_size, height=texture_size)
-    pixels = [channel for row in noise_texture for pixel in row for channel in [pixel, pixel, pixel, 1.0]]  # Grayscale image
-    image.pixels = pixels
-    image.update()  
+# Live preview: while enabled, changing a generation setting recomputes that layer at the
+# live preview size once the settings have been still for LIVE_PREVIEW_DELAY, and shows it
+# on the sphere without touching the generated maps. Preview texels are exact samples of the
+# noise, only the interpolation between them differs from the full resolution map.
+live_layers = set()
+
+
+def live_role(layer):
+    return layer_role(layer) + " Live"
+
+
+def live_preview_update(layer):
+    def update(self, context):
+        if self.live_preview:
+            schedule_live_preview([layer])
+    return update
+
+
+def schedule_live_preview(layers):
+    live_layers.update(layers)
+    if bpy.app.timers.is_registered(run_live_preview):
+        bpy.app.timers.unregister(run_live_preview)
+    bpy.app.timers.register(run_live_preview, first_interval=LIVE_PREVIEW_DELAY)
+
+
+def run_live_preview():
+    props = bpy.context.scene.ds_global_properties
+    if not props.live_preview or props.sphere_material is None:
+        live_layers.clear()
+        return None
+    for layer in sorted(live_layers):
+        if layer in active_jobs or not getattr(props, "enable_" + layer):
+            continue
+        start = time.perf_counter()
+        seed, texture_size, *octave_params = layer_settings(props, layer)
+        size = min(props.live_preview_size, texture_size)
+        # Octave layers are kept, so amplitude, persistence and octave count changes are only a sum
+        if props.reuse_octaves:
+            noise_texture = fractal.generate_fractal_noise_from_octaves(layer + " live", seed, size, *octave_params, get_octave_cache())
+        else:
+            noise_texture = fractal.generate_fractal_noise(layer + " live", seed, size, *octave_params)
+        image = pooled_image(live_role(layer), size, size)
+        update_image_pixels(image, noise_to_rgba(noise_texture))
+        set_image_texture(props.sphere_material, LAYER_NODES[layer], image)
+        if layer == "elevation" and props.normal_method == 'CPU':
+            normal_image = pooled_image(live_role("normal"), size, size, non_color=True)
+            update_image_pixels(normal_image, maps.normal_map(np.clip(noise_texture, 0.0, 1.0), props.normal_strength))
+            set_image_texture(props.sphere_material, "NormalNode", normal_image)
+        print("Live preview of the {} map ({}x{}): {:.0f} ms".format(layer, size, size, (time.perf_counter() - start) * 1000))
+    live_layers.clear()
+    redraw_view3d(bpy.context)
+    return None
+
+
+def assign_generated_maps(props, mat):
+    for layer, node_name in LAYER_NODES.items():
+        if getattr(props, "enable_" + layer):
+            set_image_texture(mat, node_name, getattr(props, layer + "_map"))
+    if props.enable_elevation:
+        set_image_texture(mat, "NormalNode", props.normal_map)
+
+
+# Shows the generated maps on the material for the duration of a bake, then puts back
+# whatever it showed, such as the live preview
+@contextlib.contextmanager
+def generated_maps_assigned(props, mat):
+    node_names = list(LAYER_NODES.values()) + ["NormalNode"]
+    shown = {node.name: node.image for node in mat.node_tree.nodes if node.type == 'TEX_IMAGE' and node.name in node_names}
+    assign_generated_maps(props, mat)
+    try:
+        yield
+    finally:
+        for node_name, image in shown.items():
+            set_image_texture(mat, node_name, image)
+
+
+def toggle_live_preview(props):
+    if props.live_preview:
+        schedule_live_preview(layer for layer in LAYER_NODES if getattr(props, "enable_" + layer))
+    elif props.sphere_material is not None:
+        # Back to the generated maps
+        assign_generated_maps(props, props.sphere_material)
+
+
+# Animated clouds: frames are generated by DS_GenerateCloudAnimation as an image sequence and
+# the most recent ones are kept in a ring buffer, so scrubbing the timeline swaps the cloud
+# image without reading the files back. Frames missing from the ring are loaded from disk.
+cloud_ring = None
+
+
+def get_cloud_ring(props):
+    global cloud_ring
+    shape = fractal.grid_shape(props.c_tex_size)
+    if cloud_ring is None or cloud_ring.capacity != props.cloud_ring_frames or cloud_ring.shape != shape:
+        cloud_ring = animation.FrameRing(props.cloud_ring_frames, shape)
+    return cloud_ring
+
+
+def cloud_sequence_folder(props):
+    return bpy.path.abspath(props.cloud_sequence_folder)
+
+
+def cloud_frame_values(props, frame):
+    ring = get_cloud_ring(props)
+    values = ring.get(frame)
+    if values is not None:
+        return values
+    path = animation.frame_path(cloud_sequence_folder(props), props.export_prefix, frame)
+    if not os.path.exists(path):
+        return None
+    image = bpy.data.images.load(path, check_existing=False)
+    try:
+        if tuple(image.size) != ring.shape[::-1]:
+            return None
+        values = image_pixels(image)[:, :, 0]
+    finally:
+        bpy.data.images.remove(image)
+    ring.put(frame, values)
+    return values
+
+
+def show_cloud_frame(scene):
+    props = scene.ds_global_properties
+    if props.sphere_material is None:
+        return
+    values = cloud_frame_values(props, scene.frame_current)
+    if values is None:
+        return
+    image = pooled_image("CloudFrame", values.shape[1], values.shape[0])
+    update_image_pixels(image, noise_to_rgba(values))
+    set_image_texture(props.sphere_material, "CloudNode", image)
+
+
+@bpy.app.handlers.persistent
+def cloud_frame_handler(scene, depsgraph=None):
+    if scene.ds_global_properties.cloud_animation and scene.ds_global_properties.enable_cloud:
+        show_cloud_frame(scene)
+
+
+def toggle_cloud_animation(props, context):
+    if props.cloud_animation:
+        show_cloud_frame(context.scene)
+    elif props.sphere_material is not None and props.enable_cloud:
+        set_image_texture(props.sphere_material, "CloudNode", props.cloud_map)
+
+
+# Resolves the scene settings up front, like fractal_map_generator. Frames are reported to the
+# job as one row bands, the band start being the frame index in the sequence.
+def cloud_frames_generator(props, frames):
+    seed, texture_size, *octave_params = layer_settings(props, "cloud")
+    args = (seed, texture_size, frames, props.cloud_speed, tuple(octave_params), cloud_sequence_folder(props), props.export_prefix, props.workers)
+    def generate(on_band=None, cancelled=None):
+        def on_frame(frame, values):
+            on_band(frame - frames[0], frame - frames[0] + 1, values)
+        return animation.generate_frames(*args, on_frame=on_frame if on_band else None, cancelled=cancelled)
+    return generate
+
+
+# Generated images only live in memory, their pixels are not saved with the .blend. Each layer
+# is stored once instead, as a compressed float16 array in <blend>.dust_speck.npz next to the
+# file, along with the layer settings it belongs to. Opening the file rebuilds the enabled
+# layers; the others stay pending until they are enabled and are carried over by saves.
+stored_layers = {"path": None, "pending": set()}
+
+MAP_STORE_VERSION = 1
+
+
+def map_store_path():
+    if not bpy.data.filepath:
+        return None
+    return os.path.splitext(bpy.data.filepath)[0] + ".dust_speck.npz"
+
+
+def restore_stored_layer(props, layer):
+    if layer not in stored_layers["pending"]:
+        return
+    stored_layers["pending"].discard(layer)
+    info, stored = presets.load_bundle(stored_layers["path"], (layer, "normal") if layer == "elevation" else (layer,))
+    if info["layers"].get(layer) != list(layer_settings(props, layer)):
+        print("Stored {} map does not match the layer settings, it was not restored".format(layer))
+        return
+    texture_size = layer_settings(props, layer)[1]
+    image = noise_to_image(stored[layer], texture_size, layer_role(layer))
+    set_layer_map(props, layer, image, stored[layer])
+    set_image_texture(props.sphere_material, LAYER_NODES[layer], image)
+    if layer == "elevation":
+        if "normal" in stored:
+            props.normal_map = pooled_image("NormalMap", texture_size, texture_size, non_color=True)
+            update_image_pixels(props.normal_map, np.dstack((stored["normal"], np.ones(stored["normal"].shape[:2], dtype=np.float32))))
+        else:
+            props.normal_map = normal_map_to_image(stored[layer], texture_size, props.normal_strength)
+        set_image_texture(props.sphere_material, "NormalNode", props.normal_map)
+
+
+@bpy.app.handlers.persistent
+def restore_maps(*args):
+    # The backend override is saved with the scene
+    noise.set_preference(bpy.context.scene.ds_global_properties.noise_backend)
+    layer_values.clear()
+    stored_layers["path"] = map_store_path()
+    stored_layers["pending"] = set()
+    if stored_layers["path"] is None or not os.path.exists(stored_layers["path"]):
+        return
+    start = time.perf_counter()
+    props = bpy.context.scene.ds_global_properties
+    info, _ = presets.load_bundle(stored_layers["path"], ())
+    stored_layers["pending"] = set(info.get("layers", {}))
+    for layer in LAYER_NODES:
+        if getattr(props, "enable_" + layer):
+            restore_stored_layer(props, layer)
+    print("Restored maps from {} in {:.2f}s".format(stored_layers["path"], time.perf_counter() - start))
+
+
+# Packed copies of the map images would duplicate the store in the .blend
+@bpy.app.handlers.persistent
+def drop_packed_maps(*args):
+    props = bpy.context.scene.ds_global_properties
+    if not props.store_maps:
+        return
+    for image in stored_images(props):
+        if image.packed_file is not None:
+            image.unpack(method='REMOVE')
+
+
+# Images rebuilt from what store_maps writes: the layer maps it stores and the normal map,
+# stored when baked and recomputed from the elevation otherwise
+def stored_images(props):
+    pending = stored_layers["pending"]
+    images = [getattr(props, layer + "_map") for layer in LAYER_NODES if layer not in pending]
+    if "elevation" not in pending and props.elevation_map is not None:
+        images.append(props.normal_map)
+    return [image for image in images if image is not None and image.has_data]
+
+
+@bpy.app.handlers.persistent
+def store_maps(*args):
+    props = bpy.context.scene.ds_global_properties
+    path = map_store_path()
+    if not props.store_maps or path is None:
+        return
+    start = time.perf_counter()
+    info = {"version": MAP_STORE_VERSION, "layers": {}}
+    maps = {}
+    # Pending layers were never rebuilt, their images are empty and the previous store has them
+    pending = stored_layers["pending"]
+    if pending and stored_layers["path"] and os.path.exists(stored_layers["path"]):
+        previous, maps = presets.load_bundle(stored_layers["path"], pending | {"normal"} if "elevation" in pending else pending)
+        info["layers"].update({layer: previous["layers"][layer] for layer in pending if layer in maps})
+    for layer in LAYER_NODES:
+        image = getattr(props, layer + "_map")
+        if layer not in pending and image is not None and image.has_data:
+            maps[layer] = generated_values(props, layer)
+            info["layers"][layer] = list(layer_settings(props, layer))
+    # Direct normal maps are recomputed from the elevation, only baked ones are stored
+    if "elevation" not in pending and props.normal_method == 'BAKE' and props.normal_map is not None and props.normal_map.has_data:
+        maps["normal"] = image_pixels(props.normal_map)[:, :, :3]
+    if not maps:
+        return
+    presets.save_bundle(path, maps, info)
+    stored_layers["path"] = path
+    print("Stored {} maps in {} ({:.1f} MB) in {:.2f}s".format(len(maps), path, os.path.getsize(path) / 2**20, time.perf_counter() - start))
+
+
+map_cache = cache.MapCache()
+
+
+# Backends are listed from the registry without importing their modules
+def noise_backend_items():
+    items = [(noise.AUTO, "Automatic", "Fastest backend matching the reference output, measured once per machine")]
+    for name, backend in noise.BACKENDS.items():
+        description = "Requires " + ", ".join(backend.requires) if backend.requires and not backend.available() else "{}D noise".format("/".join(map(str, backend.dimensions)))
+        items.append((name, backend.label, description))
+    return items
+
+
+def get_map_cache():
+    props = bpy.context.scene.ds_global_properties
+    map_cache.folder = bpy.path.abspath(props.cache_folder) or cache.DEFAULT_FOLDER
+    map_cache.max_bytes = props.cache_size * 2**20
+    return map_cache
+
+
+octave_cache = cache.LayerCache()
+
+
+def get_octave_cache():
+    props = bpy.context.scene.ds_global_properties
+    octave_cache.configure(props.octave_cache_size * 2**20, np.float16 if props.octave_half_float else np.float64)
+    return octave_cache
+
+
+# Full-image pixel buffer copies made since the add-on was loaded
+pixel_copies = {"count": 0, "bytes": 0}
+
+
+def count_pixel_copy(buffer):
+    pixel_copies["count"] += 1
+    pixel_copies["bytes"] += buffer.nbytes
+
+
+# Grayscale image, filled by broadcasting into a single contiguous RGBA buffer
+def noise_to_rgba(noise_texture):
+    pixels = np.empty(noise_texture.shape + (4,), dtype=np.float32)
+    pixels[:, :, :3] = np.asarray(noise_texture, dtype=np.float32)[:, :, None]
+    pixels[:, :, 3] = 1.0
+    count_pixel_copy(pixels)
+    return pixels
+
+
+def update_image_pixels(image, pixels):
+    image.pixels.foreach_set(pixels.ravel())
+    count_pixel_copy(pixels)
+    image.update()
+
+
+def noise_to_image(noise_texture, texture_size, role):
+    image = pooled_image(role, texture_size, texture_size)
+
+    copies = pixel_copies["count"]
+    with instrument.stage("noise_to_image", np.size(noise_texture)):
+        update_image_pixels(image, noise_to_rgba(noise_texture))
+
+    print("Image {} ({}x{}): {} pixel buffer copies, {:.1f} MB total since startup".format(
+        image.name, texture_size, texture_size, pixel_copies["count"] - copies, pixel_copies["bytes"] / 2**20))
+    return image
+
+
+def normal_map_to_image(elevation, texture_size, strength):
+    image = pooled_image("NormalMap", texture_size, texture_size, non_color=True)
+    # The elevation image clips to [0, 1], the normal map follows what the material sees
+    pixels = maps.normal_map(np.clip(elevation, 0.0, 1.0), strength)
+    count_pixel_copy(pixels)
+    update_image_pixels(image, pixels)
     return image
 
 
+def image_pixels(image):
+    width, height = image.size
+    pixels = np.empty(width * height * 4, dtype=np.float32)
+    image.pixels.foreach_get(pixels)
+    return pixels.reshape(height, width, 4)
+
+
+# Linear values an image texture node reads from an image, values optionally gives the
+# pixels at a higher precision than the image holds
+def image_values(image, values=None):
+    if image is None:
+        return None
+    if values is None:
+        values = np.ascontiguousarray(image_pixels(image)[:, :, 0])
+    if not image.is_float and image.colorspace_settings.name == 'sRGB':
+        values = maps.srgb_to_linear(values)
+    return values
+
+
+def read_color_ramp(node):
+    ramp = node.color_ramp
+    return {
+        "positions": [element.position for element in ramp.elements],
+        "colors": [tuple(element.color) for element in ramp.elements],
+        "interpolation": ramp.interpolation,
+    }
+
+
+# Inverse of read_color_ramp. Positions are expected in increasing order, elements are
+# rebuilt from the first one so Blender does not reorder them while they are assigned.
+def write_color_ramp(node, ramp):
+    color_ramp = node.color_ramp
+    while len(color_ramp.elements) > 1:
+        color_ramp.elements.remove(color_ramp.elements[-1])
+    color_ramp.elements[0].position = ramp["positions"][0]
+    color_ramp.elements[0].color = ramp["colors"][0]
+    for position, color in zip(ramp["positions"][1:], ramp["colors"][1:]):
+        color_ramp.elements.new(position).color = color
+    color_ramp.interpolation = ramp["interpolation"]
+
+
+def material_parameters(mat):
+    nodes = mat.node_tree.nodes
+    return {
+        "elevation_ramp": read_color_ramp(nodes["ElevationColorRamp"]),
+        "humidity_ramp": read_color_ramp(nodes["HumidityColorRamp"]),
+        "cloud_ramp": read_color_ramp(nodes["CloudColorRamp"]),
+        "sea_level": nodes["HumiditySeaLevel"].outputs['Value'].default_value,
+        "mix_factor": nodes["HumidityMixFac"].outputs['Value'].default_value,
+    }
+
+
+# Layer values and material parameters the diffuse colors are composited from. Layers come
+# from the generated maps, the material nodes show the low resolution images of the live preview.
+def diffuse_inputs(props, mat):
+    elevation, humidity, cloud = (image_values(getattr(props, layer + "_map"), generated_values(props, layer)) if getattr(props, "enable_" + layer) else None for layer, _ in planet.LAYERS)
+    return elevation, humidity, cloud, material_parameters(mat)
+
+
+def srgb_composite(shape, elevation, humidity, cloud, params):
+    pixels = maps.composite_diffuse(shape, elevation, humidity, cloud, params)
+    pixels[:, :, :3] = maps.linear_to_srgb(pixels[:, :, :3])
+    return pixels
+
+
+# Evaluates the sphere material colors on the generated maps, which replaces a COMBINED
+# bake and matches the material whatever layers are enabled
+def composite_diffuse_pixels(props, mat, texture_size):
+    pixels = srgb_composite((texture_size, texture_size), *diffuse_inputs(props, mat))
+    count_pixel_copy(pixels)
+    return pixels
+
+
+# Copies everything an image export needs on the main thread, as (kind, texture size, pixels)
+# entries. The direct diffuse map is returned as a function of snapshotted layer values so it
+# is composited by the export threads; the Cycles bake has to run here.
+def export_snapshots(props, mat):
+    snapshots = []
+    nodes = mat.node_tree.nodes
+    if props.diffuse_method == 'BAKE':
+        links = mat.node_tree.links
+        links.new(nodes['CloudMix'].outputs['Color'], nodes['PlanetOutput'].inputs['Surface'])
+        with generated_maps_assigned(props, mat):
+            bake_mat_to_image("DiffuseMap", mat, nodes['DiffuseOutput'], export_size(props), 'COMBINED')
+        links.new(nodes['CloudMix'].outputs['Color'], nodes['PlanetBSDF'].inputs['Base Color'])
+        links.new(nodes['PlanetBSDF'].outputs['BSDF'], nodes['PlanetOutput'].inputs['Surface'])
+        if nodes['DiffuseOutput'].image:
+            snapshots.append(("diffuse", export_size(props), image_pixels(nodes['DiffuseOutput'].image)))
+    else:
+        size = export_size(props)
+        snapshots.append(("diffuse", size, functools.partial(srgb_composite, (size, size), *diffuse_inputs(props, mat))))
+    if props.enable_elevation and props.normal_map:
+        if props.normal_method == 'CPU':
+            # Recomputed from the float elevation at the current strength, like the streaming export
+            snapshots.append(("normal", props.normal_map.size[0], functools.partial(maps.normal_map, generated_values(props, "elevation"), props.normal_strength)))
+        else:
+            snapshots.append(("normal", props.normal_map.size[0], image_pixels(props.normal_map)))
+    for layer, _ in planet.LAYERS:
+        image = getattr(props, layer + "_map")
+        if getattr(props, "enable_" + layer) and image:
+            snapshots.append((layer, image.size[0], generated_values(props, layer)))
+    return snapshots
+
+
+# Runs on an export thread
+def export_map(kind, path, pixels, fmt, bit_depth, compression):
+    if callable(pixels):
+        pixels = pixels()
+    with instrument.stage("export_" + kind, pixels.shape[0] * pixels.shape[1]):
+        return stream.write_map(kind, path, pixels, fmt, bit_depth, compression)
+
+
+def start_export(props, mat, folder, prefix):
+    fmt, bit_depth = EXPORT_FORMATS[props.export_format]
+    job = jobs.ExportJob("export", fractal.resolve_workers(props.workers))
+    for kind, size, pixels in export_snapshots(props, mat):
+        path = os.path.join(folder, "{}_{}_{}{}".format(prefix, kind, size, stream.FORMATS[fmt]))
+        job.submit(export_map, kind, path, pixels, fmt, bit_depth, props.export_compression)
+    job.close()
+    export_jobs[:] = [running for running in export_jobs if not running.done] + [job]
+    # Timers never fire in background mode, the export is finished before returning
+    if bpy.app.background:
+        job.wait()
+        report_export(job)
+    elif not bpy.app.timers.is_registered(poll_export_jobs):
+        bpy.app.timers.register(poll_export_jobs, first_interval=EXPORT_POLL_INTERVAL)
+    return job
+
+
+def report_export(job):
+    print("Exported {} maps in {:.2f}s".format(len(job.paths), job.elapsed))
+    for error in job.errors:
+        print("Export error: {}".format(error))
+
+
+def poll_export_jobs():
+    redraw_view3d(bpy.context)
+    for job in export_jobs:
+        if job.done and not job.reported:
+            job.reported = True
+            report_export(job)
+    if all(job.done for job in export_jobs):
+        return None
+    return EXPORT_POLL_INTERVAL
+
+
+# Diffuse and normal maps of every cube face, composited from the cube layers. Faces are
+# written as <prefix>_<kind>_<face>_<size>.png with px, nx, py, ny, pz, nz face names.
+def export_cube_faces(props, mat, folder, prefix):
+    cubes = {layer: cube_map(layer, layer_settings(props, layer)) for layer in ("elevation", "humidity", "cloud") if getattr(props, "enable_" + layer)}
+    face_size = fractal.cube_face_size(props.e_tex_size)
+    faces = len(fractal.CUBE_FACES)
+
+    # Stacked faces composite like a single image, layers are clipped and decoded like the image textures
+    linear = []
+    for layer in ("elevation", "humidity", "cloud"):
+        if layer in cubes:
+            stacked = fractal.cube_faces(cubes[layer]).reshape(-1, cubes[layer].shape[2] - 2)
+            linear.append(maps.srgb_to_linear(stacked))
+        else:
+            linear.append(None)
+    diffuse = maps.composite_diffuse((faces * face_size, face_size), *linear, material_parameters(mat))
+    diffuse[:, :, :3] = maps.linear_to_srgb(diffuse[:, :, :3])
+    outputs = {"diffuse": diffuse.reshape(faces, face_size, face_size, 4)}
+    if "elevation" in cubes:
+        outputs["normal"] = maps.cube_normal_map(np.clip(cubes["elevation"], 0.0, 1.0), props.normal_strength)
+
+    for kind, pixels in outputs.items():
+        for (face, *_), face_pixels in zip(fractal.CUBE_FACES, pixels):
+            png.write_png(os.path.join(folder, "{}_{}_{}_{}.png".format(prefix, kind, face, face_size)), face_pixels[:, :, :3])
+
+
+# Diffuse map size of an export, see planet.export_size
+def export_size(props):
+    return planet.export_size({key: getattr(props, key) for layer, prefix in planet.LAYERS for key in ("enable_" + layer, prefix + "_tex_size")})
+
+
+def has_generated_maps(props):
+    return any(getattr(props, "enable_" + layer) and getattr(props, layer + "_map") for layer in LAYER_NODES)
+
+
+# Planet parameters of the scene settings and material, as used by the batch and streaming exports
+def scene_planet_parameters(props, mat):
+    params = {"name": props.export_prefix or "planet", "normal_strength": props.normal_strength, "sampling": props.sampling}
+    for layer, prefix in planet.LAYERS:
+        params["enable_" + layer] = getattr(props, "enable_" + layer)
+        for name in ("tex_size", "num_octaves", "frequency", "amplitude", "lacunarity", "persistence", "seed"):
+            params[prefix + "_" + name] = getattr(props, prefix + "_" + name)
+    params.update(material_parameters(mat))
+    return planet.planet_parameters(params)
+
+
+# Inverse of scene_planet_parameters, used to load presets
+def apply_planet_parameters(props, mat, params):
+    props.normal_strength = params["normal_strength"]
+    props.sampling = params["sampling"]
+    for layer, prefix in planet.LAYERS:
+        for name in ("tex_size", "num_octaves", "frequency", "amplitude", "lacunarity", "persistence", "seed"):
+            setattr(props, prefix + "_" + name, params[prefix + "_" + name])
+        setattr(props, "enable_" + layer, params["enable_" + layer])
+    nodes = mat.node_tree.nodes
+    write_color_ramp(nodes["ElevationColorRamp"], params["elevation_ramp"])
+    write_color_ramp(nodes["HumidityColorRamp"], params["humidity_ramp"])
+    write_color_ramp(nodes["CloudColorRamp"], params["cloud_ramp"])
+    nodes["HumiditySeaLevel"].outputs['Value'].default_value = params["sea_level"]
+    nodes["HumidityMixFac"].outputs['Value'].default_value = params["mix_factor"]
+
+
+def get_preset_library():
+    props = bpy.context.scene.ds_global_properties
+    return presets.PresetLibrary(bpy.path.abspath(props.preset_folder))
+
+
+# Enum items have to stay referenced from Python while Blender uses them
+preset_items = []
+
+
+def preset_enum_items(self, context):
+    preset_items[:] = [(name, name, "") for name in get_preset_library().names()] or [('NONE', "No presets", "")]
+    return preset_items
+
+
+def redraw_view3d(context):
+    for window in context.window_manager.windows:
+        for area in window.screen.areas:
+            if area.type == 'VIEW_3D':
+                area.tag_redraw()
+
+
 def generate_normal_material(): 
-    mat = bpy.data.materials.new(name="NormalMaterial")
+    mat = owned(bpy.data.materials.new(name="NormalMaterial"))
     mat.use_nodes = True
     nodes = mat.node_tree.nodes
     nodes.clear()
@@ -107,7 +898,7 @@ def generate_normal_material():
     
 
 def generate_final_material():
-    mat = bpy.data.materials.new(name="SphereMaterial")
+    mat = owned(bpy.data.materials.new(name="SphereMaterial"))
     mat.use_nodes = True
     nodes = mat.node_tree.nodes
     nodes.clear()
@@ -234,12 +1025,65 @@ def generate_final_material():
     
 def generate_final_sphere(size, mat):
     bpy.context.scene.cursor.location = (0, 0, 0)
-    bpy.ops.mesh.primitive_uv_sphere_add(segments=size, ring_count=size)
-    sphere = bpy.context.active_object
+    sphere_type = bpy.context.scene.ds_global_properties.sphere_type
+    if sphere_type == 'QUAD':
+        # Same number of segments around the equator as the UV sphere
+        sphere = quad_sphere_object("Sphere", max(1, size // 4))
+    else:
+        bpy.ops.mesh.primitive_uv_sphere_add(segments=size, ring_count=size)
+        sphere = owned(bpy.context.active_object)
+        owned(sphere.data)
+    sphere.data["ds_sphere_type"] = sphere_type
+    sphere.data["ds_segments"] = size
     
     sphere.data.materials.append(mat)
     sphere.data.materials[0] = mat
     return sphere
+
+
+# Builds a quad sphere object with bulk foreach_set calls, which stays fast up to millions of
+# faces where from_pydata would loop over every vertex in Python
+def quad_sphere_object(name, subdivisions, elevation=None, displacement=0.0):
+    vertices, quads, uvs = mesh.sphere_mesh(subdivisions, elevation, displacement)
+    data = owned(bpy.data.meshes.new(name))
+    data.vertices.add(len(vertices))
+    data.vertices.foreach_set("co", vertices.astype(np.float32).ravel())
+    data.loops.add(quads.size)
+    data.loops.foreach_set("vertex_index", quads.astype(np.int32).ravel())
+    data.polygons.add(len(quads))
+    data.polygons.foreach_set("loop_start", np.arange(0, quads.size, 4, dtype=np.int32))
+    data.uv_layers.new(name="UVMap").data.foreach_set("uv", uvs.astype(np.float32).ravel())
+    data.update(calc_edges=True)
+    data.shade_smooth()
+    data["ds_subdivisions"] = subdivisions
+
+    sphere = owned(bpy.data.objects.new(name, data))
+    bpy.context.collection.objects.link(sphere)
+    bpy.context.view_layer.objects.active = sphere
+    sphere.select_set(True)
+    return sphere
+
+
+def elevation_values(props):
+    if not (props.enable_elevation and props.elevation_map):
+        return None
+    return generated_values(props, "elevation")
+
+
+# Moves the vertices of a quad sphere along their direction by the displacement times the
+# elevation shown by the material. UV spheres are left untouched.
+def displace_sphere(props):
+    sphere = props.sphere
+    if sphere is None or "ds_subdivisions" not in sphere.data:
+        return
+    data = sphere.data
+    vertices = np.empty(len(data.vertices) * 3, dtype=np.float32)
+    data.vertices.foreach_get("co", vertices)
+    vertices = vertices.reshape(-1, 3).astype(np.float64)
+    vertices /= np.linalg.norm(vertices, axis=1)[:, None]
+    vertices = mesh.displace(vertices, elevation_values(props), props.displacement)
+    data.vertices.foreach_set("co", vertices.astype(np.float32).ravel())
+    data.update()
     
 
 def set_image_texture(mat, node_name, image):
@@ -257,12 +1101,13 @@ def bake_mat_to_image(name, mat, target_node, texture_size, bake_type):
 
     nodes = mat.node_tree.nodes
     baked_normal_node = target_node
-    baked_normal_node.image = bpy.data.images.new(name, width=texture_size, height=texture_size)
+    baked_normal_node.image = pooled_image(name, texture_size, texture_size)
     baked_normal_node.select = True
     nodes.active = baked_normal_node
     bpy.ops.object.select_all(action="SELECT")
-    bpy.ops.object.bake(type=bake_type)
-    bpy.data.objects.remove(plane)
+    with instrument.stage("bake_" + bake_type.lower(), texture_size * texture_size):
+        bpy.ops.object.bake(type=bake_type)
+    bpy.data.batch_remove([plane, plane.data])
     bpy.context.scene.render.engine = 'BLENDER_EEVEE'
     bpy.context.view_layer.objects.active = None
     bpy.context.view_layer.objects.active = bpy.context.scene.ds_global_properties.sphere
@@ -275,6 +1120,7 @@ class DS_GlobalProperties(bpy.types.PropertyGroup):
     def toggle_elevation_callback(self, context):
         scene = context.scene
         if scene.ds_global_properties.enable_elevation:
+            restore_stored_layer(scene.ds_global_properties, "elevation")
             if scene.ds_global_properties.elevation_map != None and scene.ds_global_properties.normal_map != None:
                 set_image_texture(scene.ds_global_properties.sphere_material, "ElevationNode", scene.ds_global_properties.elevation_map)
                 set_image_texture(scene.ds_global_properties.sphere_material, "NormalNode", scene.ds_global_properties.normal_map)
@@ -286,6 +1132,7 @@ class DS_GlobalProperties(bpy.types.PropertyGroup):
     def toggle_humidity_callback(self, context):
         scene = context.scene
         if scene.ds_global_properties.enable_humidity:
+            restore_stored_layer(scene.ds_global_properties, "humidity")
             if scene.ds_global_properties.humidity_map != None:
                 set_image_texture(scene.ds_global_properties.sphere_material, "HumidityNode", scene.ds_global_properties.humidity_map)
         else:
@@ -295,6 +1142,7 @@ class DS_GlobalProperties(bpy.types.PropertyGroup):
     def toggle_cloud_callback(self, context):
         scene = context.scene
         if scene.ds_global_properties.enable_cloud:
+            restore_stored_layer(scene.ds_global_properties, "cloud")
             if scene.ds_global_properties.cloud_map != None:
                 set_image_texture(scene.ds_global_properties.sphere_material, "CloudNode", scene.ds_global_properties.cloud_map)
         else:
@@ -311,34 +1159,152 @@ class DS_GlobalProperties(bpy.types.PropertyGroup):
     sphere_normal_material: bpy.props.PointerProperty(type=bpy.types.Material) 
     
     purge_toggle: bpy.props.BoolProperty(name="Purge", default=True)
-    planet_details: bpy.props.IntProperty(name="Planet Segments", default=128, min=4, max=1024)
+    purge_scope: bpy.props.EnumProperty(name="Purge Scope", items=[
+        ('OWNED', "Dust Speck Data", "Only remove the objects, meshes, materials and images created by Dust Speck"),
+        ('ALL', "Everything", "Remove every object, mesh, material, node group, texture, image and camera of the file"),
+    ], default='OWNED')
+    reuse_data: bpy.props.BoolProperty(name="Reuse Data", description="Keep the existing materials, sphere and maps when they still match the settings instead of recreating them", default=True)
+    planet_details: bpy.props.IntProperty(name="Planet Segments", default=128, min=4, max=4096)
+    sphere_type: bpy.props.EnumProperty(name="Sphere Mesh", items=[
+        ('QUAD', "Quad Sphere", "Cube faces projected on the sphere, evenly sized quads built in bulk"),
+        ('UV', "UV Sphere", "Blender UV sphere, with triangle fans at the poles"),
+    ], default='QUAD')
+    displacement: bpy.props.FloatProperty(name="Displacement", description="Vertex displacement of the quad sphere at full elevation, in planet radii", default=0.0, min=0.0, max=1.0, update=lambda self, context: displace_sphere(self))
+    workers: bpy.props.IntProperty(name="Worker Processes", description="Processes used to generate maps (0 uses every core)", default=0, min=0, max=256)
+    use_cache: bpy.props.BoolProperty(name="Cache Maps", description="Reuse previously generated maps with identical settings", default=True)
+    cache_size: bpy.props.IntProperty(name="Cache Size (MB)", default=2048, min=0, max=1048576)
+    cache_folder: bpy.props.StringProperty(name="Cache Folder", description="Defaults to the system temporary folder", default="", subtype='DIR_PATH')
+    reuse_octaves: bpy.props.BoolProperty(name="Reuse Octaves", description="Keep raw octave layers in memory so amplitude, persistence and octave count changes only evaluate new octaves", default=True)
+    octave_cache_size: bpy.props.IntProperty(name="Octave Memory (MB)", default=1024, min=0, max=1048576)
+    store_maps: bpy.props.BoolProperty(name="Store Maps", description="Save the generated maps next to the .blend file as compressed float16 arrays and rebuild them when the file is opened", default=True)
+    octave_half_float: bpy.props.BoolProperty(name="Half Float Octaves", description="Store octave layers as float16, using a quarter of the memory at reduced precision", default=False)
+    noise_backend: bpy.props.EnumProperty(name="Noise Backend", description="Implementation evaluating the simplex noise, a backend that does not match the reference output is never used", items=noise_backend_items(), default=noise.AUTO, update=lambda self, context: noise.set_preference(self.noise_backend))
+    instrumentation: bpy.props.BoolProperty(name="Instrumentation", description="Record the time, pixel rate and memory change of every pipeline stage", default=False, update=lambda self, context: instrument.enable(self.instrumentation))
+    trace_file: bpy.props.StringProperty(name="Trace File", default="//dust_speck_trace.json", subtype='FILE_PATH')
+    trace_format: bpy.props.EnumProperty(name="Trace Format", items=[
+        ('JSON', "Stage Summary", "JSON totals per stage"),
+        ('CHROME', "Chrome Trace", "Every recorded stage, for chrome://tracing or Perfetto, with the totals"),
+    ], default='CHROME')
+    live_preview: bpy.props.BoolProperty(name="Live Preview", description="Show a low resolution preview on the sphere while generation settings are changed", default=False, update=lambda self, context: toggle_live_preview(self))
+    live_preview_size: bpy.props.IntProperty(name="Live Preview Size", description="Resolution of the live preview, 128 is computed in under 100 ms with 4 octaves", default=128, min=16, max=512)
+    sampling: bpy.props.EnumProperty(name="Sampling", items=[
+        ('EQUIRECT', "Equirectangular", "Sample the noise on the equirectangular grid of the maps"),
+        ('CUBE', "Cube Map", "Sample six cube faces with the same equator density and resample them, about 2.7 times fewer noise evaluations"),
+    ], default='EQUIRECT')
 
     enable_elevation: bpy.props.BoolProperty(name="Enable Elevation Map", default=True, update=toggle_elevation_callback)
     e_tex_size: bpy.props.IntProperty(name="Elevation Texture Size", default=128, min=32, max=8196)
-    e_num_octaves: bpy.props.IntProperty(name="Elevation Octaves", default=4, min=1, max=16)
-    e_frequency: bpy.props.FloatProperty(name="Elevation Frequency", default=1.0, min=0.0, max=10.0)
-    e_amplitude: bpy.props.FloatProperty(name="Elevation Amplitude", default=1.0, min=0.0, max=10.0)
-    e_lacunarity: bpy.props.FloatProperty(name="Elevation Lacunarity", default=2.0, min=0.0, max=10.0)
-    e_persistence: bpy.props.FloatProperty(name="Elevation Persistence", default=0.5, min=0.0, max=1.0)
+    e_num_octaves: bpy.props.IntProperty(name="Elevation Octaves", default=4, min=1, max=16, update=live_preview_update("elevation"))
+    e_frequency: bpy.props.FloatProperty(name="Elevation Frequency", default=1.0, min=0.0, max=10.0, update=live_preview_update("elevation"))
+    e_amplitude: bpy.props.FloatProperty(name="Elevation Amplitude", default=1.0, min=0.0, max=10.0, update=live_preview_update("elevation"))
+    e_lacunarity: bpy.props.FloatProperty(name="Elevation Lacunarity", default=2.0, min=0.0, max=10.0, update=live_preview_update("elevation"))
+    e_persistence: bpy.props.FloatProperty(name="Elevation Persistence", default=0.5, min=0.0, max=1.0, update=live_preview_update("elevation"))
+    e_seed: bpy.props.IntProperty(name="Elevation Seed", default=1, min=0, update=live_preview_update("elevation"))
+    normal_method: bpy.props.EnumProperty(name="Normal Map", items=[
+        ('CPU', "Direct", "Compute the normal map from the elevation gradients"),
+        ('BAKE', "Cycles Bake", "Bake the normal map from a bump node with Cycles"),
+    ], default='CPU')
+    normal_strength: bpy.props.FloatProperty(name="Normal Strength", description="Elevation units per planet radius used for the direct normal map", default=1.0, min=0.0, max=100.0)
     
     enable_humidity: bpy.props.BoolProperty(name="Enable Humidity Map", default=True, update=toggle_humidity_callback)
     h_tex_size: bpy.props.IntProperty(name="Humidity Texture Size", default=128, min=32, max=8196)
-    h_num_octaves: bpy.props.IntProperty(name="Humidity Octaves", default=1, min=1, max=16)
-    h_frequency: bpy.props.FloatProperty(name="Humidity Frequency", default=1.0, min=0.0, max=10.0)
-    h_amplitude: bpy.props.FloatProperty(name="Humidity Amplitude", default=1.0, min=0.0, max=10.0)
-    h_lacunarity: bpy.props.FloatProperty(name="Humidity Lacunarity", default=2.0, min=0.0, max=10.0)
-    h_persistence: bpy.props.FloatProperty(name="Humidity Persistence", default=0.5, min=0.0, max=1.0)
+    h_num_octaves: bpy.props.IntProperty(name="Humidity Octaves", default=1, min=1, max=16, update=live_preview_update("humidity"))
+    h_frequency: bpy.props.FloatProperty(name="Humidity Frequency", default=1.0, min=0.0, max=10.0, update=live_preview_update("humidity"))
+    h_amplitude: bpy.props.FloatProperty(name="Humidity Amplitude", default=1.0, min=0.0, max=10.0, update=live_preview_update("humidity"))
+    h_lacunarity: bpy.props.FloatProperty(name="Humidity Lacunarity", default=2.0, min=0.0, max=10.0, update=live_preview_update("humidity"))
+    h_persistence: bpy.props.FloatProperty(name="Humidity Persistence", default=0.5, min=0.0, max=1.0, update=live_preview_update("humidity"))
+    h_seed: bpy.props.IntProperty(name="Humidity Seed", default=2, min=0, update=live_preview_update("humidity"))
 
     enable_cloud: bpy.props.BoolProperty(name="Enable Cloud Map", default=True, update=toggle_cloud_callback)
     c_tex_size: bpy.props.IntProperty(name="Cloud Texture Size", default=128, min=32, max=8196)
-    c_num_octaves: bpy.props.IntProperty(name="Cloud Octaves", default=2, min=1, max=16)
-    c_frequency: bpy.props.FloatProperty(name="Cloud Frequency", default=1.0, min=0.0, max=10.0)
-    c_amplitude: bpy.props.FloatProperty(name="Cloud Amplitude", default=1.0, min=0.0, max=10.0)
-    c_lacunarity: bpy.props.FloatProperty(name="Cloud Lacunarity", default=2.0, min=0.0, max=10.0)
-    c_persistence: bpy.props.FloatProperty(name="Cloud Persistence", default=0.5, min=0.0, max=1.0)
+    c_num_octaves: bpy.props.IntProperty(name="Cloud Octaves", default=2, min=1, max=16, update=live_preview_update("cloud"))
+    c_frequency: bpy.props.FloatProperty(name="Cloud Frequency", default=1.0, min=0.0, max=10.0, update=live_preview_update("cloud"))
+    c_amplitude: bpy.props.FloatProperty(name="Cloud Amplitude", default=1.0, min=0.0, max=10.0, update=live_preview_update("cloud"))
+    c_lacunarity: bpy.props.FloatProperty(name="Cloud Lacunarity", default=2.0, min=0.0, max=10.0, update=live_preview_update("cloud"))
+    c_persistence: bpy.props.FloatProperty(name="Cloud Persistence", default=0.5, min=0.0, max=1.0, update=live_preview_update("cloud"))
+    c_seed: bpy.props.IntProperty(name="Cloud Seed", default=3, min=0, update=live_preview_update("cloud"))
+    cloud_animation: bpy.props.BoolProperty(name="Animated Clouds", description="Show the generated cloud frame of the current scene frame on the sphere", default=False, update=lambda self, context: toggle_cloud_animation(self, context))
+    cloud_speed: bpy.props.FloatProperty(name="Cloud Speed", description="Noise units the clouds drift per frame at the base frequency", default=animation.DEFAULT_SPEED, min=0.0, max=1.0, precision=3)
+    cloud_sequence_folder: bpy.props.StringProperty(name="Cloud Frames Folder", description="Folder of the <prefix>_cloud_<frame>.png image sequence", default="//clouds/", subtype='DIR_PATH')
+    cloud_ring_frames: bpy.props.IntProperty(name="Cached Frames", description="Cloud frames kept in memory for scrubbing the timeline", default=animation.DEFAULT_RING_FRAMES, min=1, max=1024)
 
     export_prefix: bpy.props.StringProperty(name="File Name Prefix", default="")
+    diffuse_method: bpy.props.EnumProperty(name="Diffuse Map", items=[
+        ('COMPOSITE', "Direct", "Evaluate the material colors on the generated maps"),
+        ('BAKE', "Cycles Bake", "Bake the material colors with Cycles"),
+    ], default='COMPOSITE')
     export_folder: bpy.props.StringProperty(name="Export Folder", default="", subtype='DIR_PATH')
+    export_mode: bpy.props.EnumProperty(name="Export Mode", items=[
+        ('IMAGE', "Images", "Save the generated images"),
+        ('STREAM', "Streaming", "Generate and write every map strip by strip at the streaming size, without holding whole images in memory"),
+        ('PYRAMID', "Tiled Pyramid", "Write tiled mip levels of the diffuse, normal and elevation maps with an index file"),
+    ], default='IMAGE')
+    tile_size: bpy.props.IntProperty(name="Tile Size", default=256, min=16, max=8192)
+    pyramid_filter: bpy.props.EnumProperty(name="Downsampling", items=[
+        ('BOX', "Box", "Average 2x2 texels"),
+        ('LANCZOS', "Lanczos", "Lanczos-3 filter, sharper coarse levels"),
+    ], default='BOX')
+    finer_levels: bpy.props.IntProperty(name="Finer Levels", description="Levels above the map resolution, whose tiles are generated on demand from the noise settings", default=0, min=0, max=8)
+    stream_size: bpy.props.IntProperty(name="Streaming Size", description="Size of the streamed maps, every layer is sampled at this size", default=16384, min=32, max=65536)
+    stream_format: bpy.props.EnumProperty(name="Streaming Format", items=[
+        ('PNG', "PNG 16-bit", "16-bit PNG, layers clipped to [0, 1] and diffuse colors in sRGB"),
+        ('EXR', "OpenEXR", "Float layers and half float linear colors"),
+        ('RAW', "Raw", "Float32 .npy arrays that can be memory mapped"),
+    ], default='PNG')
+    strip_memory: bpy.props.IntProperty(name="Strip Memory (MB)", description="Memory budget of a strip, per worker process", default=256, min=1, max=65536)
+    preset_folder: bpy.props.StringProperty(name="Preset Folder", description="Defaults to dust_speck_presets in the home folder", default="", subtype='DIR_PATH')
+    preset: bpy.props.EnumProperty(name="Preset", items=preset_enum_items)
+    preset_name: bpy.props.StringProperty(name="Preset Name", default="planet")
+    export_lods: bpy.props.BoolProperty(name="Export LODs", description="Also export the displaced quad sphere as OBJ meshes at each triangle budget", default=False)
+    lod_triangles: bpy.props.StringProperty(name="LOD Triangles", description="Comma separated triangle budgets of the exported meshes, finest first", default=", ".join(str(triangles) for triangles in mesh.DEFAULT_LOD_TRIANGLES))
+    export_format: bpy.props.EnumProperty(name="Image Format", items=[
+        ('PNG', "PNG", "8-bit PNG, layers clipped to [0, 1] and diffuse colors in sRGB"),
+        ('PNG16', "PNG 16-bit", "16-bit PNG, layers clipped to [0, 1] and diffuse colors in sRGB"),
+        ('EXR', "OpenEXR", "Float layers and half float linear colors"),
+        ('RAW', "Raw", "Float32 .npy arrays that can be memory mapped"),
+    ], default='PNG')
+    export_compression: bpy.props.IntProperty(name="Compression", description="Deflate level of PNG and EXR maps, 0 stores them uncompressed", default=6, min=0, max=9)
+    export_cubemap: bpy.props.BoolProperty(name="Export Cube Faces", description="Also export the diffuse and normal maps of the six cube faces", default=False)
+
+
+def draw_export_status(layout):
+    if not export_jobs:
+        return
+    job = export_jobs[-1]
+    if not job.done:
+        layout.label(text="Writing maps: {}/{} ({:.1f}s)".format(job.completed, job.total, job.elapsed))
+    elif job.errors:
+        layout.label(text="Export failed: {}".format(job.errors[0]), icon='ERROR')
+    else:
+        layout.label(text="Exported {} maps in {:.2f}s".format(len(job.paths), job.elapsed))
+
+
+def draw_job_status(layout, layer):
+    job = active_jobs.get(layer)
+    if job is None:
+        return
+    eta = job.eta
+    row = layout.row()
+    if eta is None:
+        row.label(text="Generating: {:.0%}".format(job.progress))
+    else:
+        row.label(text="Generating: {:.0%} (ETA {:.0f}s)".format(job.progress, eta))
+    row.operator(DS_CancelGeneration.bl_idname).layer = layer
+
+
+# Stages shown in the panel, the slowest first
+PANEL_STAGES = 12
+
+
+def draw_stage_timings(layout):
+    box = layout.box()
+    stages = instrument.summary()
+    if not stages:
+        box.label(text="No stage recorded yet")
+    for entry in stages[:PANEL_STAGES]:
+        rate = "{:.2f} Mpx/s".format(entry["pixels_per_second"] / 1e6) if entry["pixels"] else "-"
+        memory = "{:+.1f} MB".format(entry["memory_delta"] / 2**20) if entry["memory_delta"] is not None else "memory n/a"
+        box.label(text="{}: {}x, {:.3f}s, {}, {}".format(entry["name"], entry["count"], entry["seconds"], rate, memory))
 
 
 class DS_Panel(bpy.types.Panel):
@@ -353,9 +1319,40 @@ class DS_Panel(bpy.types.Panel):
         scene = context.scene
         
         layout.label(text="Initialization settings")
-        layout.prop(scene.ds_global_properties, "planet_details", text="Planet Segments")
-        layout.prop(scene.ds_global_properties, "purge_toggle", text="Purge file")
+        sphere_row = layout.row()
+        sphere_row.prop(scene.ds_global_properties, "sphere_type", text="Sphere")
+        sphere_row.prop(scene.ds_global_properties, "planet_details", text="Planet Segments")
+        layout.prop(scene.ds_global_properties, "displacement", text="Displacement")
+        purge_row = layout.row()
+        purge_row.prop(scene.ds_global_properties, "purge_toggle", text="Purge file")
+        purge_row.prop(scene.ds_global_properties, "purge_scope", text="")
+        purge_row.prop(scene.ds_global_properties, "reuse_data", text="Reuse Data")
+        layout.prop(scene.ds_global_properties, "workers", text="Worker Processes")
+        noise_row = layout.row()
+        noise_row.prop(scene.ds_global_properties, "noise_backend", text="Noise")
+        noise_row.label(text=noise.describe())
+        cache_row = layout.row()
+        cache_row.prop(scene.ds_global_properties, "use_cache", text="Cache Maps")
+        cache_row.prop(scene.ds_global_properties, "cache_size", text="Cache Size (MB)")
+        layout.prop(scene.ds_global_properties, "cache_folder", text="Cache Folder")
+        octave_row = layout.row()
+        octave_row.prop(scene.ds_global_properties, "reuse_octaves", text="Reuse Octaves")
+        octave_row.prop(scene.ds_global_properties, "octave_cache_size", text="Octave Memory (MB)")
+        octave_row.prop(scene.ds_global_properties, "octave_half_float", text="Half Float")
+        layout.prop(scene.ds_global_properties, "sampling", text="Sampling")
+        layout.prop(scene.ds_global_properties, "store_maps", text="Store Maps With File")
+        image_count, image_memory = pooled_image_memory()
+        layout.label(text="Images: {} ({:.1f} MB), this session {} allocated, {} reused, {} freed".format(
+            image_count, image_memory / 2**20, image_stats["allocated"], image_stats["reused"], image_stats["freed"]))
         layout.operator(DS_Initialize.bl_idname)
+        layout.prop(scene.ds_global_properties, "instrumentation", text="Instrumentation")
+        if scene.ds_global_properties.instrumentation:
+            draw_stage_timings(layout)
+            trace_row = layout.row()
+            trace_row.prop(scene.ds_global_properties, "trace_file", text="")
+            trace_row.prop(scene.ds_global_properties, "trace_format", text="")
+            trace_row.operator(DS_SaveTrace.bl_idname)
+            trace_row.operator(DS_ResetTrace.bl_idname)
         layout.separator()
 
 
@@ -384,6 +1381,23 @@ class DS_Panel(bpy.types.Panel):
                         elif node.name == 'HumidityMixFac':
                             h_mix_factor = node
                 
+                live_row = layout.row()
+                live_row.prop(scene.ds_global_properties, "live_preview", text="Live Preview")
+                live_row.prop(scene.ds_global_properties, "live_preview_size", text="Size")
+                layout.operator(DS_GenerateAll.bl_idname)
+                layout.separator()
+
+                # Presets
+                layout.label(text="Preset Library")
+                layout.prop(scene.ds_global_properties, "preset_folder", text="Preset Folder")
+                load_row = layout.row()
+                load_row.prop(scene.ds_global_properties, "preset", text="Preset")
+                load_row.operator(DS_LoadPreset.bl_idname)
+                save_row = layout.row()
+                save_row.prop(scene.ds_global_properties, "preset_name", text="Name")
+                save_row.operator(DS_SavePreset.bl_idname)
+                layout.separator()
+
                 # Elevation map
                 layout.label(text="Elevation Map Settings")
                 layout.prop(scene.ds_global_properties, "enable_elevation", text="Enable Elevation Map")
@@ -401,7 +1415,13 @@ class DS_Panel(bpy.types.Panel):
                     row1.prop(scene.ds_global_properties, "e_amplitude", text="Amplitude")
                     row1.prop(scene.ds_global_properties, "e_lacunarity", text="Lacunarity")
                     row1.prop(scene.ds_global_properties, "e_persistence", text="Persistence")
+                    layout.prop(scene.ds_global_properties, "e_seed", text="Seed")
+                    normal_row = layout.row()
+                    normal_row.prop(scene.ds_global_properties, "normal_method", text="Normal Map")
+                    if scene.ds_global_properties.normal_method == 'CPU':
+                        normal_row.prop(scene.ds_global_properties, "normal_strength", text="Strength")
                     layout.operator(DS_GenerateElevation.bl_idname)
+                    draw_job_status(layout, "elevation")
                     # Edition settings (those are part of the material and do not need to be registered)
                     if scene.ds_global_properties.elevation_map:
                         layout.label(text="Edit Elevation Map")
@@ -425,7 +1445,9 @@ class DS_Panel(bpy.types.Panel):
                     row1.prop(scene.ds_global_properties, "h_amplitude", text="Amplitude")
                     row1.prop(scene.ds_global_properties, "h_lacunarity", text="Lacunarity")
                     row1.prop(scene.ds_global_properties, "h_persistence", text="Persistence")
+                    layout.prop(scene.ds_global_properties, "h_seed", text="Seed")
                     layout.operator(DS_GenerateHumidity.bl_idname)
+                    draw_job_status(layout, "humidity")
                     # Edition settings
                     if scene.ds_global_properties.humidity_map:
                         layout.label(text="Edit Humidity Map")
@@ -451,7 +1473,17 @@ class DS_Panel(bpy.types.Panel):
                     row1.prop(scene.ds_global_properties, "c_amplitude", text="Amplitude")
                     row1.prop(scene.ds_global_properties, "c_lacunarity", text="Lacunarity")
                     row1.prop(scene.ds_global_properties, "c_persistence", text="Persistence")
+                    layout.prop(scene.ds_global_properties, "c_seed", text="Seed")
                     layout.operator(DS_GenerateCloud.bl_idname)
+                    draw_job_status(layout, "cloud")
+                    animation_row = layout.row()
+                    animation_row.prop(scene.ds_global_properties, "cloud_animation", text="Animated")
+                    animation_row.prop(scene.ds_global_properties, "cloud_speed", text="Speed")
+                    animation_row.prop(scene.ds_global_properties, "cloud_ring_frames", text="Cached Frames")
+                    if scene.ds_global_properties.cloud_animation:
+                        layout.prop(scene.ds_global_properties, "cloud_sequence_folder", text="Frames Folder")
+                        layout.operator(DS_GenerateCloudAnimation.bl_idname)
+                        draw_job_status(layout, "cloud_animation")
                     if scene.ds_global_properties.cloud_map:
                             layout.label(text="Edit Cloud Map")
                             layout.template_color_ramp(c_color_ramp, "color_ramp", expand=True)
@@ -463,6 +1495,28 @@ class DS_Panel(bpy.types.Panel):
                 export_row.operator(DS_ExportMaps.bl_idname)
                 export_row.prop(scene.ds_global_properties, "export_prefix", text="File Name Prefix")
                 layout.prop(scene.ds_global_properties, "export_folder", text="Export Folder")
+                layout.prop(scene.ds_global_properties, "export_mode", text="Export Mode")
+                if scene.ds_global_properties.export_mode == 'STREAM':
+                    stream_row = layout.row()
+                    stream_row.prop(scene.ds_global_properties, "stream_size", text="Size")
+                    stream_row.prop(scene.ds_global_properties, "stream_format", text="Format")
+                    stream_row.prop(scene.ds_global_properties, "strip_memory", text="Strip Memory (MB)")
+                elif scene.ds_global_properties.export_mode == 'PYRAMID':
+                    pyramid_row = layout.row()
+                    pyramid_row.prop(scene.ds_global_properties, "tile_size", text="Tile Size")
+                    pyramid_row.prop(scene.ds_global_properties, "pyramid_filter", text="Downsampling")
+                    pyramid_row.prop(scene.ds_global_properties, "finer_levels", text="Finer Levels")
+                else:
+                    layout.prop(scene.ds_global_properties, "diffuse_method", text="Diffuse Map")
+                    format_row = layout.row()
+                    format_row.prop(scene.ds_global_properties, "export_format", text="Format")
+                    format_row.prop(scene.ds_global_properties, "export_compression", text="Compression")
+                    lod_row = layout.row()
+                    lod_row.prop(scene.ds_global_properties, "export_lods", text="Export LODs")
+                    lod_row.prop(scene.ds_global_properties, "lod_triangles", text="Triangles")
+                if scene.ds_global_properties.sampling == 'CUBE':
+                    layout.prop(scene.ds_global_properties, "export_cubemap", text="Export Cube Faces")
+                draw_export_status(layout)
 
 
 class DS_Initialize(bpy.types.Operator):
@@ -470,16 +1524,25 @@ class DS_Initialize(bpy.types.Operator):
     bl_label = "Initialize Dust Speck"
     
     def execute(self, context):
-        if(context.scene.ds_global_properties.purge_toggle):
-            purge_all()
-        context.scene.ds_global_properties.sphere_material = generate_final_material()
-        context.scene.ds_global_properties.sphere_normal_material = generate_normal_material()
+        props = context.scene.ds_global_properties
+        layer_values.clear()
+        keep = reusable_data(props) if props.reuse_data else []
+        if props.purge_toggle:
+            start = time.perf_counter()
+            removed = purge_all(props.purge_scope == 'OWNED', keep)
+            print("Purged {} datablocks in {:.3f}s".format(removed, time.perf_counter() - start))
+        if props.sphere_material not in keep:
+            props.sphere_material = generate_final_material()
+        if props.sphere_normal_material not in keep:
+            props.sphere_normal_material = generate_normal_material()
         
-        if context.scene.ds_global_properties.sphere:
-            bpy.data.meshes.remove(context.scene.ds_global_properties.sphere.data, do_unlink=True)
-            bpy.data.objects.remove(context.scene.ds_global_properties.sphere, do_unlink=True)
-        
-        context.scene.ds_global_properties.sphere = generate_final_sphere(context.scene.ds_global_properties.planet_details, context.scene.ds_global_properties.sphere_material)
+        if props.sphere not in keep:
+            if props.sphere:
+                bpy.data.batch_remove([props.sphere, props.sphere.data])
+            props.sphere = generate_final_sphere(props.planet_details, props.sphere_material)
+        elif props.sphere_material.name not in props.sphere.data.materials:
+            props.sphere.data.materials.clear()
+            props.sphere.data.materials.append(props.sphere_material)
         
         # Set object mode and viewport shading
         bpy.ops.object.mode_set(mode='OBJECT')
@@ -490,61 +1553,416 @@ class DS_Initialize(bpy.types.Operator):
     
 
 
-class DS_GenerateElevation(bpy.types.Operator):
-    bl_idname = "object.ds_generate_elevation"
-    bl_label = "Generate Elevation"
-    
-    def execute(self, context):
-        scene = context.scene
-        texture_size = scene.ds_global_properties.e_tex_size
-        normal_mat = scene.ds_global_properties.sphere_normal_material
-        final_mat = scene.ds_global_properties.sphere_material
-        elevation_num_octaves = scene.ds_global_properties.e_num_octaves
-        elevation_frequency = scene.ds_global_properties.e_frequency
-        elevation_amplitude = scene.ds_global_properties.e_amplitude
-        elevation_lacunarity = scene.ds_global_properties.e_lacunarity
-        elevation_persistence = scene.ds_global_properties.e_persistence
-
-        scene.ds_global_properties.elevation_map = generate_fractal_map("elevation", texture_size, elevation_num_octaves, elevation_frequency, elevation_amplitude, elevation_lacunarity, elevation_persistence)
+# Assign a generated layer image to the material, shared by the layer operators and DS_GenerateAll
+def finish_elevation(context, image, noise_texture):
+    scene = context.scene
+    normal_mat = scene.ds_global_properties.sphere_normal_material
+    final_mat = scene.ds_global_properties.sphere_material
+
+    set_layer_map(scene.ds_global_properties, "elevation", image, noise_texture)
+    stored_layers["pending"].discard("elevation")
+    if scene.ds_global_properties.normal_method == 'BAKE':
         set_image_texture(normal_mat, "ImageNode", scene.ds_global_properties.elevation_map)
         normal_map_output_node = next((node for node in normal_mat.node_tree.nodes if node.name == 'NormalOutput'), None)
         scene.ds_global_properties.normal_map = bake_mat_to_image("NormalMap", normal_mat, normal_map_output_node, scene.ds_global_properties.e_tex_size, 'NORMAL')
-        set_image_texture(final_mat, "ElevationNode", scene.ds_global_properties.elevation_map)
-        set_image_texture(final_mat, "NormalNode", scene.ds_global_properties.normal_map)
+    else:
+        scene.ds_global_properties.normal_map = normal_map_to_image(noise_texture, scene.ds_global_properties.e_tex_size, scene.ds_global_properties.normal_strength)
+    set_image_texture(final_mat, "ElevationNode", scene.ds_global_properties.elevation_map)
+    set_image_texture(final_mat, "NormalNode", scene.ds_global_properties.normal_map)
+    displace_sphere(scene.ds_global_properties)
+
+
+def finish_humidity(context, image, noise_texture):
+    scene = context.scene
+    set_layer_map(scene.ds_global_properties, "humidity", image, noise_texture)
+    stored_layers["pending"].discard("humidity")
+    set_image_texture(scene.ds_global_properties.sphere_material, "HumidityNode", scene.ds_global_properties.humidity_map)
+
+
+def finish_cloud(context, image, noise_texture):
+    scene = context.scene
+    set_layer_map(scene.ds_global_properties, "cloud", image, noise_texture)
+    stored_layers["pending"].discard("cloud")
+    set_image_texture(scene.ds_global_properties.sphere_material, "CloudNode", scene.ds_global_properties.cloud_map)
+
+
+# Material node and finish function of each layer
+LAYER_NODES = {"elevation": "ElevationNode", "humidity": "HumidityNode", "cloud": "CloudNode"}
+LAYER_FINISHERS = {"elevation": finish_elevation, "humidity": finish_humidity, "cloud": finish_cloud}
+
+
+# Shared logic of the DS_Generate* operators. Cached maps are applied immediately. Otherwise a
+# low resolution preview is shown on the sphere right away and refined in place, band by
+# band, while the full resolution map is computed by a background job.
+class DS_GenerateMap:
+    layer = ""
+    node_name = ""
+
+    def execute(self, context):
+        props = context.scene.ds_global_properties
+        if self.layer in active_jobs:
+            self.report({'WARNING'}, "The {} map is already being generated".format(self.layer))
+            return {'CANCELLED'}
+
+        self._settings = layer_settings(props, self.layer)
+        texture_size = self._settings[1]
+        noise_texture = load_cached_map(self.layer, self._settings)
+        # Modal timers never fire in background mode, generate synchronously instead
+        if noise_texture is None and bpy.app.background:
+            noise_texture = fractal_map_generator(self.layer, self._settings)()
+            store_cached_map(self.layer, self._settings, noise_texture)
+        if noise_texture is not None:
+            self.finish(context, noise_to_image(noise_texture, texture_size, layer_role(self.layer)), noise_texture)
+            return {'FINISHED'}
+
+        shape = fractal.grid_shape(texture_size)
+        self._pixels = noise_to_rgba(preview_fractal_noise(self.layer, self._settings, shape))
+        self._image = pooled_image(preview_role(layer_role(self.layer)), texture_size, texture_size)
+        update_image_pixels(self._image, self._pixels)
+        image_node = props.sphere_material.node_tree.nodes.get(self.node_name)
+        self._previous_image = image_node.image if image_node else None
+        set_image_texture(props.sphere_material, self.node_name, self._image)
+        self._last_refresh = time.perf_counter()
+
+        # Cube bands cannot refine the equirectangular preview, they only report progress
+        self._refine = props.sampling == 'EQUIRECT'
+        rows = shape[0] if self._refine else fractal.cube_shape(fractal.cube_face_size(texture_size))[0]
+        self._job = jobs.MapJob(self.layer, rows).start(fractal_map_generator(self.layer, self._settings))
+        active_jobs[self.layer] = self._job
+        self._timer = context.window_manager.event_timer_add(0.1, window=context.window)
+        context.window_manager.modal_handler_add(self)
+        return {'RUNNING_MODAL'}
+
+    def modal(self, context, event):
+        if event.type == 'ESC':
+            self._job.cancel()
+        if event.type != 'TIMER':
+            return {'PASS_THROUGH'}
+
+        bands = self._job.take_bands()
+        if not self._refine:
+            bands = []
+        for start, stop, values in bands:
+            self._pixels[start:stop, :, :3] = values[:, :, None]
+        now = time.perf_counter()
+        if bands and now - self._last_refresh >= REFRESH_INTERVAL:
+            update_image_pixels(self._image, self._pixels)
+            self._last_refresh = now
+        redraw_view3d(context)
+        if not self._job.done:
+            return {'PASS_THROUGH'}
+
+        context.window_manager.event_timer_remove(self._timer)
+        del active_jobs[self.layer]
+        props = context.scene.ds_global_properties
+        if self._job.error is not None:
+            set_image_texture(props.sphere_material, self.node_name, self._previous_image)
+            if isinstance(self._job.error, fractal.GenerationCancelled):
+                self.report({'INFO'}, "Generation of the {} map was cancelled".format(self.layer))
+            else:
+                self.report({'ERROR'}, "Generation of the {} map failed: {}".format(self.layer, self._job.error))
+            return {'CANCELLED'}
+
+        store_cached_map(self.layer, self._settings, self._job.result)
+        self._pixels[:, :, :3] = self._job.result[:, :, None]
+        update_image_pixels(self._image, self._pixels)
+        self.finish(context, promote_image(self._image, layer_role(self.layer)), self._job.result)
         return {'FINISHED'}
+
+
+class DS_GenerateElevation(DS_GenerateMap, bpy.types.Operator):
+    bl_idname = "object.ds_generate_elevation"
+    bl_label = "Generate Elevation"
+    layer = "elevation"
+    node_name = "ElevationNode"
+
+    def finish(self, context, image, noise_texture):
+        finish_elevation(context, image, noise_texture)
     
 
-class DS_GenerateHumidity(bpy.types.Operator):
+class DS_GenerateHumidity(DS_GenerateMap, bpy.types.Operator):
     bl_idname = "object.ds_generate_humidity"
     bl_label = "Generate Humidity"
-    
-    def execute(self, context):
-        scene = context.scene
-        texture_size = scene.ds_global_properties.h_tex_size
-        humidity_num_octaves = scene.ds_global_properties.h_num_octaves
-        humidity_frequency = scene.ds_global_properties.h_frequency
-        humidity_amplitude = scene.ds_global_properties.h_amplitude
-        humidity_lacunarity = scene.ds_global_properties.h_lacunarity
-        humidity_persistence = scene.ds_global_properties.h_persistence
-        scene.ds_global_properties.humidity_map = generate_fractal_map("humidity", texture_size, humidity_num_octaves, humidity_frequency, humidity_amplitude, humidity_lacunarity, humidity_persistence)
-        set_image_texture(scene.ds_global_properties.sphere_material, "HumidityNode", scene.ds_global_properties.humidity_map)
-        return {'FINISHED'}
+    layer = "humidity"
+    node_name = "HumidityNode"
 
+    def finish(self, context, image, noise_texture):
+        finish_humidity(context, image, noise_texture)
 
-class DS_GenerateCloud(bpy.types.Operator):
+
+class DS_GenerateCloud(DS_GenerateMap, bpy.types.Operator):
     bl_idname = "object.ds_generate_cloud"
     bl_label = "Generate Cloud"
-    
+    layer = "cloud"
+    node_name = "CloudNode"
+
+    def finish(self, context, image, noise_texture):
+        finish_cloud(context, image, noise_texture)
+
+
+# Generates the cloud layer of every frame of the scene range with 4D noise and writes the
+# image sequence. Frames are evaluated by the worker processes in the background and land in
+# the ring buffer as they complete; the sphere follows the current frame.
+class DS_GenerateCloudAnimation(bpy.types.Operator):
+    bl_idname = "object.ds_generate_cloud_animation"
+    bl_label = "Generate Cloud Frames"
+
     def execute(self, context):
         scene = context.scene
-        texture_size = scene.ds_global_properties.c_tex_size
-        cloud_num_octaves = scene.ds_global_properties.c_num_octaves
-        cloud_frequency = scene.ds_global_properties.c_frequency
-        cloud_amplitude = scene.ds_global_properties.c_amplitude
-        cloud_lacunarity = scene.ds_global_properties.c_lacunarity
-        cloud_persistence = scene.ds_global_properties.c_persistence
-        scene.ds_global_properties.cloud_map = generate_fractal_map("cloud", texture_size, cloud_num_octaves, cloud_frequency, cloud_amplitude, cloud_lacunarity, cloud_persistence)
-        set_image_texture(scene.ds_global_properties.sphere_material, "CloudNode", scene.ds_global_properties.cloud_map)
+        props = scene.ds_global_properties
+        if "cloud_animation" in active_jobs:
+            self.report({'WARNING'}, "Cloud frames are already being generated")
+            return {'CANCELLED'}
+
+        self._frames = list(range(scene.frame_start, scene.frame_end + 1))
+        self._ring = get_cloud_ring(props)
+        self._ring.clear()
+        generate = cloud_frames_generator(props, self._frames)
+        # Modal timers never fire in background mode, generate synchronously instead
+        if bpy.app.background:
+            paths = generate(on_band=lambda start, stop, values: self._ring.put(self._frames[start], values))
+            show_cloud_frame(scene)
+            self.report({'INFO'}, "Wrote {} cloud frames".format(len(paths)))
+            return {'FINISHED'}
+
+        self._job = jobs.MapJob("cloud_animation", len(self._frames)).start(generate)
+        active_jobs["cloud_animation"] = self._job
+        self._timer = context.window_manager.event_timer_add(0.1, window=context.window)
+        context.window_manager.modal_handler_add(self)
+        return {'RUNNING_MODAL'}
+
+    def modal(self, context, event):
+        if event.type == 'ESC':
+            self._job.cancel()
+        if event.type != 'TIMER':
+            return {'PASS_THROUGH'}
+
+        scene = context.scene
+        for start, stop, values in self._job.take_bands():
+            self._ring.put(self._frames[start], values)
+            if self._frames[start] == scene.frame_current and scene.ds_global_properties.cloud_animation:
+                show_cloud_frame(scene)
+        redraw_view3d(context)
+        if not self._job.done:
+            return {'PASS_THROUGH'}
+
+        context.window_manager.event_timer_remove(self._timer)
+        del active_jobs["cloud_animation"]
+        if self._job.error is not None:
+            if isinstance(self._job.error, fractal.GenerationCancelled):
+                self.report({'INFO'}, "Generation of the cloud frames was cancelled")
+            else:
+                self.report({'ERROR'}, "Generation of the cloud frames failed: {}".format(self._job.error))
+            return {'CANCELLED'}
+        self.report({'INFO'}, "Wrote {} cloud frames in {:.1f}s".format(len(self._job.result), time.perf_counter() - self._job.started))
+        return {'FINISHED'}
+
+
+# Generates every enabled layer. Layers sharing a texture size are evaluated by a single
+# fused job (fractal.generate_fractal_layers), which computes the grid once and shares the
+# simplex lattice between octaves of equal frequency. Octave reuse is not used here.
+class DS_GenerateAll(bpy.types.Operator):
+    bl_idname = "object.ds_generate_all"
+    bl_label = "Generate All"
+
+    def execute(self, context):
+        props = context.scene.ds_global_properties
+        layers = [layer for layer in LAYER_NODES if getattr(props, "enable_" + layer)]
+        busy = [layer for layer in layers if layer in active_jobs]
+        if busy:
+            self.report({'WARNING'}, "The {} map is already being generated".format(busy[0]))
+            return {'CANCELLED'}
+
+        groups = {}
+        for layer in layers:
+            settings = layer_settings(props, layer)
+            noise_texture = load_cached_map(layer, settings)
+            if noise_texture is not None:
+                LAYER_FINISHERS[layer](context, noise_to_image(noise_texture, settings[1], layer_role(layer)), noise_texture)
+            else:
+                groups.setdefault(settings[1], []).append((layer, settings))
+
+        # Modal timers never fire in background mode, generate synchronously instead
+        if bpy.app.background:
+            for group in groups.values():
+                for (layer, settings), noise_texture in zip(group, layer_maps_generator(group)()):
+                    store_cached_map(layer, settings, noise_texture)
+                    LAYER_FINISHERS[layer](context, noise_to_image(noise_texture, settings[1], layer_role(layer)), noise_texture)
+            return {'FINISHED'}
+        if not groups:
+            return {'FINISHED'}
+
+        # Cube bands cannot refine the equirectangular previews, they only report progress
+        self._refine = props.sampling == 'EQUIRECT'
+        self._groups = []
+        self._failed = []
+        for texture_size, group in groups.items():
+            shape = fractal.grid_shape(texture_size)
+            previews = []
+            for layer, settings in group:
+                pixels = noise_to_rgba(preview_fractal_noise(layer, settings, shape))
+                image = pooled_image(preview_role(layer_role(layer)), texture_size, texture_size)
+                update_image_pixels(image, pixels)
+                image_node = props.sphere_material.node_tree.nodes.get(LAYER_NODES[layer])
+                previews.append((pixels, image, image_node.image if image_node else None))
+                set_image_texture(props.sphere_material, LAYER_NODES[layer], image)
+            rows = shape[0] if self._refine else fractal.cube_shape(fractal.cube_face_size(texture_size))[0]
+            job = jobs.MapJob(" ".join(layer for layer, _ in group), rows).start(layer_maps_generator(group))
+            for layer, _ in group:
+                active_jobs[layer] = job
+            self._groups.append((group, previews, job))
+        self._last_refresh = time.perf_counter()
+        self._timer = context.window_manager.event_timer_add(0.1, window=context.window)
+        context.window_manager.modal_handler_add(self)
+        return {'RUNNING_MODAL'}
+
+    def modal(self, context, event):
+        if event.type == 'ESC':
+            for _, _, job in self._groups:
+                job.cancel()
+        if event.type != 'TIMER':
+            return {'PASS_THROUGH'}
+
+        now = time.perf_counter()
+        refresh = now - self._last_refresh >= REFRESH_INTERVAL
+        running = []
+        for group, previews, job in self._groups:
+            bands = job.take_bands()
+            if not self._refine:
+                bands = []
+            for start, stop, values in bands:
+                for (pixels, _, _), layer_values in zip(previews, values):
+                    pixels[start:stop, :, :3] = layer_values[:, :, None]
+            if bands and refresh:
+                for pixels, image, _ in previews:
+                    update_image_pixels(image, pixels)
+                self._last_refresh = now
+            if job.done:
+                self.finish_group(context, group, previews, job)
+            else:
+                running.append((group, previews, job))
+        self._groups = running
+        redraw_view3d(context)
+        if self._groups:
+            return {'PASS_THROUGH'}
+
+        context.window_manager.event_timer_remove(self._timer)
+        if self._failed:
+            return {'CANCELLED'}
+        return {'FINISHED'}
+
+    def finish_group(self, context, group, previews, job):
+        props = context.scene.ds_global_properties
+        for layer, _ in group:
+            del active_jobs[layer]
+        names = ", ".join(layer for layer, _ in group)
+        if job.error is not None:
+            for (layer, _), (_, image, previous_image) in zip(group, previews):
+                set_image_texture(props.sphere_material, LAYER_NODES[layer], previous_image)
+            self._failed.extend(layer for layer, _ in group)
+            if isinstance(job.error, fractal.GenerationCancelled):
+                self.report({'INFO'}, "Generation of the {} maps was cancelled".format(names))
+            else:
+                self.report({'ERROR'}, "Generation of the {} maps failed: {}".format(names, job.error))
+            return
+
+        for (layer, settings), (pixels, image, _), noise_texture in zip(group, previews, job.result):
+            store_cached_map(layer, settings, noise_texture)
+            pixels[:, :, :3] = noise_texture[:, :, None]
+            update_image_pixels(image, pixels)
+            LAYER_FINISHERS[layer](context, promote_image(image, layer_role(layer)), noise_texture)
+
+
+# Stores the scene settings, material ramps and the maps currently assigned to the material
+class DS_SavePreset(bpy.types.Operator):
+    bl_idname = "object.ds_save_preset"
+    bl_label = "Save Preset"
+
+    def execute(self, context):
+        props = context.scene.ds_global_properties
+        params = scene_planet_parameters(props, props.sphere_material)
+        params["name"] = props.preset_name
+        layer_maps = {layer: generated_values(props, layer) for layer in LAYER_NODES
+                      if getattr(props, "enable_" + layer) and getattr(props, layer + "_map")}
+        if "elevation" in layer_maps and props.normal_map:
+            layer_maps["normal"] = image_pixels(props.normal_map)[:, :, :3]
+        path = get_preset_library().save(params, layer_maps)
+        self.report({'INFO'}, "Saved preset {}".format(path))
+        return {'FINISHED'}
+
+
+# Applies a preset's settings and attaches its stored maps, no noise is evaluated. Layers
+# saved without a map keep their settings and can be generated as usual.
+class DS_LoadPreset(bpy.types.Operator):
+    bl_idname = "object.ds_load_preset"
+    bl_label = "Load Preset"
+
+    def execute(self, context):
+        props = context.scene.ds_global_properties
+        if props.preset == 'NONE':
+            self.report({'WARNING'}, "No preset found in the preset folder")
+            return {'CANCELLED'}
+        mat = props.sphere_material
+        params, bundle = get_preset_library().load(props.preset)
+        # Stored layers the preset replaces are not rebuilt when apply_planet_parameters enables them
+        stored_layers["pending"].difference_update(bundle)
+        apply_planet_parameters(props, mat, params)
+        # The preset maps replace any pending live preview
+        live_layers.clear()
+
+        for layer in LAYER_NODES:
+            if layer in bundle:
+                rows, cols = bundle[layer].shape
+                image = pooled_image(layer_role(layer), cols, rows)
+                update_image_pixels(image, noise_to_rgba(bundle[layer]))
+                set_layer_map(props, layer, image, bundle[layer])
+                if params["enable_" + layer]:
+                    set_image_texture(mat, LAYER_NODES[layer], image)
+        if "normal" in bundle:
+            rows, cols, _ = bundle["normal"].shape
+            pixels = np.ones((rows, cols, 4), dtype=np.float32)
+            pixels[:, :, :3] = bundle["normal"]
+            image = pooled_image("NormalMap", cols, rows, non_color=True)
+            update_image_pixels(image, pixels)
+            props.normal_map = image
+            if params["enable_elevation"]:
+                set_image_texture(mat, "NormalNode", image)
+        displace_sphere(props)
+        props.preset_name = params["name"]
+        self.report({'INFO'}, "Loaded preset {}".format(params["name"]))
+        return {'FINISHED'}
+
+
+class DS_SaveTrace(bpy.types.Operator):
+    bl_idname = "object.ds_save_trace"
+    bl_label = "Save"
+
+    def execute(self, context):
+        props = context.scene.ds_global_properties
+        path = instrument.write(bpy.path.abspath(props.trace_file), props.trace_format == 'CHROME')
+        self.report({'INFO'}, "Saved {} stages to {}".format(len(instrument.events()), path))
+        return {'FINISHED'}
+
+
+class DS_ResetTrace(bpy.types.Operator):
+    bl_idname = "object.ds_reset_trace"
+    bl_label = "Reset"
+
+    def execute(self, context):
+        instrument.reset()
+        return {'FINISHED'}
+
+
+class DS_CancelGeneration(bpy.types.Operator):
+    bl_idname = "object.ds_cancel_generation"
+    bl_label = "Cancel"
+
+    layer: bpy.props.StringProperty()
+
+    def execute(self, context):
+        job = active_jobs.get(self.layer)
+        if job:
+            job.cancel()
         return {'FINISHED'}
 
 
@@ -556,33 +1974,46 @@ class DS_ExportMaps(bpy.types.Operator):
         scene = context.scene
         export_folder = scene.ds_global_properties.export_folder
         export_prefix = scene.ds_global_properties.export_prefix
-        texture_size = scene.ds_global_properties.e_tex_size
+        texture_size = export_size(scene.ds_global_properties)
         mat = scene.ds_global_properties.sphere_material
         export_folder = scene.ds_global_properties.export_folder
         export_prefix = scene.ds_global_properties.export_prefix
-        if scene.ds_global_properties.enable_elevation and scene.ds_global_properties.elevation_map:
-            diffuse_output_node = next((node for node in mat.node_tree.nodes if node.name == 'DiffuseOutput'), None)
-            normal_output_node = next((node for node in mat.node_tree.nodes if node.name == 'NormalNode'), None)  
-            final_mix_node = next((node for node in mat.node_tree.nodes if node.name == 'CloudMix'), None)
-            bsdf_node = next((node for node in mat.node_tree.nodes if node.name == 'PlanetBSDF'), None)
-            material_output_node = next((node for node in mat.node_tree.nodes if node.name == 'PlanetOutput'), None)
-
-            links = mat.node_tree.links
-            links.new(final_mix_node.outputs['Color'], material_output_node.inputs['Surface'])
-
-            bake_mat_to_image("DiffuseMap", mat, diffuse_output_node, scene.ds_global_properties.e_tex_size, 'COMBINED')
-            if diffuse_output_node.image:
-                output_filepath = f"{export_folder}/{export_prefix}_diffuse_{texture_size}.png"
-                diffuse_output_node.image.save_render(filepath=output_filepath)
-            if normal_output_node.image:   
-                output_filepath = f"{export_folder}/{export_prefix}_normal_{texture_size}.png"
-                normal_output_node.image.save_render(filepath=output_filepath)
-
-            links.new(final_mix_node.outputs['Color'], bsdf_node.inputs['Base Color'])
-            links.new(bsdf_node.outputs['BSDF'], material_output_node.inputs['Surface'])
+        if scene.ds_global_properties.export_mode == 'STREAM':
+            props = scene.ds_global_properties
+            timings = stream.export_planet(scene_planet_parameters(props, mat), bpy.path.abspath(export_folder), props.stream_size,
+                                           props.stream_format.lower(), props.strip_memory * 2**20, props.workers)
+            self.report({'INFO'}, "Streamed {}x{} maps in {:.1f}s".format(props.stream_size, props.stream_size, sum(timings.values())))
+        elif scene.ds_global_properties.export_mode == 'PYRAMID' and has_generated_maps(scene.ds_global_properties):
+            props = scene.ds_global_properties
+            base = {
+                "diffuse": composite_diffuse_pixels(props, mat, texture_size),
+                "normal": image_pixels(props.normal_map) if props.enable_elevation and props.normal_map else None,
+                "elevation": elevation_values(props),
+            }
+            index = pyramid.build_pyramid(base, scene_planet_parameters(props, mat), bpy.path.abspath(export_folder), texture_size,
+                                          props.tile_size, props.pyramid_filter, props.finer_levels)
+            self.report({'INFO'}, "Exported a {} level pyramid".format(len(index["levels"])))
+        elif has_generated_maps(scene.ds_global_properties):
+            if any(not job.done for job in export_jobs):
+                self.report({'WARNING'}, "The previous export is still being written")
+                return {'CANCELLED'}
+            if scene.ds_global_properties.export_lods:
+                try:
+                    budgets = [int(triangles) for triangles in scene.ds_global_properties.lod_triangles.split(",") if triangles.strip()]
+                except ValueError:
+                    self.report({'ERROR'}, "LOD triangles must be whole numbers separated by commas, got \"{}\"".format(scene.ds_global_properties.lod_triangles))
+                    return {'CANCELLED'}
+            # Maps are encoded and written in the background once their pixels are copied
+            start_export(scene.ds_global_properties, mat, bpy.path.abspath(export_folder), export_prefix)
+            if scene.ds_global_properties.sampling == 'CUBE' and scene.ds_global_properties.export_cubemap:
+                export_cube_faces(scene.ds_global_properties, mat, bpy.path.abspath(export_folder), export_prefix)
+            if scene.ds_global_properties.export_lods:
+                props = scene.ds_global_properties
+                lods = mesh.write_lods(bpy.path.abspath(export_folder), export_prefix, elevation_values(props), props.displacement, budgets)
+                print("Exported LODs: " + ", ".join("{} triangles".format(lod["triangles"]) for lod in lods))
 
         else:
-            message = "Please generate an elevation map before attempting to export."
+            message = "Please generate a map before attempting to export."
             print(message)
             show_message_box(message)
 
@@ -596,9 +2027,20 @@ def register():
     bpy.utils.register_class(DS_GenerateElevation)
     bpy.utils.register_class(DS_GenerateHumidity)
     bpy.utils.register_class(DS_GenerateCloud)
+    bpy.utils.register_class(DS_GenerateCloudAnimation)
+    bpy.utils.register_class(DS_GenerateAll)
+    bpy.utils.register_class(DS_SavePreset)
+    bpy.utils.register_class(DS_LoadPreset)
+    bpy.utils.register_class(DS_SaveTrace)
+    bpy.utils.register_class(DS_ResetTrace)
+    bpy.utils.register_class(DS_CancelGeneration)
     bpy.utils.register_class(DS_ExportMaps)
     
     bpy.types.Scene.ds_global_properties = bpy.props.PointerProperty(type=DS_GlobalProperties)
+    bpy.app.handlers.frame_change_post.append(cloud_frame_handler)
+    bpy.app.handlers.save_pre.append(drop_packed_maps)
+    bpy.app.handlers.save_post.append(store_maps)
+    bpy.app.handlers.load_post.append(restore_maps)
 
 
 def unregister():
@@ -607,8 +2049,29 @@ def unregister():
     bpy.utils.unregister_class(DS_GenerateElevation)
     bpy.utils.unregister_class(DS_GenerateHumidity)
     bpy.utils.unregister_class(DS_GenerateCloud)
+    bpy.utils.unregister_class(DS_GenerateCloudAnimation)
+    bpy.utils.unregister_class(DS_GenerateAll)
+    bpy.utils.unregister_class(DS_SavePreset)
+    bpy.utils.unregister_class(DS_LoadPreset)
+    bpy.utils.unregister_class(DS_SaveTrace)
+    bpy.utils.unregister_class(DS_ResetTrace)
+    bpy.utils.unregister_class(DS_CancelGeneration)
     bpy.utils.unregister_class(DS_Panel)
     bpy.utils.unregister_class(DS_ExportMaps)
+    for job in active_jobs.values():
+        job.cancel()
+    if bpy.app.timers.is_registered(run_live_preview):
+        bpy.app.timers.unregister(run_live_preview)
+    for handlers, handler in ((bpy.app.handlers.frame_change_post, cloud_frame_handler), (bpy.app.handlers.save_pre, drop_packed_maps),
+                              (bpy.app.handlers.save_post, store_maps), (bpy.app.handlers.load_post, restore_maps)):
+        if handler in handlers:
+            handlers.remove(handler)
+    if bpy.app.timers.is_registered(poll_export_jobs):
+        bpy.app.timers.unregister(poll_export_jobs)
+    for job in export_jobs:
+        job.wait()
+    fractal.shutdown_pool()
+    octave_cache.clear()
     
     del bpy.types.Scene.ds_global_properties
     
@@ -0,0 +1,417 @@
+import numpy as np
+
+# Array port of OpenSimplex 3D noise (https://github.com/lmas/opensimplex, MIT license).
+# Every branch of opensimplex's scalar _noise3 is reproduced with masks and the
+# arithmetic is written in the same order, so for a given seed the output is
+# bit-for-bit identical to opensimplex.noise3 evaluated point by point.
+
+GRADIENTS3 = np.array([
+    -11, 4, 4, -4, 11, 4, -4, 4, 11,
+    11, 4, 4, 4, 11, 4, 4, 4, 11,
+    -11, -4, 4, -4, -11, 4, -4, -4, 11,
+    11, -4, 4, 4, -11, 4, 4, -4, 11,
+    -11, 4, -4, -4, 11, -4, -4, 4, -11,
+    11, 4, -4, 4, 11, -4, 4, 4, -11,
+    -11, -4, -4, -4, -11, -4, -4, -4, -11,
+    11, -4, -4, 4, -11, -4, 4, -4, -11,
+], dtype=np.int64)
+
+STRETCH_CONSTANT3 = -1.0 / 6
+SQUISH_CONSTANT3 = 1.0 / 3
+NORM_CONSTANT3 = 103
+
+
+def _overflow(x):
+    return (x + 2**63) % 2**64 - 2**63
+
+
+def init_permutation(seed):
+    perm = np.zeros(256, dtype=np.int64)
+    perm_grad_index3 = np.zeros(256, dtype=np.int64)
+    source = np.arange(256)
+    seed = _overflow(seed * 6364136223846793005 + 1442695040888963407)
+    seed = _overflow(seed * 6364136223846793005 + 1442695040888963407)
+    seed = _overflow(seed * 6364136223846793005 + 1442695040888963407)
+    for i in range(255, -1, -1):
+        seed = _overflow(seed * 6364136223846793005 + 1442695040888963407)
+        r = int((seed + 31) % (i + 1))
+        if r < 0:
+            r += i + 1
+        perm[i] = source[r]
+        perm_grad_index3[i] = int((perm[i] % (len(GRADIENTS3) / 3)) * 3)
+        source[r] = source[i]
+    return perm, perm_grad_index3
+
+
+def init_permutations(seeds):
+    tables = [init_permutation(seed) for seed in seeds]
+    return np.stack([perm for perm, _ in tables]), np.stack([perm_grad_index3 for _, perm_grad_index3 in tables])
+
+
+def _contribution(perm, perm_grad_index3, xsv, ysv, zsv, dx, dy, dz):
+    attn = 2 - dx * dx - dy * dy - dz * dz
+    if perm.ndim == 1:
+        index = perm_grad_index3[(perm[(perm[xsv & 0xFF] + ysv) & 0xFF] + zsv) & 0xFF]
+    else:
+        # One row of lookups per seed, the lattice geometry is shared
+        seeds = np.arange(perm.shape[0])[:, None]
+        index = perm_grad_index3[seeds, (perm[seeds, (perm[seeds, xsv & 0xFF] + ysv) & 0xFF] + zsv) & 0xFF]
+    extrapolation = GRADIENTS3[index] * dx + GRADIENTS3[index + 1] * dy + GRADIENTS3[index + 2] * dz
+    positive = attn > 0
+    attn *= attn
+    return np.where(positive, attn * attn * extrapolation, 0.0)
+
+
+def _select(mask, a, b):
+    return np.where(mask, a, b)
+
+
+def _noise3_lower(perm, perm_grad_index3, xsb, ysb, zsb, xins, yins, zins, in_sum, dx0, dy0, dz0):
+    # Inside the tetrahedron at (0,0,0)
+    S = SQUISH_CONSTANT3
+    a_point = np.full(xins.shape, 0x01)
+    a_score = xins
+    b_point = np.full(xins.shape, 0x02)
+    b_score = yins
+    swap_b = (a_score >= b_score) & (zins > b_score)
+    swap_a = ~swap_b & (a_score < b_score) & (zins > a_score)
+    b_score = _select(swap_b, zins, b_score)
+    b_point = _select(swap_b, 0x04, b_point)
+    a_score = _select(swap_a, zins, a_score)
+    a_point = _select(swap_a, 0x04, a_point)
+
+    wins = 1 - in_sum
+    near = (wins > a_score) | (wins > b_score)
+    c = _select(near, _select(b_score > a_score, b_point, a_point), a_point | b_point)
+    cx = (c & 0x01) == 0
+    cy = (c & 0x02) == 0
+    cz = (c & 0x04) == 0
+
+    # (0,0,0) is one of the closest two tetrahedral vertices
+    n_xsv0 = _select(cx, xsb - 1, xsb + 1)
+    n_xsv1 = _select(cx, xsb, xsb + 1)
+    n_dx0 = _select(cx, dx0 + 1, dx0 - 1)
+    n_dx1 = _select(cx, dx0, dx0 - 1)
+    n_ysv0 = _select(cy, _select(cx, ysb, ysb - 1), ysb + 1)
+    n_ysv1 = _select(cy, _select(cx, ysb - 1, ysb), ysb + 1)
+    n_dy0 = _select(cy, _select(cx, dy0, dy0 + 1), dy0 - 1)
+    n_dy1 = _select(cy, _select(cx, dy0 + 1, dy0), dy0 - 1)
+    n_zsv0 = _select(cz, zsb, zsb + 1)
+    n_zsv1 = _select(cz, zsb - 1, zsb + 1)
+    n_dz0 = _select(cz, dz0, dz0 - 1)
+    n_dz1 = _select(cz, dz0 + 1, dz0 - 1)
+
+    # (0,0,0) is not one of the closest two tetrahedral vertices
+    f_xsv0 = _select(cx, xsb, xsb + 1)
+    f_xsv1 = _select(cx, xsb - 1, xsb + 1)
+    f_dx0 = _select(cx, dx0 - 2 * S, dx0 - 1 - 2 * S)
+    f_dx1 = _select(cx, dx0 + 1 - S, dx0 - 1 - S)
+    f_ysv0 = _select(cy, ysb, ysb + 1)
+    f_ysv1 = _select(cy, ysb - 1, ysb + 1)
+    f_dy0 = _select(cy, dy0 - 2 * S, dy0 - 1 - 2 * S)
+    f_dy1 = _select(cy, dy0 + 1 - S, dy0 - 1 - S)
+    f_zsv0 = _select(cz, zsb, zsb + 1)
+    f_zsv1 = _select(cz, zsb - 1, zsb + 1)
+    f_dz0 = _select(cz, dz0 - 2 * S, dz0 - 1 - 2 * S)
+    f_dz1 = _select(cz, dz0 + 1 - S, dz0 - 1 - S)
+
+    ext0 = (_select(near, n_xsv0, f_xsv0), _select(near, n_ysv0, f_ysv0), _select(near, n_zsv0, f_zsv0),
+            _select(near, n_dx0, f_dx0), _select(near, n_dy0, f_dy0), _select(near, n_dz0, f_dz0))
+    ext1 = (_select(near, n_xsv1, f_xsv1), _select(near, n_ysv1, f_ysv1), _select(near, n_zsv1, f_zsv1),
+            _select(near, n_dx1, f_dx1), _select(near, n_dy1, f_dy1), _select(near, n_dz1, f_dz1))
+
+    dx1 = dx0 - 1 - S
+    dy1 = dy0 - 0 - S
+    dz1 = dz0 - 0 - S
+    dx2 = dx0 - 0 - S
+    dy2 = dy0 - 1 - S
+    dz2 = dz1
+    dx3 = dx2
+    dy3 = dy1
+    dz3 = dz0 - 1 - S
+
+    value = np.zeros(perm.shape[:-1] + xins.shape)
+    value += _contribution(perm, perm_grad_index3, xsb + 0, ysb + 0, zsb + 0, dx0, dy0, dz0)
+    value += _contribution(perm, perm_grad_index3, xsb + 1, ysb + 0, zsb + 0, dx1, dy1, dz1)
+    value += _contribution(perm, perm_grad_index3, xsb + 0, ysb + 1, zsb + 0, dx2, dy2, dz2)
+    value += _contribution(perm, perm_grad_index3, xsb + 0, ysb + 0, zsb + 1, dx3, dy3, dz3)
+    return value, ext0, ext1
+
+
+def _noise3_upper(perm, perm_grad_index3, xsb, ysb, zsb, xins, yins, zins, in_sum, dx0, dy0, dz0):
+    # Inside the tetrahedron at (1,1,1)
+    S = SQUISH_CONSTANT3
+    a_point = np.full(xins.shape, 0x06)
+    a_score = xins
+    b_point = np.full(xins.shape, 0x05)
+    b_score = yins
+    swap_b = (a_score <= b_score) & (zins < b_score)
+    swap_a = ~swap_b & (a_score > b_score) & (zins < a_score)
+    b_score = _select(swap_b, zins, b_score)
+    b_point = _select(swap_b, 0x03, b_point)
+    a_score = _select(swap_a, zins, a_score)
+    a_point = _select(swap_a, 0x03, a_point)
+
+    wins = 3 - in_sum
+    near = (wins < a_score) | (wins < b_score)
+    c = _select(near, _select(b_score < a_score, b_point, a_point), a_point & b_point)
+    cx = (c & 0x01) != 0
+    cy = (c & 0x02) != 0
+    cz = (c & 0x04) != 0
+
+    # (1,1,1) is one of the closest two tetrahedral vertices
+    n_xsv0 = _select(cx, xsb + 2, xsb)
+    n_xsv1 = _select(cx, xsb + 1, xsb)
+    n_dx0 = _select(cx, dx0 - 2 - 3 * S, dx0 - 3 * S)
+    n_dx1 = _select(cx, dx0 - 1 - 3 * S, dx0 - 3 * S)
+    n_ysv0 = _select(cy, _select(cx, ysb + 1, ysb + 1 + 1), ysb)
+    n_ysv1 = _select(cy, _select(cx, ysb + 1 + 1, ysb + 1), ysb)
+    n_dy0 = _select(cy, _select(cx, dy0 - 1 - 3 * S, dy0 - 1 - 3 * S - 1), dy0 - 3 * S)
+    n_dy1 = _select(cy, _select(cx, dy0 - 1 - 3 * S - 1, dy0 - 1 - 3 * S), dy0 - 3 * S)
+    n_zsv0 = _select(cz, zsb + 1, zsb)
+    n_zsv1 = _select(cz, zsb + 2, zsb)
+    n_dz0 = _select(cz, dz0 - 1 - 3 * S, dz0 - 3 * S)
+    n_dz1 = _select(cz, dz0 - 2 - 3 * S, dz0 - 3 * S)
+
+    # (1,1,1) is not one of the closest two tetrahedral vertices
+    f_xsv0 = _select(cx, xsb + 1, xsb)
+    f_xsv1 = _select(cx, xsb + 2, xsb)
+    f_dx0 = _select(cx, dx0 - 1 - S, dx0 - S)
+    f_dx1 = _select(cx, dx0 - 2 - 2 * S, dx0 - 2 * S)
+    f_ysv0 = _select(cy, ysb + 1, ysb)
+    f_ysv1 = _select(cy, ysb + 2, ysb)
+    f_dy0 = _select(cy, dy0 - 1 - S, dy0 - S)
+    f_dy1 = _select(cy, dy0 - 2 - 2 * S, dy0 - 2 * S)
+    f_zsv0 = _select(cz, zsb + 1, zsb)
+    f_zsv1 = _select(cz, zsb + 2, zsb)
+    f_dz0 = _select(cz, dz0 - 1 - S, dz0 - S)
+    f_dz1 = _select(cz, dz0 - 2 - 2 * S, dz0 - 2 * S)
+
+    ext0 = (_select(near, n_xsv0, f_xsv0), _select(near, n_ysv0, f_ysv0), _select(near, n_zsv0, f_zsv0),
+            _select(near, n_dx0, f_dx0), _select(near, n_dy0, f_dy0), _select(near, n_dz0, f_dz0))
+    ext1 = (_select(near, n_xsv1, f_xsv1), _select(near, n_ysv1, f_ysv1), _select(near, n_zsv1, f_zsv1),
+            _select(near, n_dx1, f_dx1), _select(near, n_dy1, f_dy1), _select(near, n_dz1, f_dz1))
+
+    dx3 = dx0 - 1 - 2 * S
+    dy3 = dy0 - 1 - 2 * S
+    dz3 = dz0 - 0 - 2 * S
+    dx2 = dx3
+    dy2 = dy0 - 0 - 2 * S
+    dz2 = dz0 - 1 - 2 * S
+    dx1 = dx0 - 0 - 2 * S
+    dy1 = dy3
+    dz1 = dz2
+
+    value = np.zeros(perm.shape[:-1] + xins.shape)
+    value += _contribution(perm, perm_grad_index3, xsb + 1, ysb + 1, zsb + 0, dx3, dy3, dz3)
+    value += _contribution(perm, perm_grad_index3, xsb + 1, ysb + 0, zsb + 1, dx2, dy2, dz2)
+    value += _contribution(perm, perm_grad_index3, xsb + 0, ysb + 1, zsb + 1, dx1, dy1, dz1)
+    value += _contribution(perm, perm_grad_index3, xsb + 1, ysb + 1, zsb + 1,
+                           dx0 - 1 - 3 * S, dy0 - 1 - 3 * S, dz0 - 1 - 3 * S)
+    return value, ext0, ext1
+
+
+def _noise3_middle(perm, perm_grad_index3, xsb, ysb, zsb, xins, yins, zins, in_sum, dx0, dy0, dz0):
+    # Inside the octahedron in between
+    S = SQUISH_CONSTANT3
+    p1 = xins + yins
+    a_far = p1 > 1
+    a_score = _select(a_far, p1 - 1, 1 - p1)
+    a_point = _select(a_far, 0x03, 0x04)
+
+    p2 = xins + zins
+    b_far = p2 > 1
+    b_score = _select(b_far, p2 - 1, 1 - p2)
+    b_point = _select(b_far, 0x05, 0x02)
+
+    p3 = yins + zins
+    p3_far = p3 > 1
+    score = _select(p3_far, p3 - 1, 1 - p3)
+    replace_a = (a_score <= b_score) & (a_score < score)
+    replace_b = (a_score > b_score) & (b_score < score)
+    a_point = _select(replace_a, _select(p3_far, 0x06, 0x01), a_point)
+    a_far = _select(replace_a, p3_far, a_far)
+    b_point = _select(replace_b, _select(p3_far, 0x06, 0x01), b_point)
+    b_far = _select(replace_b, p3_far, b_far)
+
+    same_side = a_far == b_far
+    far_side = same_side & a_far
+    near_side = same_side & ~a_far
+
+    # Both closest points on (1,1,1) side
+    c = a_point & b_point
+    c1x = (c & 0x01) != 0
+    c1y = ~c1x & ((c & 0x02) != 0)
+    c1z = ~c1x & ~c1y
+    far_ext0 = (xsb + 1, ysb + 1, zsb + 1, dx0 - 1 - 3 * S, dy0 - 1 - 3 * S, dz0 - 1 - 3 * S)
+    far_ext1 = (_select(c1x, xsb + 2, xsb), _select(c1y, ysb + 2, ysb), _select(c1z, zsb + 2, zsb),
+                _select(c1x, dx0 - 2 - 2 * S, dx0 - 2 * S),
+                _select(c1y, dy0 - 2 - 2 * S, dy0 - 2 * S),
+                _select(c1z, dz0 - 2 - 2 * S, dz0 - 2 * S))
+
+    # Both closest points on (0,0,0) side, or a permutation of (1,1,-1) on mixed sides
+    def permutation_of_one_one_minus_one(c):
+        cx = (c & 0x01) == 0
+        cy = ~cx & ((c & 0x02) == 0)
+        cz = ~cx & ~cy
+        return (_select(cx, xsb - 1, xsb + 1), _select(cy, ysb - 1, ysb + 1), _select(cz, zsb - 1, zsb + 1),
+                _select(cx, dx0 + 1 - S, dx0 - 1 - S),
+                _select(cy, dy0 + 1 - S, dy0 - 1 - S),
+                _select(cz, dz0 + 1 - S, dz0 - 1 - S))
+
+    near_ext0 = (xsb, ysb, zsb, dx0, dy0, dz0)
+    near_ext1 = permutation_of_one_one_minus_one(a_point | b_point)
+
+    # One point on (0,0,0) side, one point on (1,1,1) side
+    c1 = _select(a_far, a_point, b_point)
+    c2 = _select(a_far, b_point, a_point)
+    mixed_ext0 = permutation_of_one_one_minus_one(c1)
+    c2x = (c2 & 0x01) != 0
+    c2y = ~c2x & ((c2 & 0x02) != 0)
+    c2z = ~c2x & ~c2y
+    mixed_ext1 = (_select(c2x, xsb + 2, xsb), _select(c2y, ysb + 2, ysb), _select(c2z, zsb + 2, zsb),
+                  _select(c2x, dx0 - 2 * S - 2, dx0 - 2 * S),
+                  _select(c2y, dy0 - 2 * S - 2, dy0 - 2 * S),
+                  _select(c2z, dz0 - 2 * S - 2, dz0 - 2 * S))
+
+    ext0 = tuple(_select(far_side, f, _select(near_side, n, m)) for f, n, m in zip(far_ext0, near_ext0, mixed_ext0))
+    ext1 = tuple(_select(far_side, f, _select(near_side, n, m)) for f, n, m in zip(far_ext1, near_ext1, mixed_ext1))
+
+    dx1 = dx0 - 1 - S
+    dy1 = dy0 - 0 - S
+    dz1 = dz0 - 0 - S
+    dx2 = dx0 - 0 - S
+    dy2 = dy0 - 1 - S
+    dz2 = dz1
+    dx3 = dx2
+    dy3 = dy1
+    dz3 = dz0 - 1 - S
+    dx4 = dx0 - 1 - 2 * S
+    dy4 = dy0 - 1 - 2 * S
+    dz4 = dz0 - 0 - 2 * S
+    dx5 = dx4
+    dy5 = dy0 - 0 - 2 * S
+    dz5 = dz0 - 1 - 2 * S
+    dx6 = dx0 - 0 - 2 * S
+    dy6 = dy4
+    dz6 = dz5
+
+    value = np.zeros(perm.shape[:-1] + xins.shape)
+    value += _contribution(perm, perm_grad_index3, xsb + 1, ysb + 0, zsb + 0, dx1, dy1, dz1)
+    value += _contribution(perm, perm_grad_index3, xsb + 0, ysb + 1, zsb + 0, dx2, dy2, dz2)
+    value += _contribution(perm, perm_grad_index3, xsb + 0, ysb + 0, zsb + 1, dx3, dy3, dz3)
+    value += _contribution(perm, perm_grad_index3, xsb + 1, ysb + 1, zsb + 0, dx4, dy4, dz4)
+    value += _contribution(perm, perm_grad_index3, xsb + 1, ysb + 0, zsb + 1, dx5, dy5, dz5)
+    value += _contribution(perm, perm_grad_index3, xsb + 0, ysb + 1, zsb + 1, dx6, dy6, dz6)
+    return value, ext0, ext1
+
+
+# perm and perm_grad_index3 may also be stacked as (seeds, 256), as returned by
+# init_permutations, to evaluate several seeds on the same points at once. The lattice
+# geometry is then only computed once and the result has a leading seed axis.
+def noise3(x, y, z, perm, perm_grad_index3):
+    x = np.asarray(x, dtype=np.float64)
+    y = np.asarray(y, dtype=np.float64)
+    z = np.asarray(z, dtype=np.float64)
+    shape = np.broadcast(x, y, z).shape
+    x, y, z = (np.broadcast_to(a, shape).ravel() for a in (x, y, z))
+
+    # Place input coordinates on simplectic honeycomb
+    stretch_offset = (x + y + z) * STRETCH_CONSTANT3
+    xs = x + stretch_offset
+    ys = y + stretch_offset
+    zs = z + stretch_offset
+
+    xsb = np.floor(xs).astype(np.int64)
+    ysb = np.floor(ys).astype(np.int64)
+    zsb = np.floor(zs).astype(np.int64)
+
+    squish_offset = (xsb + ysb + zsb) * SQUISH_CONSTANT3
+    xb = xsb + squish_offset
+    yb = ysb + squish_offset
+    zb = zsb + squish_offset
+
+    xins = xs - xsb
+    yins = ys - ysb
+    zins = zs - zsb
+    in_sum = xins + yins + zins
+
+    dx0 = x - xb
+    dy0 = y - yb
+    dz0 = z - zb
+
+    value = np.empty(perm.shape[:-1] + x.shape)
+    lower = in_sum <= 1
+    upper = ~lower & (in_sum >= 2)
+    middle = ~lower & ~upper
+    for region, mask in ((_noise3_lower, lower), (_noise3_upper, upper), (_noise3_middle, middle)):
+        if not mask.any():
+            continue
+        args = (a[mask] for a in (xsb, ysb, zsb, xins, yins, zins, in_sum, dx0, dy0, dz0))
+        region_value, ext0, ext1 = region(perm, perm_grad_index3, *args)
+        region_value += _contribution(perm, perm_grad_index3, *ext0)
+        region_value += _contribution(perm, perm_grad_index3, *ext1)
+        value[..., mask] = region_value
+
+    return (value / NORM_CONSTANT3).reshape(perm.shape[:-1] + shape)
+
+
+# 4D simplex noise, used for the time axis of animated layers. OpenSimplex's 4D lattice is
+# far larger than its 3D one, this is the classic simplex construction (Gustavson, "Simplex
+# noise demystified") with the same seeded permutation table. Values lie within about
+# [-1, 1] and vary continuously along every axis.
+GRADIENTS4 = np.array([
+    (0, 1, 1, 1), (0, 1, 1, -1), (0, 1, -1, 1), (0, 1, -1, -1),
+    (0, -1, 1, 1), (0, -1, 1, -1), (0, -1, -1, 1), (0, -1, -1, -1),
+    (1, 0, 1, 1), (1, 0, 1, -1), (1, 0, -1, 1), (1, 0, -1, -1),
+    (-1, 0, 1, 1), (-1, 0, 1, -1), (-1, 0, -1, 1), (-1, 0, -1, -1),
+    (1, 1, 0, 1), (1, 1, 0, -1), (1, -1, 0, 1), (1, -1, 0, -1),
+    (-1, 1, 0, 1), (-1, 1, 0, -1), (-1, -1, 0, 1), (-1, -1, 0, -1),
+    (1, 1, 1, 0), (1, 1, -1, 0), (1, -1, 1, 0), (1, -1, -1, 0),
+    (-1, 1, 1, 0), (-1, 1, -1, 0), (-1, -1, 1, 0), (-1, -1, -1, 0),
+], dtype=np.float64)
+
+SKEW_CONSTANT4 = (np.sqrt(5.0) - 1) / 4
+UNSKEW_CONSTANT4 = (5 - np.sqrt(5.0)) / 20
+NORM_CONSTANT4 = 27.0
+
+
+def _contribution4(perm, i, j, k, l, dx, dy, dz, dw):
+    attn = 0.6 - dx * dx - dy * dy - dz * dz - dw * dw
+    index = perm[(i + perm[(j + perm[(k + perm[l & 0xFF]) & 0xFF]) & 0xFF]) & 0xFF] % len(GRADIENTS4)
+    gradient = GRADIENTS4[index]
+    extrapolation = gradient[:, 0] * dx + gradient[:, 1] * dy + gradient[:, 2] * dz + gradient[:, 3] * dw
+    positive = attn > 0
+    attn *= attn
+    return np.where(positive, attn * attn * extrapolation, 0.0)
+
+
+def noise4(x, y, z, w, perm):
+    x, y, z, w = (np.asarray(a, dtype=np.float64) for a in (x, y, z, w))
+    shape = np.broadcast(x, y, z, w).shape
+    x, y, z, w = (np.broadcast_to(a, shape).ravel() for a in (x, y, z, w))
+
+    # Skew to the lattice cell and unskew its origin back
+    skew = (x + y + z + w) * SKEW_CONSTANT4
+    i = np.floor(x + skew).astype(np.int64)
+    j = np.floor(y + skew).astype(np.int64)
+    k = np.floor(z + skew).astype(np.int64)
+    l = np.floor(w + skew).astype(np.int64)
+    unskew = (i + j + k + l) * UNSKEW_CONSTANT4
+    d = np.stack((x - (i - unskew), y - (j - unskew), z - (k - unskew), w - (l - unskew)))
+
+    # The simplex is found by ranking the offsets, the axis with the largest one is stepped
+    # first, ties go to the later axis so the ranks are always a permutation of 0..3
+    rank = np.zeros(d.shape, dtype=np.int64)
+    for a in range(4):
+        for b in range(a + 1, 4):
+            greater = d[a] > d[b]
+            rank[a] += greater
+            rank[b] += ~greater
+    value = _contribution4(perm, i, j, k, l, *d)
+    for step in (3, 2, 1):
+        offset = (rank >= step).astype(np.int64)
+        corner = d - offset + (4 - step) * UNSKEW_CONSTANT4
+        value += _contribution4(perm, i + offset[0], j + offset[1], k + offset[2], l + offset[3], *corner)
+    value += _contribution4(perm, i + 1, j + 1, k + 1, l + 1, *(d - 1 + 4 * UNSKEW_CONSTANT4))
+    return (NORM_CONSTANT4 * value).reshape(shape)
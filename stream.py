@@ -0,0 +1,202 @@
+import contextlib
+import json
+import os
+import time
+from collections import deque
+import numpy as np
+
+from . import exr
+from . import fractal
+from . import maps
+from . import planet
+from . import png
+
+FORMATS = {"png": ".png", "exr": ".exr", "raw": ".npy"}
+
+# Approximate bytes held per texel of a strip: the layer rows and noise temporaries, the
+# normal and diffuse buffers and the encoded rows of every output. Measured at about 600
+# bytes with the three layers enabled.
+STRIP_BYTES_PER_TEXEL = 640
+
+DEFAULT_STRIP_BYTES = 256 * 2**20
+
+
+def strip_rows(cols, strip_bytes):
+    return max(1, strip_bytes // (cols * STRIP_BYTES_PER_TEXEL))
+
+
+# Float32 .npy file written sequentially, which can then be opened with np.load(mmap_mode='r')
+class RawWriter:
+    def __init__(self, path, width, height, channels):
+        self.path = path
+        self.tmp_path = path + ".tmp"
+        self.height = height
+        self.rows_written = 0
+        shape = (height, width) if channels == 1 else (height, width, channels)
+        self.file = open(self.tmp_path, "wb")
+        np.lib.format.write_array_header_1_0(self.file, {"descr": "<f4", "fortran_order": False, "shape": shape})
+
+    def write_rows(self, pixels):
+        self.file.write(np.ascontiguousarray(pixels, dtype="<f4").tobytes())
+        self.rows_written += pixels.shape[0]
+
+    def close(self):
+        if self.rows_written != self.height:
+            raise ValueError("{} rows written to a {} rows array".format(self.rows_written, self.height))
+        self.file.close()
+        os.replace(self.tmp_path, self.path)
+
+    def abort(self):
+        self.file.close()
+        os.remove(self.tmp_path)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if exc_type is None:
+            self.close()
+        else:
+            self.abort()
+
+
+# PNG maps are 16-bit with the layers clipped to [0, 1] and the diffuse colors in sRGB.
+# EXR and raw maps keep the unclipped noise as float and linear diffuse colors. A zero
+# compression level stores PNG and EXR data uncompressed.
+def open_writer(kind, path, width, height, fmt, bit_depth=16, compression=6):
+    channels = 1 if kind in dict(planet.LAYERS) else 3
+    if fmt == "png":
+        return png.PNGWriter(path, width, height, channels, bit_depth, compression)
+    exr_compression = 'ZIPS' if compression else 'NONE'
+    if fmt == "exr":
+        if channels == 1:
+            return exr.EXRWriter(path, width, height, ("Y",), 'FLOAT', exr_compression)
+        return exr.EXRWriter(path, width, height, ("R", "G", "B"), 'HALF', exr_compression)
+    return RawWriter(path, width, height, channels)
+
+
+# Writes a whole map in Blender row order (south first) with the writer of its format,
+# strip by strip so the quantized copy stays small. Diffuse colors are given in sRGB like
+# the images of the add-on and written linear to EXR and raw files.
+def write_map(kind, path, pixels, fmt, bit_depth=16, compression=6, strip=256):
+    pixels = np.asarray(pixels)
+    if pixels.ndim == 3:
+        pixels = pixels[:, :, :3]
+    rows, cols = pixels.shape[:2]
+    with open_writer(kind, path, cols, rows, fmt, bit_depth, compression) as writer:
+        top_down = pixels[::-1]
+        for start in range(0, rows, strip):
+            values = top_down[start:start + strip]
+            if kind == "diffuse" and fmt != "png":
+                values = maps.srgb_to_linear(values)
+            writer.write_rows(values)
+    return path
+
+
+def output_paths(params, folder, size, fmt="png"):
+    paths = {}
+    for kind in planet.MAP_KINDS:
+        if kind in dict(planet.LAYERS) and not params["enable_" + kind]:
+            continue
+        if kind == "normal" and not params["enable_elevation"]:
+            continue
+        paths[kind] = os.path.join(folder, "{}_{}_{}{}".format(params["name"], kind, size, FORMATS[fmt]))
+    return paths
+
+
+# Noise rows of every enabled layer for rows [start, stop). The elevation rows carry one
+# extra row on each side for the normal map.
+def strip_layers(params, size, start, stop):
+    rows = fractal.grid_shape(size)[0]
+    layers = {}
+    for layer, _ in planet.LAYERS:
+        if params["enable_" + layer]:
+            seed, _, *octave_params = planet.layer_settings(params, layer)
+            first, last = (max(start - 1, 0), min(stop + 1, rows)) if layer == "elevation" else (start, stop)
+            layers[layer] = fractal.generate_fractal_rows(seed, size, first, last, *octave_params)
+    return layers
+
+
+# Yields the layers of every strip in order. With several workers at most workers + 1
+# strips are in flight, which keeps the memory bounded whatever the map size.
+def _strip_results(params, size, strips, workers):
+    if workers <= 1:
+        for start, stop in strips:
+            yield start, stop, strip_layers(params, size, start, stop)
+        return
+    executor = fractal.get_executor(workers)
+    pending = deque()
+    try:
+        for start, stop in strips:
+            pending.append((start, stop, executor.submit(strip_layers, params, size, start, stop)))
+            if len(pending) > workers:
+                start, stop, future = pending.popleft()
+                yield start, stop, future.result()
+        while pending:
+            start, stop, future = pending.popleft()
+            yield start, stop, future.result()
+    finally:
+        for _, _, future in pending:
+            future.cancel()
+
+
+def _write_strip(params, writers, fmt, rows, cols, start, stop, layers, timings):
+    maps_start = time.perf_counter()
+    values = {}
+    for layer, strip in layers.items():
+        first = max(start - 1, 0) if layer == "elevation" else start
+        values[layer] = strip[start - first:stop - first]
+
+    # Outputs are written north first, Blender rows go from the south pole up
+    outputs = {layer: value[::-1] for layer, value in values.items()}
+    if "normal" in writers:
+        outputs["normal"] = maps.normal_map_rows(np.clip(layers["elevation"], 0.0, 1.0), start, stop, rows, params["normal_strength"])[::-1, :, :3]
+    linear = [maps.srgb_to_linear(values[layer]) if layer in values else None for layer, _ in planet.LAYERS]
+    diffuse = maps.composite_diffuse((stop - start, cols), *linear, planet.material_parameters(params))[::-1, :, :3]
+    outputs["diffuse"] = maps.linear_to_srgb(diffuse) if fmt == "png" else diffuse
+    timings["maps"] += time.perf_counter() - maps_start
+
+    write_start = time.perf_counter()
+    for kind, writer in writers.items():
+        writer.write_rows(outputs[kind])
+    timings["write"] += time.perf_counter() - write_start
+
+
+# Generates and writes every map of a planet strip by strip at the given size, every layer
+# being sampled at that size. Peak memory is bounded by strip_bytes per strip in flight
+# instead of the map size, which allows maps beyond the sizes Blender images can hold.
+def export_planet(params, folder, size, fmt="png", strip_bytes=DEFAULT_STRIP_BYTES, workers=1, timings=None):
+    timings = {} if timings is None else timings
+    timings.update(noise=0.0, maps=0.0, write=0.0)
+    rows, cols = fractal.grid_shape(size)
+    band = strip_rows(cols, strip_bytes)
+    strips = [(max(stop - band, 0), stop) for stop in range(rows, 0, -band)]
+    workers = fractal.resolve_workers(workers)
+
+    os.makedirs(folder, exist_ok=True)
+    with contextlib.ExitStack() as stack:
+        writers = {kind: stack.enter_context(open_writer(kind, path, cols, rows, fmt)) for kind, path in output_paths(params, folder, size, fmt).items()}
+        noise_start = time.perf_counter()
+        for start, stop, layers in _strip_results(params, size, strips, workers):
+            timings["noise"] += time.perf_counter() - noise_start
+            _write_strip(params, writers, fmt, rows, cols, start, stop, layers, timings)
+            print("Exporting {} ({}x{}): {:.2%}".format(params["name"], cols, rows, float(rows - start)/rows), end='\r')
+            noise_start = time.perf_counter()
+    print("\n")
+    return timings
+
+
+def is_complete(params, folder, size, fmt="png"):
+    return os.path.exists(planet.timing_path(params, folder)) and all(os.path.exists(path) for path in output_paths(params, folder, size, fmt).values())
+
+
+def write_planet(params, folder, size, fmt="png", strip_bytes=DEFAULT_STRIP_BYTES, workers=1):
+    start = time.perf_counter()
+    timings = export_planet(params, folder, size, fmt, strip_bytes, workers)
+    timings["total"] = time.perf_counter() - start
+
+    summary = {"name": params["name"], "size": size, "format": fmt, "strip_rows": strip_rows(fractal.grid_shape(size)[1], strip_bytes), "timings": timings}
+    with open(planet.timing_path(params, folder) + ".tmp", "w") as f:
+        json.dump(summary, f, indent=2)
+    os.replace(planet.timing_path(params, folder) + ".tmp", planet.timing_path(params, folder))
+    return summary
@@ -0,0 +1,26 @@
+import importlib
+import os
+import sys
+
+import pytest
+
+# The add-on folder is the package whatever it is named, it is imported the way benchmark.py
+# does when run directly. Modules are imported under their real name before dust_speck is
+# aliased to the package, so functions sent to worker processes can be found by name.
+package_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.dirname(package_dir))
+package = importlib.import_module(os.path.basename(package_dir))
+for module in ("cache", "exr", "fractal", "mesh", "noise", "png", "simplex", "stream"):
+    importlib.import_module(package.__name__ + "." + module)
+sys.modules.setdefault("dust_speck", package)
+
+from dust_speck import fractal
+from dust_speck import noise
+
+
+# Tests use the NumPy noise instead of running the backend benchmark
+@pytest.fixture(autouse=True)
+def numpy_noise():
+    noise.use(((3, noise.REFERENCE), (4, noise.REFERENCE)))
+    yield
+    fractal.shutdown_pool()
@@ -0,0 +1,30 @@
+import os
+
+import numpy as np
+
+from dust_speck import cache
+
+
+def test_map_cache_evicts_least_recently_used(tmp_path):
+    arrays = {name: np.full((32, 32), index, dtype=np.float32) for index, name in enumerate("abc")}
+    entry_bytes = arrays["a"].nbytes + 128
+    map_cache = cache.MapCache(str(tmp_path), max_bytes=2 * entry_bytes + 64)
+    map_cache.put("a", arrays["a"])
+    map_cache.put("b", arrays["b"])
+    # Give the entries distinct ages, a hit then makes "a" the most recently used
+    os.utime(map_cache._path("a"), (1000, 1000))
+    os.utime(map_cache._path("b"), (2000, 2000))
+    assert np.array_equal(map_cache.get("a"), arrays["a"])
+
+    map_cache.put("c", arrays["c"])
+    assert map_cache.get("b") is None
+    assert np.array_equal(map_cache.get("a"), arrays["a"])
+    assert np.array_equal(map_cache.get("c"), arrays["c"])
+    assert map_cache.total_bytes() <= map_cache.max_bytes
+
+
+def test_map_cache_skips_arrays_over_the_budget(tmp_path):
+    map_cache = cache.MapCache(str(tmp_path), max_bytes=1024)
+    map_cache.put("large", np.zeros(1024, dtype=np.float32))
+    assert map_cache.get("large") is None
+    assert map_cache.entries() == []
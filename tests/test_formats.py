@@ -0,0 +1,65 @@
+import struct
+import zlib
+
+import numpy as np
+import pytest
+
+from dust_speck import png
+from dust_speck import stream
+
+
+# Minimal reader for the PNGs written by png.py: one IHDR, IDAT chunks, no row filters
+def read_png(path):
+    with open(path, "rb") as f:
+        data = f.read()
+    assert data[:8] == b"\x89PNG\r\n\x1a\n"
+    offset = 8
+    idat = b""
+    while offset < len(data):
+        length, kind = struct.unpack(">I4s", data[offset:offset + 8])
+        body = data[offset + 8:offset + 8 + length]
+        assert struct.unpack(">I", data[offset + 8 + length:offset + 12 + length])[0] == zlib.crc32(kind + body) & 0xFFFFFFFF
+        if kind == b"IHDR":
+            width, height, bit_depth, color_type = struct.unpack(">IIBB", body[:10])
+        elif kind == b"IDAT":
+            idat += body
+        offset += 12 + length
+    channels = {color: channels for channels, color in png.COLOR_TYPES.items()}[color_type]
+    rows = np.frombuffer(zlib.decompress(idat), dtype=np.uint8).reshape(height, -1)
+    assert not rows[:, 0].any()
+    samples = rows[:, 1:].copy().view(">u1" if bit_depth == 8 else ">u2")
+    return samples.reshape(height, width, channels) / float((1 << bit_depth) - 1)
+
+
+@pytest.mark.parametrize("bit_depth", [8, 16])
+@pytest.mark.parametrize("channels", [1, 3, 4])
+def test_png_round_trip(tmp_path, bit_depth, channels):
+    pixels = np.random.default_rng(0).uniform(0.0, 1.0, (17, 33, channels))
+    path = str(tmp_path / "map.png")
+    png.write_png(path, pixels, bit_depth)
+    # write_png takes Blender rows, bottom first
+    decoded = read_png(path)[::-1]
+    assert np.abs(decoded - pixels).max() <= 0.5 / ((1 << bit_depth) - 1) + 1e-12
+
+
+@pytest.mark.parametrize("compression", [0, 6])
+def test_exr_round_trip(tmp_path, compression):
+    OpenEXR = pytest.importorskip("OpenEXR")
+    rng = np.random.default_rng(0)
+    elevation = rng.normal(0.0, 0.5, (19, 31)).astype(np.float32)
+    diffuse = rng.uniform(0.0, 1.0, (19, 31, 3))
+    paths = {kind: stream.write_map(kind, str(tmp_path / (kind + ".exr")), pixels, "exr", compression=compression, strip=8)
+             for kind, pixels in (("elevation", elevation), ("diffuse", diffuse))}
+
+    with OpenEXR.File(paths["elevation"]) as f:
+        assert np.array_equal(f.channels()["Y"].pixels[::-1], elevation)
+    with OpenEXR.File(paths["diffuse"], separate_channels=True) as f:
+        rgb = np.stack([f.channels()[channel].pixels for channel in "RGB"], axis=-1)[::-1]
+    linear = stream.maps.srgb_to_linear(diffuse)
+    np.testing.assert_allclose(rgb, linear, rtol=1e-3, atol=1e-4)
+
+
+def test_raw_round_trip(tmp_path):
+    elevation = np.random.default_rng(0).normal(0.0, 0.5, (19, 31)).astype(np.float32)
+    path = stream.write_map("elevation", str(tmp_path / "elevation.npy"), elevation, "raw", strip=8)
+    assert np.array_equal(np.load(path, mmap_mode="r")[::-1], elevation)
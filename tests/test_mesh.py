@@ -0,0 +1,14 @@
+import numpy as np
+import pytest
+
+from dust_speck import mesh
+
+
+@pytest.mark.parametrize("subdivisions", [1, 2, 5, 16])
+def test_quad_sphere_counts(subdivisions):
+    vertices, quads = mesh.quad_sphere(subdivisions)
+    # Cube faces share their edge and corner vertices
+    assert vertices.shape == (6 * subdivisions**2 + 2, 3)
+    assert quads.shape == (6 * subdivisions**2, 4)
+    assert np.unique(quads).size == len(vertices)
+    np.testing.assert_allclose(np.linalg.norm(vertices, axis=1), 1.0)
@@ -0,0 +1,50 @@
+import numpy as np
+import pytest
+
+from dust_speck import cache
+from dust_speck import fractal
+from dust_speck import simplex
+
+ELEVATION = (3, 4, 1.0, 1.0, 2.0, 0.5)
+HUMIDITY = (5, 3, 1.5, 1.0, 2.0, 0.5)
+CLOUD = (8, 5, 1.0, 0.5, 2.0, 0.6)
+
+
+def test_simplex_matches_opensimplex():
+    opensimplex = pytest.importorskip("opensimplex")
+    rng = np.random.default_rng(0)
+    x, y, z = (rng.uniform(-16.0, 16.0, 500) for _ in range(3))
+    for seed in (0, 7, 12345):
+        reference = opensimplex.OpenSimplex(seed)
+        expected = [reference.noise3(*point) for point in zip(x.tolist(), y.tolist(), z.tolist())]
+        np.testing.assert_allclose(simplex.noise3(x, y, z, *simplex.init_permutation(seed)), expected, rtol=0, atol=1e-12)
+
+
+def test_fused_layers_match_separate_layers():
+    layers = fractal.generate_fractal_layers("layers", 64, [ELEVATION, HUMIDITY, CLOUD])
+    for layer, (seed, *octave_params) in zip(layers, (ELEVATION, HUMIDITY, CLOUD)):
+        assert np.array_equal(layer, fractal.generate_fractal_noise("layer", seed, 64, *octave_params))
+
+
+def test_octave_reuse_matches_direct_evaluation():
+    octave_cache = cache.LayerCache()
+    seed, num_octaves, frequency, amplitude, lacunarity, persistence = ELEVATION
+    for num_octaves, persistence in ((num_octaves, persistence), (num_octaves + 2, persistence), (num_octaves, 0.6)):
+        reused = fractal.generate_fractal_noise_from_octaves("octaves", seed, 64, num_octaves, frequency, amplitude, lacunarity, persistence, octave_cache)
+        assert np.array_equal(reused, fractal.generate_fractal_noise("direct", seed, 64, num_octaves, frequency, amplitude, lacunarity, persistence))
+
+
+def test_worker_count_does_not_change_output(monkeypatch):
+    monkeypatch.setattr(fractal, "PARALLEL_MIN_EVALUATIONS", 0)
+    single = fractal.generate_fractal_layers("single", 64, [ELEVATION, HUMIDITY], workers=1)
+    pooled = fractal.generate_fractal_layers("pooled", 64, [ELEVATION, HUMIDITY], workers=3)
+    assert np.array_equal(single, pooled)
+
+
+# The interpolation error drops 4x each time the size doubles, 1024 is the first size under 3e-3
+def test_cube_map_matches_equirectangular_noise():
+    seed, *octave_params = ELEVATION
+    cube = fractal.generate_cube_noise("cube", seed, fractal.cube_face_size(1024), *octave_params)
+    resampled = fractal.cube_to_equirect(cube, 1024)
+    direct = fractal.generate_fractal_noise("direct", seed, 1024, *octave_params)
+    assert np.abs(resampled - direct).max() < 3e-3